@@ -0,0 +1,95 @@
+"""Compare the audio-link extraction paths in ``goodhtml2audio``.
+
+Builds a synthetic corpus of pages, most of them without audio links (as in
+the crawl), runs the original BeautifulSoup path and the prefiltered
+BeautifulSoup/lxml paths, checks that their outputs agree and reports their
+throughput as JSON.
+
+    uv run python benchmarks/bench_audio_links.py --num_pages 2000
+"""
+
+import json
+import random
+import time
+from argparse import ArgumentParser
+from functools import partial
+
+from ccaudio.extract_url.goodhtml2audio import extract_audio_url_pairs
+
+EXTENSIONS = (".mp3", ".m4a", ".wav", ".html", ".jpg", "/")
+BASE_URL = "https://example.com/blog/entry.html"
+
+
+def make_page(rng: random.Random, audio_ratio: float) -> str:
+    blocks = []
+    for i in range(rng.randint(20, 200)):
+        blocks.append(
+            f"<div class='entry'><h2>見出し{i}</h2><p>本文のテキスト{i}。{'あ' * 80}</p>"
+            f"<a href='/page/{i}.html'>続きを読む</a><img src='/img/{i}.jpg'></div>"
+        )
+    if rng.random() < audio_ratio:
+        for i in range(rng.randint(1, 20)):
+            url = f"https://cdn.example.com/ep{i}{rng.choice(EXTENSIONS)}"
+            if rng.random() < 0.5:
+                link = f"<a href='{url}' title='第{i}回'>ダウンロード</a>"
+            else:
+                link = f"<audio controls><source src='{url}'></audio>"
+            license_attr = " data-license='CC-BY'" if rng.random() < 0.2 else ""
+            blocks.insert(
+                rng.randrange(len(blocks) + 1), f"<p{license_attr}>放送{i} {link}</p>"
+            )
+    return (
+        "<!DOCTYPE html><html><head><title>t</title>"
+        "<script>var x = 1;</script></head><body>"
+        + "\n".join(blocks)
+        + "</body></html>"
+    )
+
+
+def run(pages, extract):
+    start = time.perf_counter()
+    outputs = [extract(html, BASE_URL) for html in pages]
+    seconds = time.perf_counter() - start
+    return outputs, {
+        "seconds": seconds,
+        "pages_per_second": len(pages) / seconds,
+        "mb_per_second": sum(len(html) for html in pages) / seconds / 1e6,
+    }
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument("--num_pages", type=int, default=1000)
+    parser.add_argument(
+        "--audio_ratio", type=float, default=0.05, help="Share of pages with audio"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng = random.Random(args.seed)
+    pages = [make_page(rng, args.audio_ratio) for _ in range(args.num_pages)]
+
+    paths = {
+        "bs4": partial(extract_audio_url_pairs, backend="bs4", prefilter=False),
+        "bs4_prefilter": partial(extract_audio_url_pairs, backend="bs4"),
+        "lxml_prefilter": partial(extract_audio_url_pairs, backend="lxml"),
+    }
+    outputs = {}
+    report = {
+        "num_pages": len(pages),
+        "mb": sum(len(html) for html in pages) / 1e6,
+    }
+    for name, extract in paths.items():
+        outputs[name], report[name] = run(pages, extract)
+
+    reference = outputs["bs4"]
+    report["num_pairs"] = sum(len(pairs) for pairs in reference)
+    for name in paths:
+        report[name]["mismatched_pages"] = sum(
+            a != b for a, b in zip(reference, outputs[name])
+        )
+        report[name]["speedup"] = report["bs4"]["seconds"] / report[name]["seconds"]
+    print(json.dumps(report, indent=2))
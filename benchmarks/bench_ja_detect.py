@@ -0,0 +1,137 @@
+"""Compare Japanese detectors: ``ja_detect`` (str and UTF-8 bytes), the
+regex ratio it replaces in ``html2goodhtml``, and lingua if installed.
+
+The regex ratio is reported at the threshold html2goodhtml applied it with
+(``regex_ratio``) and at ``ja_detect``'s threshold (``regex_ratio_same_threshold``).
+
+Builds labelled documents from Japanese, Chinese, Korean and English
+sentences with some ASCII boilerplate mixed in, and reports accuracy and
+throughput of each detector as JSON.
+
+    uv run python benchmarks/bench_ja_detect.py --num_docs 2000
+"""
+
+import json
+import random
+import re
+import time
+from argparse import ArgumentParser
+
+from ccaudio.extract_url.html2goodhtml import MIN_JA_RATIO as HTML2GOODHTML_RATIO
+from ccaudio.extract_url.ja_detect import MIN_JA_RATIO, is_japanese
+
+SENTENCES = {
+    "ja": [
+        "吾輩は猫である。名前はまだ無い。",
+        "今日は天気が良いので、公園まで散歩に出かけました。",
+        "このポッドキャストでは毎週新しい話題をお届けします。",
+        "詳しくはウェブサイトをご覧ください。",
+        "第十回の放送では、ゲストに山田さんをお迎えしました。",
+    ],
+    "zh": [
+        "我是一只猫。我还没有名字。",
+        "今天天气很好，我们去公园散步吧。",
+        "本节目每周为您带来新的话题。",
+        "详情请访问我们的网站。",
+    ],
+    "ko": [
+        "나는 고양이로소이다. 이름은 아직 없다.",
+        "오늘은 날씨가 좋아서 공원에 산책하러 갔습니다.",
+        "이 팟캐스트는 매주 새로운 주제를 전해 드립니다.",
+    ],
+    "en": [
+        "I am a cat. As yet I have no name.",
+        "The weather is nice today, so we went for a walk in the park.",
+        "This podcast brings you a new topic every week.",
+        "Please visit our website for details.",
+    ],
+}
+BOILERPLATE = ["Home", "Menu", "Copyright 2025", "Privacy Policy", "Login", "RSS"]
+JAPANESE_CHAR_REGEX = re.compile(r"[぀-ヿ㐀-䶿一-鿿]")
+WHITESPACE_REGEX = re.compile(r"\s")
+
+
+def make_doc(rng: random.Random, language: str) -> str:
+    parts = [rng.choice(SENTENCES[language]) for _ in range(rng.randint(1, 60))]
+    for _ in range(rng.randint(0, len(parts) // 3 + 1)):
+        parts.insert(rng.randrange(len(parts) + 1), rng.choice(BOILERPLATE))
+    return " ".join(parts)
+
+
+def regex_is_japanese(text: str, min_ratio: float = HTML2GOODHTML_RATIO) -> bool:
+    num_chars = len(text) - len(WHITESPACE_REGEX.findall(text))
+    if num_chars == 0:
+        return False
+    return len(JAPANESE_CHAR_REGEX.findall(text)) / num_chars >= min_ratio
+
+
+def load_lingua():
+    try:
+        from lingua import Language, LanguageDetectorBuilder
+    except ImportError:
+        return None, 0.0
+    start = time.perf_counter()
+    detector = LanguageDetectorBuilder.from_all_spoken_languages().build()
+    build_seconds = time.perf_counter() - start
+
+    def lingua_is_japanese(text: str) -> bool:
+        return detector.detect_language_of(text) == Language.JAPANESE
+
+    return lingua_is_japanese, build_seconds
+
+
+def run(docs, labels, detect):
+    start = time.perf_counter()
+    predictions = [detect(doc) for doc in docs]
+    seconds = time.perf_counter() - start
+    true_positives = sum(p and y for p, y in zip(predictions, labels))
+    return {
+        "seconds": seconds,
+        "docs_per_second": len(docs) / seconds,
+        "accuracy": sum(p == y for p, y in zip(predictions, labels)) / len(docs),
+        "precision": true_positives / max(1, sum(predictions)),
+        "recall": true_positives / max(1, sum(labels)),
+    }
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument("--num_docs", type=int, default=1000)
+    parser.add_argument(
+        "--ja_ratio", type=float, default=0.5, help="Share of Japanese documents"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng = random.Random(args.seed)
+    others = [language for language in SENTENCES if language != "ja"]
+    languages = [
+        "ja" if rng.random() < args.ja_ratio else rng.choice(others)
+        for _ in range(args.num_docs)
+    ]
+    docs = [make_doc(rng, language) for language in languages]
+    labels = [language == "ja" for language in languages]
+    encoded = [doc.encode("utf-8") for doc in docs]
+
+    report = {"num_docs": len(docs), "mb": sum(len(doc) for doc in encoded) / 1e6}
+    report["ja_detect"] = run(docs, labels, is_japanese)
+    report["ja_detect_bytes"] = run(encoded, labels, is_japanese)
+    report["regex_ratio"] = run(docs, labels, regex_is_japanese)
+    report["regex_ratio"]["min_ratio"] = HTML2GOODHTML_RATIO
+    report["regex_ratio_same_threshold"] = run(
+        docs, labels, lambda doc: regex_is_japanese(doc, MIN_JA_RATIO)
+    )
+    report["regex_ratio_same_threshold"]["min_ratio"] = MIN_JA_RATIO
+    lingua_is_japanese, build_seconds = load_lingua()
+    if lingua_is_japanese is None:
+        report["lingua"] = "not installed"
+    else:
+        report["lingua"] = run(docs, labels, lingua_is_japanese)
+        report["lingua"]["build_seconds"] = build_seconds
+        report["ja_detect"]["speedup_vs_lingua"] = (
+            report["lingua"]["seconds"] / report["ja_detect"]["seconds"]
+        )
+    print(json.dumps(report, indent=2))
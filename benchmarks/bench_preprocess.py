@@ -0,0 +1,184 @@
+"""Benchmark ``ccaudio.preprocess`` on synthetic shar fixtures.
+
+Generates a grid of tone / noise / speech-like / mixed recordings across sample
+rates, channel counts and durations, then times ``convert_audio``,
+``separate`` and the full ``main`` on them. Every stage runs in a fresh
+process so that the reported peak RSS belongs to that stage alone.
+
+    uv run python benchmarks/bench_preprocess.py --output bench_preprocess.json
+"""
+
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+from multiprocessing import get_context
+from pathlib import Path
+
+from lhotse import CutSet
+
+from ccaudio.synthetic import SIGNAL_KINDS, SyntheticSpec, write_synthetic_shar
+
+STAGES = ("convert", "separate", "main")
+
+
+def load_cuts(shar_dir: Path) -> CutSet:
+    cut_paths = sorted(list(map(str, shar_dir.glob("cuts.*.jsonl.gz"))))
+    recording_paths = sorted(list(map(str, shar_dir.glob("recording.*.tar"))))
+    return CutSet.from_shar({"cuts": cut_paths, "recording": recording_paths})
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def run_stage(stage: str, shar_dir: Path, output_dir: Path, sr: int) -> dict:
+    """Run a single stage in the current (fresh) process and measure it"""
+    from demucs.api import Separator
+
+    from ccaudio.preprocess import convert_audio, main, separate
+
+    items = []
+    audio_seconds = 0.0
+    setup_start = time.perf_counter()
+    separator = Separator() if stage == "separate" else None
+    setup_seconds = time.perf_counter() - setup_start
+
+    start = time.perf_counter()
+    if stage == "main":
+        audio_seconds = sum(cut.duration for cut in load_cuts(shar_dir).data)
+        main(shar_dir, output_dir, sr)
+    else:
+        for cut in load_cuts(shar_dir).data:
+            item_start = time.perf_counter()
+            if stage == "convert":
+                converted = convert_audio(cut, sr)
+                # Resampling is lazy in lhotse; force the actual work
+                converted.load_audio()
+            else:
+                assert separator is not None
+                converted = convert_audio(cut, separator.samplerate)
+                separate(converted, separator).load_audio()
+            seconds = time.perf_counter() - item_start
+            audio_seconds += cut.duration
+            items.append(
+                {
+                    "id": cut.id,
+                    "spec": cut.custom.get("synthetic"),
+                    "audio_seconds": cut.duration,
+                    "wall_seconds": seconds,
+                    "rtf": seconds / cut.duration,
+                }
+            )
+    wall_seconds = time.perf_counter() - start
+
+    return {
+        "setup_seconds": setup_seconds,
+        "wall_seconds": wall_seconds,
+        "audio_seconds": audio_seconds,
+        "rtf": wall_seconds / audio_seconds if audio_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "items": items,
+    }
+
+
+def environment_info() -> dict:
+    info = {"python": platform.python_version(), "platform": platform.platform()}
+    for package in ("ccaudio", "lhotse", "torch", "demucs"):
+        try:
+            info[package] = version(package)
+        except PackageNotFoundError:
+            info[package] = None
+    try:
+        info["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info["git_commit"] = None
+    return info
+
+
+def build_specs(args) -> list[SyntheticSpec]:
+    return [
+        SyntheticSpec(kind, sampling_rate, num_channels, duration)
+        for kind in args.kinds
+        for sampling_rate in args.sample_rates
+        for num_channels in args.channels
+        for duration in args.durations
+    ]
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument("--kinds", nargs="+", default=list(SIGNAL_KINDS))
+    parser.add_argument("--sample_rates", nargs="+", type=int, default=[16000, 44100])
+    parser.add_argument("--channels", nargs="+", type=int, default=[1, 2])
+    parser.add_argument("--durations", nargs="+", type=float, default=[5.0, 30.0])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--sr", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--work_dir",
+        type=str,
+        default=None,
+        help="Directory for fixtures and outputs (a temporary one by default)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the JSON report here instead of stdout",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(args.work_dir or tmp_dir)
+        shar_dir = work_dir / "shar"
+
+        fixture_start = time.perf_counter()
+        specs = write_synthetic_shar(shar_dir, build_specs(args), seed=args.seed)
+        fixture_seconds = time.perf_counter() - fixture_start
+
+        report = {
+            "environment": environment_info(),
+            "fixtures": {
+                "num_cuts": len(specs),
+                "audio_seconds": sum(spec.duration for spec in specs),
+                "generation_seconds": fixture_seconds,
+                "seed": args.seed,
+            },
+            "stages": {},
+        }
+        for stage in args.stages:
+            # spawn: a forked child would inherit the parent's peak RSS
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=get_context("spawn")
+            ) as executor:
+                future = executor.submit(
+                    run_stage, stage, shar_dir, work_dir / f"output_{stage}", args.sr
+                )
+                report["stages"][stage] = future.result()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,116 @@
+"""Compare the iterparse and BeautifulSoup feed parsers in ``rss2audio``.
+
+Builds a synthetic corpus of podcast feeds (namespaces, CDATA descriptions,
+``media:content`` fallbacks, items without audio) plus non-feed payloads,
+checks that both parsers agree and reports their throughput as JSON.
+
+    uv run python benchmarks/bench_rss.py --num_feeds 500
+"""
+
+import json
+import random
+import time
+from argparse import ArgumentParser
+
+from warcio.statusandheaders import StatusAndHeaders
+
+from ccaudio.extract_url.rss2audio import (
+    FEED_SNIFF_BYTES,
+    extract_audio_urls_from_rss,
+    extract_audio_urls_from_rss_soup,
+    is_rss_feed,
+)
+
+EXTENSIONS = ("mp3", "m4a", "aac", "wav", "ogg", "flac", "mp4", "html")
+
+
+def make_feed(rng: random.Random, num_items: int) -> bytes:
+    items = []
+    for i in range(num_items):
+        ext = rng.choice(EXTENSIONS)
+        url = f"https://cdn{rng.randint(0, 9)}.example.com/ep{i}.{ext}"
+        if rng.random() < 0.7:
+            audio = f'<enclosure url="{url}" length="123" type="audio/mpeg"/>'
+        else:
+            audio = f'<media:content url="{url}" medium="audio"/>'
+        items.append(
+            "<item>"
+            f"<title>第{i}回 ポッドキャスト &amp; talk</title>"
+            f"<itunes:title>Episode {i}</itunes:title>"
+            f"<description><![CDATA[<p>エピソード {i} の説明</p>{'x' * 400}]]>"
+            "</description>"
+            f"{audio}"
+            f"<guid>{url}#{i}</guid>"
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"'
+        ' xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+        f"<title>Feed</title><language>{rng.choice(['ja', 'en', 'ja-JP'])}</language>"
+        + "".join(items)
+        + "</channel></rss>"
+    ).encode()
+
+
+def make_corpus(num_feeds: int, max_items: int, seed: int) -> list[tuple]:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(num_feeds):
+        headers = StatusAndHeaders(
+            "200 OK",
+            [("Content-Type", rng.choice(["application/rss+xml", "text/plain"]))],
+        )
+        corpus.append((headers, make_feed(rng, rng.randint(1, max_items))))
+        # Non-feed records that the header check or the sniff should reject
+        html = StatusAndHeaders("200 OK", [("Content-Type", "text/html")])
+        corpus.append((html, b"<!doctype html><html><body>" + b"x" * 20000))
+        image = StatusAndHeaders("200 OK", [("Content-Type", "image/jpeg")])
+        corpus.append((image, b"\xff\xd8" + b"\0" * 50000))
+    return corpus
+
+
+def run(corpus, parse, sniff):
+    start = time.perf_counter()
+    outputs = []
+    num_bytes = 0
+    for headers, payload in corpus:
+        head = payload[:FEED_SNIFF_BYTES] if sniff else payload
+        if not is_rss_feed(headers, head):
+            outputs.append(None)
+            continue
+        num_bytes += len(payload)
+        outputs.append(parse(payload))
+    seconds = time.perf_counter() - start
+    return outputs, {
+        "seconds": seconds,
+        "records_per_second": len(corpus) / seconds,
+        "parsed_mb_per_second": num_bytes / seconds / 1e6,
+    }
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument("--num_feeds", type=int, default=300)
+    parser.add_argument("--max_items", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    corpus = make_corpus(args.num_feeds, args.max_items, args.seed)
+
+    soup_outputs, soup_stats = run(corpus, extract_audio_urls_from_rss_soup, False)
+    fast_outputs, fast_stats = run(corpus, extract_audio_urls_from_rss, True)
+
+    mismatches = sum(a != b for a, b in zip(soup_outputs, fast_outputs))
+    report = {
+        "num_records": len(corpus),
+        "num_entries": sum(len(o) for o in fast_outputs if o),
+        "mismatched_records": mismatches,
+        "beautifulsoup": soup_stats,
+        "iterparse": fast_stats,
+        "speedup": soup_stats["seconds"] / fast_stats["seconds"],
+    }
+    print(json.dumps(report, indent=2))
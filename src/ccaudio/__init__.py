@@ -0,0 +1,5 @@
+def main() -> None:
+    # Subcommands import pyarrow etc.; keep `import ccaudio` itself light
+    from ccaudio.cli import main as cli_main
+
+    cli_main()
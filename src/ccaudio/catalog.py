@@ -0,0 +1,202 @@
+"""Parquet catalog of the cuts in one or more shar directories.
+
+One row per cut with its id, shard, duration, sampling rate, channels and
+the ``custom`` fields written by the crawler, so questions such as "hours of
+ja audio per host" become columnar queries instead of a pass over every
+``cuts.*.jsonl.gz``. Rows are keyed by the absolute path of their shar
+directory and the shard. The catalog remembers the size and mtime of each cuts
+file and only parses shards that are new or changed; a shard that cannot be
+read yet (e.g. still being written by the crawler) is skipped and picked up
+by the next update.
+
+    uv run ccaudio catalog ccaudio_raw --catalog data/catalog.parquet
+    uv run ccaudio stats data/catalog.parquet
+"""
+
+import gzip
+import json
+import os
+import zlib
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from loguru import logger
+from tqdm import tqdm
+
+CUSTOM_FIELDS = ("audio_url", "page_url", "title", "description", "language")
+CATALOG_SCHEMA = pa.schema(
+    [
+        ("shar_dir", pa.string()),
+        ("shard", pa.string()),
+        ("cut_id", pa.string()),
+        ("duration", pa.float64()),
+        ("sampling_rate", pa.int32()),
+        ("num_channels", pa.int16()),
+        *[(name, pa.string()) for name in CUSTOM_FIELDS],
+        ("host", pa.string()),
+        # Remaining custom fields as JSON
+        ("custom", pa.string()),
+        # Identify the version of the cuts file a row was read from
+        ("cuts_size", pa.int64()),
+        ("cuts_mtime", pa.float64()),
+    ]
+)
+
+
+class Shard:
+    def __init__(self, shar_dir: str, path: Path):
+        self.shar_dir = shar_dir
+        self.path = path
+        self.name = path.name.split(".")[1]
+        stat = path.stat()
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+    @property
+    def key(self) -> str:
+        return f"{self.shar_dir}/{self.name}"
+
+
+def list_shards(shar_dirs: list[str]) -> list[Shard]:
+    shards = []
+    for shar_dir in shar_dirs:
+        # 同じディレクトリを別の書き方で指定しても同じ行になるよう絶対パスにする
+        shar_dir = os.path.abspath(shar_dir)
+        for path in sorted(Path(shar_dir).glob("cuts.*.jsonl.gz")):
+            shards.append(Shard(shar_dir, path))
+    return shards
+
+
+def cut_row(cut: dict) -> dict:
+    custom = dict(cut.get("custom") or {})
+    # Added by CutSet.from_shar when cuts are re-saved
+    custom.pop("shard_origin", None)
+    custom.pop("shar_epoch", None)
+    channel = cut.get("channel", 0)
+    row = {
+        "cut_id": cut["id"],
+        "duration": cut["duration"],
+        "sampling_rate": (cut.get("recording") or {}).get("sampling_rate"),
+        "num_channels": len(channel) if isinstance(channel, list) else 1,
+    }
+    for name in CUSTOM_FIELDS:
+        value = custom.pop(name, None)
+        row[name] = value if value is None else str(value)
+    row["host"] = urlparse(row["audio_url"]).hostname if row["audio_url"] else None
+    row["custom"] = json.dumps(custom, ensure_ascii=False) if custom else None
+    return row
+
+
+def read_shard(shard: Shard) -> pa.Table:
+    """Catalog rows of one shard; raises if the cuts file is incomplete"""
+    rows = []
+    with gzip.open(shard.path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(cut_row(json.loads(line)))
+    for row in rows:
+        row["shar_dir"] = shard.shar_dir
+        row["shard"] = shard.name
+        row["cuts_size"] = shard.size
+        row["cuts_mtime"] = shard.mtime
+    return pa.Table.from_pylist(rows, schema=CATALOG_SCHEMA)
+
+
+def shard_keys(table: pa.Table) -> pa.Array:
+    return pc.binary_join_element_wise(table["shar_dir"], table["shard"], "/")
+
+
+def update_catalog(
+    shar_dirs: list[str], catalog_path: str, num_workers: Optional[int] = None
+) -> dict:
+    """Bring ``catalog_path`` up to date with the cuts files of ``shar_dirs``"""
+    shards = list_shards(shar_dirs)
+    catalog = None
+    known = {}
+    if os.path.exists(catalog_path):
+        catalog = pq.read_table(catalog_path, schema=CATALOG_SCHEMA)
+        versions = (
+            catalog.select(["shar_dir", "shard", "cuts_size", "cuts_mtime"])
+            .group_by(["shar_dir", "shard", "cuts_size", "cuts_mtime"])
+            .aggregate([])
+        )
+        for row in versions.to_pylist():
+            known[f"{row['shar_dir']}/{row['shard']}"] = (
+                row["cuts_size"],
+                row["cuts_mtime"],
+            )
+
+    todo = [s for s in shards if known.get(s.key) != (s.size, s.mtime)]
+    # 指定されたディレクトリから消えたシャードの行は削除し、他のディレクトリの行は残す
+    current = {s.key for s in shards}
+    dirs = {os.path.abspath(d) for d in shar_dirs}
+    removed = {k for k in known if os.path.dirname(k) in dirs and k not in current}
+    stale = {s.key for s in todo} | removed
+    stats = {"shards": len(shards), "updated": 0, "skipped": 0, "removed": len(removed)}
+    if not stale:
+        logger.info(f"{catalog_path} is up to date")
+        return stats
+
+    tables = []
+    if catalog is not None:
+        keep = pc.invert(pc.is_in(shard_keys(catalog), pa.array(sorted(stale))))
+        tables.append(catalog.filter(keep))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(read_shard, shard): shard for shard in todo}
+        for future in tqdm(as_completed(futures), total=len(futures), unit="shard"):
+            shard = futures[future]
+            try:
+                tables.append(future.result())
+            except (OSError, EOFError, zlib.error, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable shard {shard.path}: {e!r}")
+                stats["skipped"] += 1
+                continue
+            stats["updated"] += 1
+
+    # Every shard may still be unreadable on the first update
+    table = pa.concat_tables(tables) if tables else CATALOG_SCHEMA.empty_table()
+    table = table.sort_by([("shar_dir", "ascending"), ("shard", "ascending")])
+    os.makedirs(os.path.dirname(os.path.abspath(catalog_path)), exist_ok=True)
+    tmp_path = f"{catalog_path}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, catalog_path)
+    stats["cuts"] = table.num_rows
+    logger.info(f"Updated {catalog_path}: {stats}")
+    return stats
+
+
+def add_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "shar_dirs",
+        type=str,
+        nargs="+",
+        help="Shar directories written by the crawler",
+    )
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        default="data/catalog.parquet",
+        help="Parquet file created or updated in place",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help="Number of shards parsed in parallel",
+    )
+
+
+def run(args) -> None:
+    update_catalog(args.shar_dirs, args.catalog, args.num_workers)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_arguments(parser)
+    run(parser.parse_args())
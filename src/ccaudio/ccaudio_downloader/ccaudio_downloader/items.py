@@ -16,6 +16,7 @@ class AudioItem(scrapy.Item):
     language = scrapy.Field()  # Language code
     audio_data = scrapy.Field()  # Raw audio bytes
     content_type = scrapy.Field()  # HTTP content-type header
+    content_length = scrapy.Field()  # HTTP content-length header, None if absent
 
     def __repr__(self):
         """Custom representation that excludes audio_data from logs"""
@@ -1,8 +1,11 @@
+import hashlib
 import io
+import json
 import logging
 import os
 import tempfile
 from pathlib import Path
+from typing import Optional
 from urllib.parse import urlparse
 
 import soundfile as sf
@@ -10,6 +13,10 @@ from itemadapter import ItemAdapter
 from lhotse import MonoCut, MultiCut, Recording
 from lhotse.shar import SharWriter
 from pydub import AudioSegment
+from scrapy.exceptions import DropItem
+
+from . import validation
+from .validation import AudioValidator
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +28,17 @@ class LhotseSharPipeline:
         self,
         output_dir: str = "output",
         shard_size: int = 5000,
+        validator: Optional[AudioValidator] = None,
+        quarantine_dir: Optional[str] = None,
+        stats=None,
     ):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.shard_size = shard_size
+        self.validator = validator or AudioValidator()
+        # Rejected downloads are kept here for inspection when set
+        self.quarantine_dir = Path(quarantine_dir) if quarantine_dir else None
+        self.stats = stats
         self.writer = None
         self.cuts = []
         self.item_count = 0
@@ -34,7 +48,13 @@ class LhotseSharPipeline:
         """Create pipeline from crawler settings"""
         output_dir = crawler.settings.get("SHAR_OUTPUT_DIR", "output")
         shard_size = crawler.settings.getint("SHAR_SHARD_SIZE", 5000)
-        return cls(output_dir=output_dir, shard_size=shard_size)
+        return cls(
+            output_dir=output_dir,
+            shard_size=shard_size,
+            validator=AudioValidator.from_settings(crawler.settings),
+            quarantine_dir=crawler.settings.get("AUDIO_QUARANTINE_DIR"),
+            stats=crawler.stats,
+        )
 
     def open_spider(self, spider):
         """Initialize shar writer when spider opens"""
@@ -54,6 +74,38 @@ class LhotseSharPipeline:
             self.writer.close()
             logger.info(f"Closed SharWriter. Total items processed: {self.item_count}")
 
+    def _reject(
+        self,
+        adapter: ItemAdapter,
+        reason: str,
+        audio_format: str,
+        details: Optional[dict] = None,
+    ) -> None:
+        """Count a rejected item and write its data to the quarantine directory"""
+        audio_url = adapter.get("audio_url", "")
+        logger.warning(f"Rejected audio ({reason}): {audio_url}")
+        if self.stats is not None:
+            self.stats.inc_value(f"ccaudio/rejected/{reason}")
+        if self.quarantine_dir is None:
+            return
+
+        reason_dir = self.quarantine_dir / reason
+        reason_dir.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha1(audio_url.encode("utf-8")).hexdigest()
+        audio_data = adapter.get("audio_data")
+        if audio_data:
+            (reason_dir / f"{name}.{audio_format}").write_bytes(audio_data)
+        metadata = {
+            key: adapter.get(key)
+            for key in ("audio_url", "page_url", "title", "content_type")
+        }
+        metadata["content_length"] = adapter.get("content_length")
+        metadata["received_bytes"] = len(audio_data) if audio_data else 0
+        metadata["reason"] = reason
+        metadata.update(details or {})
+        with open(reason_dir / f"{name}.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+
     def _get_audio_format(self, item: dict) -> str:
         """Determine audio format from content type or URL"""
         content_type = item.get("content_type", "")
@@ -103,50 +155,90 @@ class LhotseSharPipeline:
             logger.error(f"Failed to convert audio from {input_format} to WAV: {e}")
             raise
 
-    def process_item(self, item, spider):
-        """Process audio item and save to Lhotse shar format"""
-        adapter = ItemAdapter(item)
+    def _load_recording(self, audio_data: bytes, audio_format: str):
+        """Read audio through a temporary file; returns the file and its recording.
 
-        audio_data = adapter.get("audio_data")
-        if not audio_data:
-            logger.warning("No audio data in item, skipping")
-            return item
+        Formats soundfile cannot read are converted to WAV first. The caller
+        removes the file; it is already removed if reading fails.
+        """
+        # Save audio to temporary file
+        with tempfile.NamedTemporaryFile(
+            suffix=f".{audio_format}", delete=False
+        ) as tmp_file:
+            tmp_file.write(audio_data)
+            tmp_path = tmp_file.name
 
         try:
-            # Determine audio format
-            audio_format = self._get_audio_format(dict(item))
-
-            # Save audio to temporary file
-            with tempfile.NamedTemporaryFile(
-                suffix=f".{audio_format}", delete=False
-            ) as tmp_file:
-                tmp_file.write(audio_data)
-                tmp_path = tmp_file.name
-
             try:
                 # Try to read with soundfile
-                info = sf.info(tmp_path)
-                recording = Recording.from_file(tmp_path)
+                sf.info(tmp_path)
+                return tmp_path, Recording.from_file(tmp_path)
             except Exception as e:
                 # If soundfile fails, convert to WAV
                 logger.warning(
                     f"Failed to read {audio_format} with soundfile, converting to WAV: {e}"
                 )
 
-                # Convert to WAV
-                wav_data = self._convert_to_wav(audio_data, audio_format)
+            # Convert to WAV
+            wav_data = self._convert_to_wav(audio_data, audio_format)
+
+            # Save WAV to new temp file
+            os.unlink(tmp_path)
+            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
+                tmp_file.write(wav_data)
+                tmp_path = tmp_file.name
 
-                # Save WAV to new temp file
+            # Read the WAV file
+            sf.info(tmp_path)
+            return tmp_path, Recording.from_file(tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
                 os.unlink(tmp_path)
-                with tempfile.NamedTemporaryFile(
-                    suffix=".wav", delete=False
-                ) as tmp_file:
-                    tmp_file.write(wav_data)
-                    tmp_path = tmp_file.name
+            raise
 
-                # Read the WAV file
-                info = sf.info(tmp_path)
-                recording = Recording.from_file(tmp_path)
+    def process_item(self, item, spider):
+        """Process audio item and save to Lhotse shar format"""
+        adapter = ItemAdapter(item)
+
+        audio_data = adapter.get("audio_data")
+        # Determine audio format
+        audio_format = self._get_audio_format(dict(item))
+        reason = self.validator.check_size(
+            len(audio_data) if audio_data else 0, adapter.get("content_length")
+        )
+        if reason:
+            self._reject(adapter, reason, audio_format)
+            raise DropItem(f"Rejected audio ({reason}): {adapter.get('audio_url')}")
+
+        try:
+            tmp_path, recording = self._load_recording(audio_data, audio_format)
+        except Exception as e:
+            logger.error(f"Failed to decode audio item: {e}")
+            self._reject(
+                adapter, validation.UNDECODABLE, audio_format, {"error": repr(e)}
+            )
+            raise DropItem(
+                f"Rejected audio ({validation.UNDECODABLE}): {adapter.get('audio_url')}"
+            ) from e
+
+        # 書き込みの失敗は不正な音声ではないので、隔離せずにそのまま送出する
+        try:
+            # 長さの判定はヘッダだけで済むので、信号の統計より先に行う
+            details = {"duration": recording.duration}
+            reason = self.validator.check_duration(recording.duration)
+            if reason is None and self.validator.checks_signal:
+                try:
+                    signal_stats = validation.signal_stats(tmp_path)
+                except Exception as e:
+                    # The header was readable but the body is not
+                    reason = validation.UNDECODABLE
+                    details["error"] = repr(e)
+                else:
+                    details.update(signal_stats._asdict())
+                    reason = self.validator.check_signal(signal_stats)
+            if reason:
+                self._reject(adapter, reason, audio_format, details)
+                raise DropItem(f"Rejected audio ({reason}): {adapter.get('audio_url')}")
 
             # Create a unique ID for this recording
             recording_id = f"audio_{self.item_count:08d}"
@@ -189,17 +281,14 @@ class LhotseSharPipeline:
             self.writer.write(cut)
 
             self.item_count += 1
+            if self.stats is not None:
+                self.stats.inc_value("ccaudio/saved")
 
             logger.info(
                 f"Saved audio {self.item_count}: {adapter.get('title', '')[:50]}..."
             )
-
+        finally:
             # Clean up temp file
             os.unlink(tmp_path)
 
-        except Exception as e:
-            logger.error(f"Failed to process audio item: {e}")
-            if "tmp_path" in locals() and os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-
         return item
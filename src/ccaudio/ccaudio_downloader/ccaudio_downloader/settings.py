@@ -27,6 +27,19 @@ LANGUAGE_ITEMS = ["ja", "ja_JP", "ja-jp", "ja-JP"]
 SHAR_OUTPUT_DIR = "ccaudio_raw"
 SHAR_SHARD_SIZE = 100
 
+# Audio validation before writing to shar
+# Items failing a check are dropped and counted as ccaudio/rejected/<reason>
+# in the crawl stats. Set a check to None (or -s AUDIO_...=None on the command
+# line) to disable it.
+AUDIO_MIN_DURATION = 1.0
+AUDIO_MAX_DURATION = 3 * 3600.0
+# RMS level in dBFS below which a file is treated as silent
+AUDIO_MIN_RMS_DB = -60.0
+# Fraction of samples at full scale above which a file is treated as clipped
+AUDIO_MAX_CLIPPING_RATIO = 0.01
+# Keep rejected downloads under <dir>/<reason>/ for inspection (None: discard)
+AUDIO_QUARANTINE_DIR = None
+
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 # USER_AGENT = "ccaudio_downloader (+http://www.yourdomain.com)"
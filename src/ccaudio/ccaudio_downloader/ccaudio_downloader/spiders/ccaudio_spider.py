@@ -68,6 +68,11 @@ class CcaudioSpiderSpider(scrapy.Spider):
         item["content_type"] = response.headers.get("Content-Type", b"").decode(
             "utf-8", errors="ignore"
         )
+        # Compared with the received bytes to detect truncated downloads
+        content_length = response.headers.get("Content-Length")
+        item["content_length"] = (
+            int(content_length) if content_length and content_length.isdigit() else None
+        )
 
         logger.info(
             f"Downloaded audio {meta.get('index')}: {meta.get('title')[:50]}..."
@@ -0,0 +1,128 @@
+"""Sanity checks applied to downloaded audio before it is written to shar.
+
+Empty and truncated downloads are caught from the byte counts alone, too short
+or too long recordings from the header, and near-silent or clipped ones from
+level statistics. The statistics are computed block by block on the signal
+subsampled to about ``STATS_SAMPLING_RATE``, so multi-hour files are never
+held in memory in full.
+"""
+
+from typing import NamedTuple, Optional
+
+import numpy as np
+import soundfile as sf
+
+STATS_SAMPLING_RATE = 8000
+BLOCK_SECONDS = 60
+# |x| at or above this is counted as clipped
+CLIP_LEVEL = 0.999
+
+# Rejection reasons, also used as stats keys and quarantine subdirectories
+EMPTY = "empty"
+TRUNCATED = "truncated"
+UNDECODABLE = "undecodable"
+TOO_SHORT = "too_short"
+TOO_LONG = "too_long"
+SILENT = "silent"
+CLIPPED = "clipped"
+
+
+class SignalStats(NamedTuple):
+    rms_db: float
+    peak_db: float
+    clipping_ratio: float
+
+
+def to_db(value: float) -> float:
+    return float(20 * np.log10(max(value, 1e-10)))
+
+
+def signal_stats(path: str) -> SignalStats:
+    """Level statistics over all channels of an audio file soundfile can read"""
+    sampling_rate = sf.info(path).samplerate
+    step = max(1, sampling_rate // STATS_SAMPLING_RATE)
+    # A multiple of step keeps the subsampling grid aligned across blocks
+    blocksize = step * STATS_SAMPLING_RATE * BLOCK_SECONDS
+    sum_squares = 0.0
+    num_samples = 0
+    num_clipped = 0
+    peak = 0.0
+    for block in sf.blocks(path, blocksize=blocksize, dtype="float32", always_2d=True):
+        samples = np.abs(block[::step])
+        if samples.size == 0:
+            continue
+        sum_squares += float(np.square(samples, dtype=np.float64).sum())
+        num_samples += samples.size
+        num_clipped += int(np.count_nonzero(samples >= CLIP_LEVEL))
+        peak = max(peak, float(samples.max()))
+    if num_samples == 0:
+        return SignalStats(to_db(0.0), to_db(0.0), 0.0)
+    return SignalStats(
+        rms_db=to_db(np.sqrt(sum_squares / num_samples)),
+        peak_db=to_db(peak),
+        clipping_ratio=num_clipped / num_samples,
+    )
+
+
+class AudioValidator:
+    """Decide whether a downloaded item should be kept; each check returns the
+    rejection reason or None"""
+
+    def __init__(
+        self,
+        min_duration: Optional[float] = 1.0,
+        max_duration: Optional[float] = 3 * 3600.0,
+        min_rms_db: Optional[float] = -60.0,
+        max_clipping_ratio: Optional[float] = 0.01,
+    ):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.min_rms_db = min_rms_db
+        self.max_clipping_ratio = max_clipping_ratio
+
+    @classmethod
+    def from_settings(cls, settings) -> "AudioValidator":
+        def get_float(name: str, default: Optional[float]) -> Optional[float]:
+            value = settings.get(name, default)
+            # -s NAME=None on the command line arrives as a string
+            if value is None or str(value).strip().lower() in ("", "none"):
+                return None
+            return float(value)
+
+        return cls(
+            min_duration=get_float("AUDIO_MIN_DURATION", 1.0),
+            max_duration=get_float("AUDIO_MAX_DURATION", 3 * 3600.0),
+            min_rms_db=get_float("AUDIO_MIN_RMS_DB", -60.0),
+            max_clipping_ratio=get_float("AUDIO_MAX_CLIPPING_RATIO", 0.01),
+        )
+
+    def check_size(
+        self, num_bytes: int, content_length: Optional[int]
+    ) -> Optional[str]:
+        if num_bytes == 0:
+            return EMPTY
+        # Decompressed bodies are longer than Content-Length, never shorter
+        if content_length is not None and num_bytes < content_length:
+            return TRUNCATED
+        return None
+
+    def check_duration(self, duration: float) -> Optional[str]:
+        if self.min_duration is not None and duration < self.min_duration:
+            return TOO_SHORT
+        if self.max_duration is not None and duration > self.max_duration:
+            return TOO_LONG
+        return None
+
+    def check_signal(self, stats: SignalStats) -> Optional[str]:
+        if self.min_rms_db is not None and stats.rms_db < self.min_rms_db:
+            return SILENT
+        if (
+            self.max_clipping_ratio is not None
+            and stats.clipping_ratio > self.max_clipping_ratio
+        ):
+            return CLIPPED
+        return None
+
+    @property
+    def checks_signal(self) -> bool:
+        return self.min_rms_db is not None or self.max_clipping_ratio is not None
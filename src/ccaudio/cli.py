@@ -0,0 +1,30 @@
+from argparse import ArgumentParser
+
+from ccaudio import catalog, reshard
+from ccaudio.extract_url import stats
+
+
+def main(argv=None) -> None:
+    parser = ArgumentParser(prog="ccaudio")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="Domain, language, quality and duration statistics of parquet"
+    )
+    stats.add_arguments(stats_parser)
+    stats_parser.set_defaults(func=stats.run)
+
+    catalog_parser = subparsers.add_parser(
+        "catalog", help="Create or update the parquet catalog of shar cuts"
+    )
+    catalog.add_arguments(catalog_parser)
+    catalog_parser.set_defaults(func=catalog.run)
+
+    reshard_parser = subparsers.add_parser(
+        "reshard", help="Rewrite shar directories into shards of a target size"
+    )
+    reshard.add_arguments(reshard_parser)
+    reshard_parser.set_defaults(func=reshard.run)
+
+    args = parser.parse_args(argv)
+    args.func(args)
@@ -2,17 +2,72 @@ import json
 import os
 import zlib
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from urllib.parse import urljoin
+from typing import Iterator, Optional
+from urllib.parse import urljoin, urlparse
 
 import requests
 from loguru import logger
 
+from ccaudio.extract_url.fetch import TIMEOUT, get_session
 
-def get_common_crawl_snapshot_index(index_prefix):
+CHUNK_SIZE = 1 << 20
+
+
+def cached_fetch(url: str, cache_dir: str) -> str:
+    """Download ``url`` into ``cache_dir`` and return the local path.
+
+    A cached copy is revalidated with ``If-None-Match``/``If-Modified-Since``
+    and only re-downloaded when the server reports a change. If the server is
+    unreachable, the cached copy is used as is.
+    """
+    parsed = urlparse(url)
+    cache_path = os.path.join(cache_dir, parsed.netloc, parsed.path.lstrip("/"))
+    meta_path = cache_path + ".meta.json"
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    headers = {}
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with get_session().get(
+            url, headers=headers, stream=True, timeout=TIMEOUT
+        ) as response:
+            if response.status_code == 304:
+                return cache_path
+            response.raise_for_status()
+            tmp_path = f"{cache_path}.tmp.{os.getpid()}"
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(tmp_path, cache_path)
+            with open(meta_path, "w") as f:
+                json.dump(
+                    {
+                        "url": url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    },
+                    f,
+                )
+    except requests.RequestException as e:
+        if not os.path.exists(cache_path):
+            raise
+        logger.warning(f"Could not revalidate {url}, using cached copy: {e}")
+    return cache_path
+
+
+def get_common_crawl_snapshot_index(index_prefix, cache_dir="data/cc/cache"):
     index_url = urljoin(index_prefix, "collinfo.json")
-    index_response = requests.get(index_url)
-    return json.loads(index_response.content)
+    with open(cached_fetch(index_url, cache_dir), "rb") as f:
+        return json.load(f)
 
 
 def get_main_warc_paths(
@@ -51,19 +106,48 @@ def get_main_warc_paths(
     return snapshot_warc_paths
 
 
-def fetch_urls_from_warc_path(warc_path: str, data_domain_prefix: str) -> list[str]:
+def iter_urls_from_warc_path(
+    warc_path: str, data_domain_prefix: str, cache_dir: str
+) -> Iterator[str]:
+    """Yield WARC URLs from a ``warc.paths.gz`` listing, decompressing as we go"""
+    local_path = cached_fetch(warc_path.rstrip(), cache_dir)
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+    remainder = b""
+    with open(local_path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            data = decompressor.decompress(chunk) if chunk else decompressor.flush()
+            lines = (remainder + data).split(b"\n")
+            remainder = lines.pop()
+            for warc in lines:
+                if warc:
+                    yield urljoin(data_domain_prefix, warc.decode("utf-8"))
+            if not chunk:
+                break
+    if remainder:
+        yield urljoin(data_domain_prefix, remainder.decode("utf-8"))
+
+
+def write_urls_from_warc_path(
+    warc_path: str, output_path: str, data_domain_prefix: str, cache_dir: str
+) -> Optional[int]:
+    """Write the WARC URLs of a snapshot; returns None if they could not be read"""
+    tmp_path = f"{output_path}.tmp"
+    num_urls = 0
     try:
-        response = requests.get(warc_path.rstrip(), stream=True)
-        response.raise_for_status()
-        data = zlib.decompress(response.content, zlib.MAX_WBITS | 32)
-        urls = []
-        for warc in data.decode("utf-8").split("\n"):
-            if warc:
-                urls.append(urljoin(data_domain_prefix, warc))
-        return urls
+        with open(tmp_path, "w") as f:
+            for url in iter_urls_from_warc_path(
+                warc_path, data_domain_prefix, cache_dir
+            ):
+                f.write(f"{url}\n")
+                num_urls += 1
     except Exception as e:
         logger.warning(f"Could not get URLs for {warc_path}: {e}")
-        return []
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return None
+    os.replace(tmp_path, output_path)
+    return num_urls
 
 
 def get_common_crawl_urls_per_snapshot(
@@ -72,21 +156,34 @@ def get_common_crawl_urls_per_snapshot(
     output_dir: str,
     data_domain_prefix="https://data.commoncrawl.org",
     index_prefix="https://index.commoncrawl.org",
+    cache_dir="data/cc/cache",
+    num_workers=8,
 ):
-    index = get_common_crawl_snapshot_index(index_prefix)
+    index = get_common_crawl_snapshot_index(index_prefix, cache_dir)
     snapshot_warc_paths = get_main_warc_paths(
         index, starting_snapshot, ending_snapshot, prefix=data_domain_prefix
     )
 
     os.makedirs(output_dir, exist_ok=True)
 
-    for snapshot_id, warc_path in snapshot_warc_paths.items():
-        urls = fetch_urls_from_warc_path(warc_path, data_domain_prefix)
-        output_path = os.path.join(output_dir, f"{snapshot_id}.txt")
-        with open(output_path, "w") as f:
-            for url in urls:
-                f.write(f"{url}\n")
-        logger.info(f"Wrote {len(urls)} URLs to {output_path}")
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {}
+        for snapshot_id, warc_path in snapshot_warc_paths.items():
+            output_path = os.path.join(output_dir, f"{snapshot_id}.txt")
+            future = executor.submit(
+                write_urls_from_warc_path,
+                warc_path,
+                output_path,
+                data_domain_prefix,
+                cache_dir,
+            )
+            futures[future] = output_path
+        for future in as_completed(futures):
+            num_urls = future.result()
+            if num_urls is None:
+                logger.error(f"No URLs written to {futures[future]}")
+                continue
+            logger.info(f"Wrote {num_urls} URLs to {futures[future]}")
 
 
 def parse_args():
@@ -94,11 +191,27 @@ def parse_args():
     parser.add_argument("--start_snapshot", type=str, default="2020-05")
     parser.add_argument("--end_snapshot", type=str, default="2025-18")
     parser.add_argument("--output_dir", type=str, default="data/cc/url")
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default="data/cc/cache",
+        help="Local cache for collinfo.json and warc.paths.gz listings",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=8,
+        help="Number of snapshots fetched concurrently",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
     get_common_crawl_urls_per_snapshot(
-        args.start_snapshot, args.end_snapshot, output_dir=args.output_dir
+        args.start_snapshot,
+        args.end_snapshot,
+        output_dir=args.output_dir,
+        cache_dir=args.cache_dir,
+        num_workers=args.num_workers,
     )
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from typing import Optional, Sequence
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from ccaudio.extract_url.warc_source import RecordRange
+
+HTML_MIME_TYPES = ("text/html", "application/xhtml+xml")
+FEED_MIME_TYPES = (
+    "application/rss+xml",
+    "application/atom+xml",
+    "application/xml",
+    "text/xml",
+)
+INDEX_COLUMNS = ["warc_filename", "warc_record_offset", "warc_record_length"]
+
+
+def build_filter(
+    schema_names: Sequence[str],
+    mime_types: Sequence[str],
+    languages: Optional[Sequence[str]] = None,
+    warc_filenames: Optional[Sequence[str]] = None,
+):
+    mime_filter = pc.field("content_mime_type").isin(mime_types)
+    if "content_mime_detected" in schema_names:
+        mime_filter |= pc.field("content_mime_detected").isin(mime_types)
+    expr = mime_filter
+    if languages:
+        # content_languages holds up to three ISO-639-3 codes, e.g. "jpn,eng"
+        lang_filter = None
+        for language in languages:
+            match = pc.match_substring(pc.field("content_languages"), language)
+            lang_filter = match if lang_filter is None else lang_filter | match
+        expr &= lang_filter
+    if warc_filenames is not None:
+        expr &= pc.field("warc_filename").isin(list(warc_filenames))
+    if "subset" in schema_names:
+        expr &= pc.field("subset") == "warc"
+    if "fetch_status" in schema_names:
+        expr &= pc.field("fetch_status") == 200
+    return expr
+
+
+def query_index(
+    index_path: str,
+    mime_types: Sequence[str],
+    languages: Optional[Sequence[str]] = None,
+    warc_filenames: Optional[Sequence[str]] = None,
+) -> dict[str, list[RecordRange]]:
+    """Return matching record ranges grouped by ``warc_filename``.
+
+    ``index_path`` points to Common Crawl's columnar index
+    (``cc-index/table/cc-main/warc/``) or a local copy of some partitions.
+    Pass ``warc_filenames`` to keep only the hits of the WARCs being processed
+    instead of those of the whole snapshot.
+    """
+    dataset = ds.dataset(index_path, format="parquet", partitioning="hive")
+    scanner = dataset.scanner(
+        columns=INDEX_COLUMNS,
+        filter=build_filter(
+            dataset.schema.names, mime_types, languages, warc_filenames
+        ),
+    )
+
+    ranges = defaultdict(list)
+    for batch in scanner.to_batches():
+        columns = batch.to_pydict()
+        for filename, offset, length in zip(
+            columns["warc_filename"],
+            columns["warc_record_offset"],
+            columns["warc_record_length"],
+        ):
+            ranges[filename].append(RecordRange(offset, length))
+    return dict(ranges)
+
+
+def warc_filename_of(location: str) -> str:
+    """Map a WARC URL or mirrored local path to the index's ``warc_filename``"""
+    index = location.find("crawl-data/")
+    return location[index:] if index >= 0 else location.rsplit("/", 1)[-1]
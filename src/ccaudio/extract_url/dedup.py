@@ -0,0 +1,449 @@
+"""Global ``audio_url`` deduplication across snapshots.
+
+URLs are normalized (scheme, host case, default ports, tracking query
+parameters, trailing slashes, fragments) and hashed. Keys already seen are
+looked up in a disk-backed SQLite index, which also keeps the first-seen
+provenance of every URL. An in-memory Bloom filter in front of the index
+means most new URLs need no lookup at all.
+
+The index persists between runs, so a new snapshot can be added later and
+only its unseen URLs are kept.
+
+    uv run python src/ccaudio/extract_url/dedup.py \\
+        --inputs data/cc/audio/2025-18-parquet --snapshot 2025-18 \\
+        --output_dir data/cc/dedup/2025-18
+"""
+
+import glob
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from argparse import ArgumentParser
+from typing import Iterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+from tqdm import tqdm
+
+from ccaudio.extract_url.jsonl_io import JsonlWriter, is_jsonl, read_jsonl
+
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "dclid",
+    "yclid",
+    "msclkid",
+    "igshid",
+    "mc_cid",
+    "mc_eid",
+    "_ga",
+    "_gl",
+    "ref",
+    "ref_src",
+    "source",
+    "spm",
+}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+BATCH_SIZE = 10_000
+# SQLite limits the number of host parameters per statement
+QUERY_CHUNK_SIZE = 500
+DEFAULT_CAPACITY = 200_000_000
+DEFAULT_ERROR_RATE = 0.01
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL used as the deduplication key"""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    # http/httpsは同じ音声を指すことがほとんど
+    if scheme == "http":
+        scheme = "https"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS
+        and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+def url_key(url: str) -> bytes:
+    return hashlib.blake2b(normalize_url(url).encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Bloom filter over 16-byte keys, stored as a numpy bit array.
+
+    The two 64-bit halves of a key are combined by double hashing, so keys
+    must already be uniformly distributed hashes.
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        if bits is None:
+            bits = np.zeros((num_bits + 7) // 8, dtype=np.uint8)
+        self.bits = bits
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, keys: list[bytes]) -> np.ndarray:
+        halves = np.frombuffer(b"".join(keys), dtype="<u8").reshape(-1, 2)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            positions = halves[:, :1] + steps * halves[:, 1:]
+        return positions % np.uint64(self.num_bits)
+
+    def add(self, keys: list[bytes]) -> None:
+        if not keys:
+            return
+        positions = self._positions(keys).ravel()
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+
+    def contains(self, keys: list[bytes]) -> np.ndarray:
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        return ((self.bits[positions >> np.uint64(3)] & masks) != 0).all(axis=1)
+
+    def save(self, path: str, **meta) -> None:
+        tmp_path = f"{path}.tmp.{os.getpid()}.npy"
+        np.save(tmp_path, self.bits)
+        os.replace(tmp_path, path)
+        meta = {"num_bits": self.num_bits, "num_hashes": self.num_hashes, **meta}
+        with open(f"{path}.json", "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str) -> tuple["BloomFilter", dict]:
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        bits = np.load(path)
+        return cls(meta["num_bits"], meta["num_hashes"], bits), meta
+
+
+class UrlIndex:
+    """Disk-backed set of normalized audio URLs with first-seen provenance.
+
+    New keys of an input file are committed together with the file name, so
+    an interrupted file is processed again from scratch on the next run. The
+    Bloom filter is only a cache of the index; it is rebuilt from SQLite if
+    it does not cover every committed file.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        capacity: int = DEFAULT_CAPACITY,
+        error_rate: float = DEFAULT_ERROR_RATE,
+    ):
+        os.makedirs(index_dir, exist_ok=True)
+        self.bloom_path = os.path.join(index_dir, "bloom.npy")
+        self.conn = sqlite3.connect(os.path.join(index_dir, "urls.sqlite"))
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                key BLOB PRIMARY KEY,
+                audio_url TEXT NOT NULL,
+                snapshot TEXT,
+                source TEXT
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS files (
+                source TEXT PRIMARY KEY
+            ) WITHOUT ROWID;
+            """
+        )
+        self.pending = {}
+        self.stats = {"urls": 0, "lookups": 0}
+        self.bloom = self._load_bloom(capacity, error_rate)
+
+    def _num_files(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def _load_bloom(self, capacity, error_rate) -> BloomFilter:
+        if os.path.exists(self.bloom_path):
+            bloom, meta = BloomFilter.load(self.bloom_path)
+            if meta.get("num_files") == self._num_files():
+                return bloom
+            logger.info("Bloom filter is stale, rebuilding it from the index")
+        bloom = BloomFilter.for_capacity(capacity, error_rate)
+        cursor = self.conn.execute("SELECT key FROM urls")
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            bloom.add([row[0] for row in rows])
+        return bloom
+
+    def is_done(self, source: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM files WHERE source = ?", (source,)
+        ).fetchone()
+        return row is not None
+
+    def _existing(self, keys: list[bytes]) -> set[bytes]:
+        existing = set()
+        for i in range(0, len(keys), QUERY_CHUNK_SIZE):
+            chunk = keys[i : i + QUERY_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key FROM urls WHERE key IN ({placeholders})", chunk
+            )
+            existing.update(row[0] for row in rows)
+        return existing
+
+    def add_new(self, urls: list[str], snapshot: str, source: str) -> list[bool]:
+        """Mark the URLs seen for the first time (in the index or this batch).
+
+        Empty URLs are never new.
+        """
+        keys = [url_key(url) if url else None for url in urls]
+        valid_keys = [key for key in keys if key is not None]
+        maybe_seen = self.bloom.contains(valid_keys)
+        candidates = [key for key, hit in zip(valid_keys, maybe_seen) if hit]
+        self.stats["urls"] += len(valid_keys)
+        self.stats["lookups"] += len(candidates)
+        existing = self._existing(candidates) if candidates else set()
+
+        is_new = []
+        new_keys = []
+        for url, key in zip(urls, keys):
+            if key is None or key in existing or key in self.pending:
+                is_new.append(False)
+                continue
+            self.pending[key] = (url, snapshot, source)
+            new_keys.append(key)
+            is_new.append(True)
+        self.bloom.add(new_keys)
+        return is_new
+
+    def commit(self, source: str) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO urls VALUES (?, ?, ?, ?)",
+                ((key, *value) for key, value in self.pending.items()),
+            )
+            self.conn.execute("INSERT OR IGNORE INTO files VALUES (?)", (source,))
+        self.pending.clear()
+
+    def rollback(self) -> None:
+        # Keys already added to the Bloom filter only cost extra lookups
+        self.pending.clear()
+
+    def close(self) -> None:
+        self.bloom.save(self.bloom_path, num_files=self._num_files())
+        self.conn.close()
+
+
+def is_parquet(path: str) -> bool:
+    return path.endswith(".parquet")
+
+
+def iter_batches(path: str, batch_size: int = BATCH_SIZE) -> Iterator[list[dict]]:
+    if is_parquet(path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+        return
+    batch = []
+    for record in read_jsonl(path):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ParquetOutput:
+    """Parquet counterpart of JsonlWriter for deduplicated records"""
+
+    def __init__(self, path: str, input_path: str):
+        schema = pq.read_schema(input_path)
+        if "snapshot" not in schema.names:
+            schema = schema.append(pa.field("snapshot", pa.string()))
+        self.path = path
+        self.schema = schema.remove_metadata()
+        self.tmp_path = f"{path}.tmp.{os.getpid()}"
+        self.writer = None
+        self.count = 0
+
+    def __enter__(self):
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression="zstd")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.writer.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+    def write_batch(self, records: list[dict]) -> None:
+        if records:
+            self.writer.write_table(pa.Table.from_pylist(records, schema=self.schema))
+            self.count += len(records)
+
+
+def dedup_file(
+    index: UrlIndex,
+    input_path: str,
+    output_path: str,
+    snapshot: str,
+    batch_size: int = BATCH_SIZE,
+) -> tuple[int, int]:
+    """Write the records of ``input_path`` whose audio URL is new.
+
+    Returns the number of records read and written.
+    """
+    source = source_name(input_path, snapshot)
+    num_rows = 0
+    try:
+        if is_parquet(input_path):
+            output = ParquetOutput(output_path, input_path)
+        else:
+            output = JsonlWriter(output_path)
+        with output:
+            for batch in iter_batches(input_path, batch_size):
+                urls = [record.get("audio_url") or "" for record in batch]
+                is_new = index.add_new(urls, snapshot, source)
+                kept = [
+                    {**record, "snapshot": snapshot}
+                    for record, new in zip(batch, is_new)
+                    if new
+                ]
+                if is_parquet(input_path):
+                    output.write_batch(kept)
+                else:
+                    for record in kept:
+                        output.write(record)
+                num_rows += len(batch)
+    except BaseException:
+        index.rollback()
+        raise
+    index.commit(source)
+    return num_rows, output.count
+
+
+def source_name(input_path: str, snapshot: str) -> str:
+    """Name of an input file in the index (file names repeat across snapshots)"""
+    return f"{snapshot}/{os.path.basename(input_path)}"
+
+
+def list_inputs(inputs: list[str]) -> list[str]:
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(
+                sorted(
+                    p
+                    for p in glob.glob(os.path.join(path, "*"))
+                    if is_parquet(p) or is_jsonl(p)
+                )
+            )
+        else:
+            paths.append(path)
+    return paths
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--inputs",
+        type=str,
+        nargs="+",
+        default=["data/cc/audio/2025-18-parquet"],
+        help="Parquet/JSONL files or directories containing them",
+    )
+    parser.add_argument(
+        "--snapshot",
+        type=str,
+        default=None,
+        help="Snapshot recorded as provenance (default: name of the input dir)",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="data/cc/dedup/2025-18",
+        help="Output directory for deduplicated files",
+    )
+    parser.add_argument(
+        "--index_dir",
+        type=str,
+        default="data/cc/dedup/index",
+        help="Directory of the URL index shared by all snapshots",
+    )
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        default=DEFAULT_CAPACITY,
+        help="Expected number of unique URLs (sizes a new Bloom filter)",
+    )
+    parser.add_argument(
+        "--error_rate",
+        type=float,
+        default=DEFAULT_ERROR_RATE,
+        help="Bloom filter false positive rate at capacity",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_SIZE,
+    )
+    return parser.parse_args()
+
+
+def snapshot_of(path: str, snapshot: Optional[str]) -> str:
+    if snapshot:
+        return snapshot
+    name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return name[: -len("-parquet")] if name.endswith("-parquet") else name
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    input_paths = list_inputs(args.inputs)
+    index = UrlIndex(args.index_dir, args.capacity, args.error_rate)
+    total_rows = 0
+    total_kept = 0
+    try:
+        for input_path in tqdm(input_paths, desc="Deduplicating", unit="file"):
+            snapshot = snapshot_of(input_path, args.snapshot)
+            if index.is_done(source_name(input_path, snapshot)):
+                logger.info(f"Already indexed: {input_path}")
+                continue
+            output_path = os.path.join(args.output_dir, os.path.basename(input_path))
+            num_rows, num_kept = dedup_file(
+                index, input_path, output_path, snapshot, args.batch_size
+            )
+            total_rows += num_rows
+            total_kept += num_kept
+    finally:
+        index.close()
+    logger.info(
+        f"Kept {total_kept}/{total_rows} records; "
+        f"{index.stats['lookups']}/{index.stats['urls']} URLs looked up in the index"
+    )
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sqlite3
+from typing import Iterable
+
+# SQLite limits the number of host parameters per statement
+QUERY_CHUNK_SIZE = 500
+
+
+def content_hash(payload: bytes) -> bytes:
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+class FeedCache:
+    """Disk-backed record of the feeds and episodes already extracted.
+
+    Feeds are keyed by (feed URL, payload hash), so a feed captured again
+    without changes is skipped before it is parsed (a feed that failed to
+    parse is not recorded and is tried again); episodes are keyed by
+    ``audio_url``, so only episodes never emitted before are kept.
+
+    New keys are buffered and written by ``commit()`` in one transaction,
+    which the caller runs once the output of a WARC is safely on disk; a
+    failed WARC therefore leaves the cache untouched. Several processes may
+    share one cache file; episodes found by two of them before either commits
+    can still be emitted twice.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending_feeds = set()
+        self.pending_episodes = set()
+        self._conn = None
+
+    def __getstate__(self):
+        # Connections cannot be pickled; reopen lazily in the worker process
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=600)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS feeds (
+                    feed_url TEXT NOT NULL,
+                    content_hash BLOB NOT NULL,
+                    PRIMARY KEY (feed_url, content_hash)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS episodes (
+                    audio_url TEXT PRIMARY KEY
+                ) WITHOUT ROWID;
+                """
+            )
+        return self._conn
+
+    def seen_feed(self, feed_url: str, payload: bytes) -> bool:
+        """True if this exact feed content was already processed"""
+        key = (feed_url, content_hash(payload))
+        if key in self.pending_feeds:
+            return True
+        row = self.conn.execute(
+            "SELECT 1 FROM feeds WHERE feed_url = ? AND content_hash = ?", key
+        ).fetchone()
+        return row is not None
+
+    def add_feed(self, feed_url: str, payload: bytes) -> None:
+        """Remember a feed once its episodes have been extracted"""
+        self.pending_feeds.add((feed_url, content_hash(payload)))
+
+    def new_episodes(self, audio_urls: Iterable[str]) -> set[str]:
+        """Return the audio URLs not seen before and remember them"""
+        candidates = set(audio_urls) - self.pending_episodes
+        candidate_list = list(candidates)
+        for i in range(0, len(candidate_list), QUERY_CHUNK_SIZE):
+            chunk = candidate_list[i : i + QUERY_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT audio_url FROM episodes WHERE audio_url IN ({placeholders})",
+                chunk,
+            )
+            candidates.difference_update(row[0] for row in rows)
+        self.pending_episodes.update(candidates)
+        return candidates
+
+    def commit(self) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO feeds VALUES (?, ?)", self.pending_feeds
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO episodes VALUES (?)",
+                ((url,) for url in self.pending_episodes),
+            )
+        self.pending_feeds.clear()
+        self.pending_episodes.clear()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,281 @@
+"""Shared HTTP layer for WARC downloads.
+
+* One pooled ``requests.Session`` per process, with timeouts and retries
+  (backoff, ``Retry-After``) on connection errors and 429/5xx responses.
+* ``open_url`` returns a stream that resumes with a ``Range`` request when
+  the connection breaks partway, so one dropped connection no longer fails
+  a whole WARC.
+* ``PrefetchExecutor`` downloads WARCs to a local spool with its own thread
+  limit, so network concurrency and CPU parse workers are sized separately.
+* ``resolve_location`` reads WARCs from a local mirror instead of the web.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = "ccaudio (+https://github.com/llm-jp/ccaudio)"
+# (connect, read) seconds
+TIMEOUT = (10, 120)
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 1.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_SIZE = 32
+CHUNK_SIZE = 1 << 20
+# Errors after which a partially read body is resumed
+RESUMABLE_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError, OSError)
+
+_session = None
+_session_pid = None
+
+
+def is_remote(location: str) -> bool:
+    return location.startswith(("http://", "https://"))
+
+
+def get_session() -> requests.Session:
+    """Pooled, retrying session of the current process"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        _session = session
+        _session_pid = os.getpid()
+    return _session
+
+
+class ResumableStream(io.RawIOBase):
+    """Body of ``url`` from ``start`` to ``end`` (exclusive), resumed on errors.
+
+    A resumed request carries ``If-Range`` with the first response's ETag,
+    so a file that changed on the server fails instead of being spliced.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        max_resumes: int = MAX_RETRIES,
+    ):
+        super().__init__()
+        self.url = url
+        self.pos = start
+        self.end = end
+        self.max_resumes = max_resumes
+        self.resumes = 0
+        self.etag = None
+        self.response = None
+        self._open()
+
+    def _open(self) -> None:
+        headers = {}
+        if self.pos or self.end is not None:
+            last = "" if self.end is None else str(self.end - 1)
+            headers["Range"] = f"bytes={self.pos}-{last}"
+            if self.etag:
+                headers["If-Range"] = self.etag
+        response = get_session().get(
+            self.url, headers=headers, stream=True, timeout=TIMEOUT
+        )
+        response.raise_for_status()
+        if headers and response.status_code != 206:
+            response.close()
+            raise RuntimeError(f"Server ignored the Range request for {self.url}")
+        self.etag = self.etag or response.headers.get("ETag")
+        length = response.headers.get("Content-Length")
+        self.expected_end = self.pos + int(length) if length else self.end
+        self.response = response
+
+    def _resume(self, error: Exception) -> None:
+        self.resumes += 1
+        if self.resumes > self.max_resumes:
+            raise error
+        logger.warning(
+            f"Resuming {self.url} at byte {self.pos} "
+            f"({self.resumes}/{self.max_resumes}): {error!r}"
+        )
+        self.response.close()
+        time.sleep(BACKOFF_FACTOR * 2 ** (self.resumes - 1))
+        self._open()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while True:
+            if self.expected_end is not None and self.pos >= self.expected_end:
+                return 0
+            try:
+                size = self.response.raw.readinto(buffer)
+            except RESUMABLE_ERRORS as e:
+                self._resume(e)
+                continue
+            if size == 0 and self.expected_end is not None:
+                # The connection closed before the announced length
+                self._resume(
+                    IOError(f"Truncated at {self.pos} of {self.expected_end} bytes")
+                )
+                continue
+            self.pos += size
+            return size
+
+    def close(self) -> None:
+        if self.response is not None:
+            self.response.close()
+        super().close()
+
+
+def open_url(url: str, start: int = 0, end: Optional[int] = None) -> io.BufferedReader:
+    return io.BufferedReader(ResumableStream(url, start, end), CHUNK_SIZE)
+
+
+def read_url_range(url: str, start: int, end: int) -> bytes:
+    with open_url(url, start, end) as f:
+        data = f.read()
+    if len(data) != end - start:
+        raise IOError(f"Expected {end - start} bytes from {url}, got {len(data)}")
+    return data
+
+
+def download(url: str, path: str) -> str:
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open_url(url) as src, open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    os.replace(tmp_path, path)
+    return path
+
+
+def resolve_location(location: str, source_dir: Optional[str]) -> str:
+    """Local copy of a remote WARC under ``source_dir`` (same path as the URL)"""
+    if not source_dir or not is_remote(location):
+        return location
+    local_path = os.path.join(source_dir, urlparse(location).path.lstrip("/"))
+    if os.path.exists(local_path):
+        return local_path
+    logger.warning(f"{local_path} not found, reading {location} instead")
+    return location
+
+
+class PrefetchExecutor:
+    """Wrap an executor so that remote inputs are downloaded before the job runs.
+
+    ``submit(fn, location, *args)`` downloads ``location`` into ``spool_dir``
+    on one of ``max_downloads`` threads, then runs ``fn(local_path, *args)``
+    on ``executor`` and removes the local copy. At most ``max_spooled``
+    downloaded files wait on disk. With ``max_downloads=0`` jobs are
+    submitted as is and workers stream their inputs themselves.
+    """
+
+    def __init__(
+        self,
+        executor,
+        max_downloads: int = 0,
+        spool_dir: str = "data/cc/spool",
+        max_spooled: Optional[int] = None,
+    ):
+        self.executor = executor
+        self.max_downloads = max_downloads
+        self.spool_dir = spool_dir
+        num_workers = getattr(executor, "_max_workers", os.cpu_count() or 1)
+        self.max_pending = max_downloads + num_workers
+        self.downloads = None
+        if max_downloads > 0:
+            os.makedirs(spool_dir, exist_ok=True)
+            self.downloads = ThreadPoolExecutor(max_downloads)
+            self.slots = threading.BoundedSemaphore(max_spooled or self.max_pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.downloads is not None:
+            self.downloads.shutdown(wait=exc_type is None)
+
+    def submit(self, fn, location, *args) -> Future:
+        if self.downloads is None or not is_remote(location):
+            return self.executor.submit(fn, location, *args)
+        future = Future()
+        self.downloads.submit(self._download_and_run, future, fn, location, args)
+        return future
+
+    def _download_and_run(self, future, fn, location, args):
+        self.slots.acquire()
+        local_dir = tempfile.mkdtemp(dir=self.spool_dir)
+
+        def cleanup():
+            shutil.rmtree(local_dir, ignore_errors=True)
+            self.slots.release()
+
+        try:
+            local_path = download(
+                location, os.path.join(local_dir, os.path.basename(location))
+            )
+            job = self.executor.submit(fn, local_path, *args)
+        except BaseException as e:
+            cleanup()
+            future.set_exception(e)
+            return
+
+        def finished(job):
+            cleanup()
+            if job.exception() is not None:
+                future.set_exception(job.exception())
+            else:
+                future.set_result(job.result())
+
+        job.add_done_callback(finished)
+
+
+def add_fetch_args(parser: ArgumentParser) -> None:
+    """Flags shared by the stages that read WARCs"""
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help="Number of parse processes (CPU count by default)",
+    )
+    parser.add_argument(
+        "--max_downloads",
+        type=int,
+        default=0,
+        help="Concurrent WARC downloads into --spool_dir "
+        "(0: every worker streams its own WARC)",
+    )
+    parser.add_argument(
+        "--spool_dir",
+        type=str,
+        default="data/cc/spool",
+        help="Local directory for prefetched WARCs",
+    )
+    parser.add_argument(
+        "--source_dir",
+        type=str,
+        default=None,
+        help="Local mirror of data.commoncrawl.org; WARCs found there are read from disk",
+    )
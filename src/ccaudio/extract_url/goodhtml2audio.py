@@ -1,15 +1,29 @@
-import json
 import os
 import re
 from argparse import ArgumentParser
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urljoin, urlparse
 
-from bs4 import BeautifulSoup
+import lxml.html
+from bs4 import BeautifulSoup, NavigableString
 from loguru import logger
+from lxml import etree
 from tqdm import tqdm
 
+from ccaudio.extract_url.jsonl_io import JsonlWriter, is_jsonl, read_jsonl
+from ccaudio.extract_url.lease import make_lease_queue, run_jobs
+
 AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".flac", ".m4a", ".aac")
+# 音声URLの候補（拡張子または<audio>タグ）を含まないページはパースしない
+AUDIO_CANDIDATE_REGEX = re.compile(
+    "|".join(re.escape(ext) for ext in AUDIO_EXTENSIONS) + "|<audio", re.IGNORECASE
+)
+CANDIDATE_TAGS = ["a", "source", "embed", "iframe", "object", "track", "link"]
+LICENSE_ATTRS = ["license", "data-license", "data-licence"]
+DOCTYPE_REGEX = re.compile(r"<!(doctype[^>]*)>", re.IGNORECASE)
+# DOCTYPE宣言の前に置かれうるコメントと処理命令（<?xml ...?>）
+PROLOG_REGEX = re.compile(r"\s*(?:<!--.*?-->|<\?[^>]*>)", re.DOTALL)
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
 
 
 def is_valid_url(url):
@@ -48,26 +62,89 @@ def looks_like_audio_url(url):
     return any(clean_url.endswith(ext) for ext in AUDIO_EXTENSIONS)
 
 
-def extract_audio_url_pairs(html, base_url=""):
+def has_audio_candidates(html, base_url=""):
+    """音声URLを含みうるページかどうか（Falseなら抽出結果は必ず空）"""
+    # 空や"#..."のhrefはページ自身のURLに解決されるため、それが音声URLなら常に候補
+    if base_url and looks_like_audio_url(base_url):
+        return True
+    return AUDIO_CANDIDATE_REGEX.search(html) is not None
+
+
+def extract_audio_url_pairs(html, base_url="", backend="lxml", prefilter=True):
+    if prefilter and not has_audio_candidates(html, base_url):
+        return []
+    return BACKENDS[backend](html, base_url)
+
+
+def join_surrounding_text(prev_text, next_text, max_len=100):
+    text_parts = []
+    if prev_text:
+        text_parts.append(prev_text.strip())
+    if next_text:
+        text_parts.append(next_text.strip())
+    combined = " ".join(text_parts).strip()
+    return combined[:max_len] if combined else ""
+
+
+class TextIndex:
+    """BeautifulSoupの文書を一度だけ走査して作る索引
+
+    文字列ノード（コメント等を含む）を文書順に並べ、各タグの開始位置と
+    祖先から継承されるライセンス属性を記録する。これにより
+    ``find_previous(string=True)``/``find_next(string=True)`` と祖先の
+    ライセンス探索がタグごとにO(1)になる。
+    """
+
+    def __init__(self, soup):
+        self.strings = []
+        self.positions = {}
+        self.licenses = {id(soup): ""}
+        for element in soup.descendants:
+            if isinstance(element, NavigableString):
+                self.strings.append(element)
+                continue
+            self.positions[id(element)] = len(self.strings)
+            for attr in LICENSE_ATTRS:
+                if attr in element.attrs:
+                    self.licenses[id(element)] = element[attr]
+                    break
+            else:
+                self.licenses[id(element)] = self.licenses[id(element.parent)]
+
+    def previous_string(self, tag):
+        position = self.positions[id(tag)]
+        return self.strings[position - 1] if position > 0 else None
+
+    def next_string(self, tag):
+        position = self.positions[id(tag)]
+        return self.strings[position] if position < len(self.strings) else None
+
+    def license(self, tag):
+        return self.licenses[id(tag)]
+
+    def surrounding_text(self, tag, max_len=100):
+        prev_text = self.previous_string(tag)
+        next_text = self.next_string(tag)
+        # Fallback: parent text
+        if not prev_text and not next_text and tag.parent:
+            return join_surrounding_text(None, tag.parent.get_text(strip=True), max_len)
+        return join_surrounding_text(prev_text, next_text, max_len)
+
+
+def extract_audio_url_pairs_bs4(html, base_url=""):
     soup = BeautifulSoup(html, "html.parser")
+    index = TextIndex(soup)
     pairs = []
     seen_urls = set()
 
-    def extract_license(tag):
-        for ancestor in [tag] + list(tag.parents):
-            for attr in ["license", "data-license", "data-licence"]:
-                if attr in ancestor.attrs:
-                    return ancestor[attr]
-        return ""
-
     def add_audio_url(tag, url, fallback_desc=""):
         audio_url = safe_urljoin(base_url, url)
         if audio_url and looks_like_audio_url(audio_url) and audio_url not in seen_urls:
             seen_urls.add(audio_url)
             description = (
-                tag.get("title", "") or get_surrounding_text(tag) or fallback_desc
+                tag.get("title", "") or index.surrounding_text(tag) or fallback_desc
             )
-            license_info = extract_license(tag)
+            license_info = index.license(tag)
             pairs.append(
                 {
                     "audio_url": audio_url,
@@ -86,12 +163,10 @@ def extract_audio_url_pairs(html, base_url=""):
         for source in audio.find_all("source"):
             src = source.get("src")
             if src:
-                add_audio_url(source, src, fallback_desc=get_surrounding_text(audio))
+                add_audio_url(source, src, fallback_desc=index.surrounding_text(audio))
 
     # 一般タグ: href や src を持つタグをすべて対象に
-    for tag in soup.find_all(
-        ["a", "source", "embed", "iframe", "object", "track", "link"]
-    ):
+    for tag in soup.find_all(CANDIDATE_TAGS):
         for attr in ["href", "src"]:
             if attr in tag.attrs:
                 add_audio_url(tag, tag[attr])
@@ -99,55 +174,142 @@ def extract_audio_url_pairs(html, base_url=""):
     return pairs
 
 
-def get_surrounding_text(tag, max_len=100):
-    # Surrounding sibling text or parent summary
-    text_parts = []
+def extract_audio_url_pairs_lxml(html, base_url=""):
+    """lxmlによる抽出（extract_audio_url_pairs_bs4と同じ出力形式）
 
-    # Try next/previous siblings
-    prev_text = tag.find_previous(string=True)
-    next_text = tag.find_next(string=True)
-    if prev_text:
-        text_parts.append(prev_text.strip())
-    if next_text:
-        text_parts.append(next_text.strip())
+    文書を一度だけ走査して、テキストノードの列と各要素の位置、継承される
+    ライセンス属性を記録する。前後のテキストはこの列から引く。
+    """
+    root = None
+    if html.strip():
+        root = etree.fromstring(html.encode("utf-8", "replace"), HTML_PARSER)
+    if root is None:
+        return []
+    # </html>の後ろの要素やコメントはルートの兄弟になる
+    tops = [
+        *reversed(list(root.itersiblings(preceding=True))),
+        root,
+        *root.itersiblings(),
+    ]
 
-    # Fallback: parent text
-    if not text_parts and tag.parent:
-        parent_text = tag.parent.get_text(strip=True)
-        text_parts.append(parent_text)
+    # BeautifulSoupはDOCTYPE宣言も文字列として扱う（lxmlは宣言がなくても補う）。
+    # 宣言の前にあるコメントや処理命令はlxmlでもルートの前の兄弟になる
+    position, num_prolog = 0, 0
+    while True:
+        prolog = PROLOG_REGEX.match(html, position)
+        if not prolog:
+            break
+        position, num_prolog = prolog.end(), num_prolog + 1
+    while position < len(html) and html[position].isspace():
+        position += 1
+    doctype = DOCTYPE_REGEX.match(html, position)
 
-    # Join and truncate
-    combined = " ".join(text_parts).strip()
-    return combined[:max_len] if combined else ""
+    texts = []
+    positions = {}
+    licenses = {}
+    for i, top in enumerate(tops):
+        if doctype and i == num_prolog:
+            texts.append(doctype.group(1)[len("DOCTYPE ") :])
+        stack = [(top, "", False)]
+        while stack:
+            element, inherited_license, closed = stack.pop()
+            if closed:
+                if element.tail:
+                    texts.append(element.tail)
+                continue
+            if not isinstance(element.tag, str):
+                # コメントや処理命令
+                if isinstance(element, etree._Comment):
+                    text = element.text or ""
+                    # lxmlは<?xml ...?>を"?xml ...?"というコメントにする
+                    if text.startswith("?") and f"<{text}>" in html:
+                        text = text[1:]
+                    texts.append(text)
+                if element.tail:
+                    texts.append(element.tail)
+                continue
+            positions[element] = len(texts)
+            for attr in LICENSE_ATTRS:
+                if attr in element.attrib:
+                    inherited_license = element.get(attr)
+                    break
+            licenses[element] = inherited_license
+            if element.text:
+                texts.append(element.text)
+            stack.append((element, inherited_license, True))
+            for child in reversed(element):
+                stack.append((child, inherited_license, False))
 
+    def surrounding_text(element, max_len=100):
+        position = positions[element]
+        prev_text = texts[position - 1] if position > 0 else None
+        next_text = texts[position] if position < len(texts) else None
+        return join_surrounding_text(prev_text, next_text, max_len)
 
-def process_html(input_path, output_path):
-    results = []
-    with open(input_path, "r", encoding="utf-8") as infile:
-        for i, line in tqdm(enumerate(infile), desc="Processing HTML", unit="line"):
-            data = json.loads(line)
-            html = data["html"]
-            url = data["url"]
-            pairs = extract_audio_url_pairs(html, url)
-            for pair in pairs:
-                audio_url = pair["audio_url"]
-                description = pair["description"]
-                license_info = pair.get("license", "")
-                results.append(
-                    {
-                        "audio_url": audio_url,
-                        "description": description,
-                        "license": license_info,
-                        "url": url,
-                        "title": data["title"],
-                        "quality": data["quality"],
-                        "text": data["text"],
-                    }
-                )
-    logger.info(f"Extracted {len(results)} audio URL pairs from {input_path}")
-    with open(output_path, "w", encoding="utf-8") as outfile:
-        for result in results:
-            outfile.write(json.dumps(result, ensure_ascii=False) + "\n")
+    pairs = []
+    seen_urls = set()
+
+    def add_audio_url(element, url, fallback_desc=""):
+        audio_url = safe_urljoin(base_url, url)
+        if audio_url and looks_like_audio_url(audio_url) and audio_url not in seen_urls:
+            seen_urls.add(audio_url)
+            description = (
+                element.get("title", "") or surrounding_text(element) or fallback_desc
+            )
+            pairs.append(
+                {
+                    "audio_url": audio_url,
+                    "description": description,
+                    "license": licenses[element],
+                }
+            )
+
+    for top in tops:
+        for audio in top.iter("audio"):
+            src = audio.get("src")
+            if src:
+                add_audio_url(audio, src)
+            for source in audio.iterdescendants("source"):
+                src = source.get("src")
+                if src:
+                    add_audio_url(source, src, fallback_desc=surrounding_text(audio))
+
+    for top in tops:
+        for element in top.iter(CANDIDATE_TAGS):
+            for attr in ["href", "src"]:
+                if attr in element.attrib:
+                    add_audio_url(element, element.get(attr))
+
+    return pairs
+
+
+BACKENDS = {
+    "bs4": extract_audio_url_pairs_bs4,
+    "lxml": extract_audio_url_pairs_lxml,
+}
+
+
+def audio_records(data, backend="lxml", prefilter=True):
+    """goodhtmlの1ページから出力レコードを作る"""
+    url = data["url"]
+    for pair in extract_audio_url_pairs(data["html"], url, backend, prefilter):
+        yield {
+            "audio_url": pair["audio_url"],
+            "description": pair["description"],
+            "license": pair.get("license", ""),
+            "url": url,
+            "title": data["title"],
+            "quality": data["quality"],
+            "text": data["text"],
+        }
+
+
+def process_html(input_path, output_path, backend="lxml", prefilter=True):
+    with JsonlWriter(output_path) as writer:
+        for data in tqdm(read_jsonl(input_path), desc="Processing HTML", unit="line"):
+            for record in audio_records(data, backend, prefilter):
+                writer.write(record)
+    logger.info(f"Extracted {writer.count} audio URL pairs from {input_path}")
 
 
 def parse_args():
@@ -175,6 +337,24 @@ def parse_args():
         action="store_true",
         help="Overwrite existing files",
     )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["lxml", "bs4"],
+        default="lxml",
+        help="HTML parser used for pages that may contain audio links",
+    )
+    parser.add_argument(
+        "--no_prefilter",
+        action="store_true",
+        help="Parse every page, even without audio extensions or <audio> tags",
+    )
+    parser.add_argument(
+        "--lease_dir",
+        type=str,
+        default=None,
+        help="Shared lease directory for running this stage on several nodes",
+    )
 
     return parser.parse_args()
 
@@ -186,11 +366,11 @@ if __name__ == "__main__":
     input_paths = [
         os.path.join(args.input_dir, f)
         for f in os.listdir(args.input_dir)
-        if f.endswith(".jsonl")
+        if is_jsonl(f)
     ]
     input_paths = sorted(input_paths)[: args.max_num_files]
     with ProcessPoolExecutor() as executor:
-        futures = []
+        jobs = []
         for input_path in input_paths:
             output_path = os.path.join(
                 output_dir,
@@ -199,13 +379,20 @@ if __name__ == "__main__":
             if os.path.exists(output_path) and not args.overwrite:
                 logger.info(f"File already exists: {output_path}")
                 continue
-            futures.append(executor.submit(process_html, input_path, output_path))
+            jobs.append(
+                (
+                    os.path.basename(output_path),
+                    process_html,
+                    (input_path, output_path, args.backend, not args.no_prefilter),
+                )
+            )
 
-        for future in tqdm(
-            as_completed(futures),
-            total=len(futures),
+        leases = make_lease_queue(args.lease_dir, "goodhtml2audio", output_dir)
+        for _ in tqdm(
+            run_jobs(executor, jobs, leases),
+            total=len(jobs),
             desc="Processing HTML",
             unit="line",
         ):
-            future.result()
-    logger.info(f"Processed {len(futures)} files.")
+            pass
+    logger.info(f"Processed {len(jobs)} files.")
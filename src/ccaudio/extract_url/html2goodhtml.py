@@ -1,58 +1,204 @@
-import json
+import hashlib
 import os
+import time
 from argparse import ArgumentParser
+from collections import Counter, OrderedDict
 from concurrent.futures import ProcessPoolExecutor
 
 import trafilatura
-from crawl_mm.utils.edu_classifier import QualityClassifier
-from crawl_mm.utils.ja_classifier import is_japanese
 from loguru import logger
+from lxml import etree
 from tqdm import tqdm
+from trafilatura.utils import load_html
 
-model = QualityClassifier()
-
-
-def process_html(input_path, output_path):
-    results = []
-    with open(input_path, "r", encoding="utf-8") as infile:
-        for i, line in tqdm(enumerate(infile), desc="Processing HTML", unit="line"):
-            data = json.loads(line)
-            html = data["html"]
-            url = data["url"]
-            text = trafilatura.extract(
-                html,
-                favor_precision=True,
-                include_comments=False,
-                include_tables=False,
-                deduplicate=True,
-            )
-            if not text:
-                continue
-            try:
-                metadata = trafilatura.extract_metadata(html)
-            except Exception as e:
-                logger.error(f"Metadata extraction error: {e}")
-                continue
-            title = metadata.title
-            if not title:
-                continue
-            if not is_japanese(text):
+from ccaudio.extract_url import ja_detect
+from ccaudio.extract_url.jsonl_io import JsonlWriter, is_jsonl, read_jsonl
+from ccaudio.extract_url.lease import make_lease_queue, run_jobs
+
+# Accepted pages buffered before they are scored and written
+CLASSIFY_BATCH_SIZE = 64
+# Boilerplate pages (error pages, parked domains, ...) repeat across the crawl
+QUALITY_CACHE_SIZE = 100_000
+# Cheap check on the page text before the full extraction. Kept low so that
+# pages whose main content is Japanese are not dropped because of navigation,
+# footers or other boilerplate in another language.
+MIN_JA_RATIO = 0.05
+
+
+def crawl_mm_is_japanese(text: str) -> bool:
+    # crawl_mm is imported only when it is used
+    from crawl_mm.utils.ja_classifier import is_japanese
+
+    return is_japanese(text)
+
+
+# Final language check on the extracted text: the code-point detector in
+# ja_detect, or the classifier from crawl_mm
+JA_DETECTORS = {
+    "builtin": ja_detect.is_japanese,
+    "crawl_mm": crawl_mm_is_japanese,
+}
+VISIBLE_TEXT_XPATH = etree.XPath(
+    "//body//text()[not(ancestor::script or ancestor::style or ancestor::noscript)]"
+)
+
+# Loaded once per worker process by init_worker
+_model = None
+_quality_cache = OrderedDict()
+
+
+def init_worker():
+    global _model
+    from crawl_mm.utils.edu_classifier import QualityClassifier
+
+    _model = QualityClassifier()
+
+
+def get_model():
+    if _model is None:
+        init_worker()
+    return _model
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def classify_texts(texts: list[str]) -> list[float]:
+    """Score texts with the quality classifier, reusing cached scores.
+
+    QualityClassifier scores one text per call; repeated texts in ``texts``
+    and texts scored earlier in this process are not classified again.
+    """
+    keys = [text_key(text) for text in texts]
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key in _quality_cache:
+            _quality_cache.move_to_end(key)
+        else:
+            missing[key] = text
+
+    if missing:
+        model = get_model()
+        scores = [model.classify(text) for text in missing.values()]
+        for key, score in zip(missing, scores):
+            _quality_cache[key] = score
+        while len(_quality_cache) > QUALITY_CACHE_SIZE:
+            _quality_cache.popitem(last=False)
+
+    return [_quality_cache[key] for key in keys]
+
+
+def visible_text(tree) -> str:
+    return " ".join(VISIBLE_TEXT_XPATH(tree))
+
+
+def timed(stats, stage, fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        stats[f"{stage}_seconds"] += time.perf_counter() - start
+
+
+def filter_page(data, stats, min_ja_ratio=MIN_JA_RATIO, ja_detector="crawl_mm"):
+    """Extract the title and text of a page, or None if the page is rejected"""
+    html = data["html"]
+    stats["pages"] += 1
+    # 一度だけパースし、メタデータと本文抽出で同じ木を使う
+    tree = timed(stats, "parse", load_html, html)
+    if tree is None:
+        stats["rejected_parse"] += 1
+        return None
+    try:
+        metadata = timed(stats, "metadata", trafilatura.extract_metadata, tree)
+    except Exception as e:
+        logger.error(f"Metadata extraction error: {e}")
+        stats["rejected_metadata"] += 1
+        return None
+    title = metadata.title
+    if not title:
+        stats["rejected_title"] += 1
+        return None
+    # 本文抽出の前に、日本語の文字がほとんどないページを除外
+    if min_ja_ratio > 0:
+        text = timed(stats, "ja_ratio", visible_text, tree)
+        if timed(stats, "ja_ratio", ja_detect.japanese_ratio, text) < min_ja_ratio:
+            stats["rejected_ja_ratio"] += 1
+            return None
+    text = timed(
+        stats,
+        "extract",
+        trafilatura.extract,
+        tree,
+        favor_precision=True,
+        include_comments=False,
+        include_tables=False,
+        deduplicate=True,
+    )
+    if not text:
+        stats["rejected_text"] += 1
+        return None
+    if not timed(stats, "is_japanese", JA_DETECTORS[ja_detector], text):
+        stats["rejected_is_japanese"] += 1
+        return None
+    return {"title": title, "url": data["url"], "text": text, "html": html}
+
+
+def score_pages(batch, stats):
+    """Add quality scores to pages accepted by filter_page"""
+    texts = [page["text"] for page in batch]
+    qualities = timed(stats, "classify", classify_texts, texts)
+    return [
+        {
+            "title": page["title"],
+            "url": page["url"],
+            "quality": quality,
+            "text": page["text"],
+            "html": page["html"],
+        }
+        for page, quality in zip(batch, qualities)
+    ]
+
+
+def process_html(
+    input_path,
+    output_path,
+    batch_size=CLASSIFY_BATCH_SIZE,
+    min_ja_ratio=MIN_JA_RATIO,
+    ja_detector="crawl_mm",
+):
+    """Filter one JSONL of HTML pages; returns rejection counts and per-stage times"""
+    stats = Counter()
+    batch = []
+    with JsonlWriter(output_path) as writer:
+        for data in tqdm(read_jsonl(input_path), desc="Processing HTML", unit="line"):
+            page = filter_page(data, stats, min_ja_ratio, ja_detector)
+            if page is None:
                 continue
+            batch.append(page)
+            if len(batch) >= batch_size:
+                for record in score_pages(batch, stats):
+                    writer.write(record)
+                batch = []
+        if batch:
+            for record in score_pages(batch, stats):
+                writer.write(record)
+    stats["written"] = writer.count
+    logger.info(f"Processed {writer.count} lines from {input_path} to {output_path}")
+    log_stage_stats(input_path, stats)
+    return stats
 
-            quality = model.classify(text)
 
-            write_data = {
-                "title": title,
-                "url": url,
-                "quality": quality,
-                "text": text,
-                "html": html,
-            }
-            results.append(write_data)
-    with open(output_path, "w", encoding="utf-8") as outfile:
-        for result in results:
-            outfile.write(json.dumps(result, ensure_ascii=False) + "\n")
-    logger.info(f"Processed {len(results)} lines from {input_path} to {output_path}")
+def log_stage_stats(name, stats):
+    stages = [key for key in stats if key.endswith("_seconds")]
+    total = sum(stats[key] for key in stages) or 1.0
+    timings = ", ".join(
+        f"{key[: -len('_seconds')]} {stats[key]:.1f}s ({stats[key] / total:.0%})"
+        for key in stages
+    )
+    rejected = {key: stats[key] for key in stats if key.startswith("rejected_")}
+    logger.info(f"{name}: {stats['pages']} pages, {timings}, {rejected}")
 
 
 def parse_args():
@@ -79,6 +225,31 @@ def parse_args():
         action="store_true",
         help="Overwrite existing files",
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=CLASSIFY_BATCH_SIZE,
+        help="Number of accepted pages scored and written together",
+    )
+    parser.add_argument(
+        "--min_ja_ratio",
+        type=float,
+        default=MIN_JA_RATIO,
+        help="Skip pages whose text has fewer kana/kanji than this (0 disables)",
+    )
+    parser.add_argument(
+        "--ja_detector",
+        type=str,
+        choices=list(JA_DETECTORS),
+        default="crawl_mm",
+        help="Language check on the extracted text (builtin: kana/kanji ratio)",
+    )
+    parser.add_argument(
+        "--lease_dir",
+        type=str,
+        default=None,
+        help="Shared lease directory for running this stage on several nodes",
+    )
     return parser.parse_args()
 
 
@@ -89,18 +260,34 @@ if __name__ == "__main__":
     input_paths = [
         os.path.join(args.input_dir, f)
         for f in os.listdir(args.input_dir)
-        if f.endswith(".jsonl")
+        if is_jsonl(f)
     ]
     input_paths = sorted(input_paths)[: args.max_num_files]
 
-    with ProcessPoolExecutor() as executor:
-        futures = []
+    with ProcessPoolExecutor(initializer=init_worker) as executor:
+        jobs = []
         for input_path in input_paths:
             output_path = os.path.join(output_dir, os.path.basename(input_path))
             if os.path.exists(output_path) and not args.overwrite:
                 logger.info(f"File already exists: {output_path}")
                 continue
-            futures.append(executor.submit(process_html, input_path, output_path))
-        for future in tqdm(futures):
-            future.result()
-    logger.info(f"Processed {len(futures)} files.")
+            jobs.append(
+                (
+                    os.path.basename(output_path),
+                    process_html,
+                    (
+                        input_path,
+                        output_path,
+                        args.batch_size,
+                        args.min_ja_ratio,
+                        args.ja_detector,
+                    ),
+                )
+            )
+        leases = make_lease_queue(args.lease_dir, "html2goodhtml", output_dir)
+        totals = Counter()
+        for _, stats in tqdm(run_jobs(executor, jobs, leases), total=len(jobs)):
+            totals.update(stats)
+    if totals:
+        log_stage_stats("total", totals)
+    logger.info(f"Processed {len(jobs)} files.")
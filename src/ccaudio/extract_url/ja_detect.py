@@ -0,0 +1,121 @@
+"""Fast Japanese text detection from code-point ranges.
+
+Counts kana and CJK ideographs over a sample of the text with NumPy, either
+on the UTF-32 code points of a ``str`` or directly on the lead bytes of a
+UTF-8 buffer, so no decoding is needed for raw payloads. Kana separate
+Japanese from Chinese; the share of kana/kanji among non-space characters
+separates it from everything else.
+"""
+
+from typing import NamedTuple, Union
+
+import numpy as np
+
+# Characters looked at per text, split into windows spread over the text
+SAMPLE_CHARS = 4096
+NUM_WINDOWS = 4
+# Share of kana/kanji among non-space characters
+MIN_JA_RATIO = 0.3
+# Share of kana among kana/kanji (Chinese text has none)
+MIN_KANA_RATIO = 0.1
+# Shorter texts are never detected as Japanese
+MIN_CHARS = 10
+
+
+class ScriptCounts(NamedTuple):
+    chars: int
+    kana: int
+    kanji: int
+
+    @property
+    def japanese(self) -> int:
+        return self.kana + self.kanji
+
+
+def _windows(length: int, sample: int):
+    if length <= sample:
+        return [(0, length)]
+    size = sample // NUM_WINDOWS
+    starts = np.linspace(0, length - size, NUM_WINDOWS).astype(int)
+    return [(int(start), int(start) + size) for start in starts]
+
+
+def _count_code_points(codes: np.ndarray) -> ScriptCounts:
+    spaces = (codes <= 0x20) | (codes == 0xA0) | (codes == 0x3000)
+    # ひらがな・カタカナ (U+3040-U+30FF)
+    kana = (codes >= 0x3040) & (codes <= 0x30FF)
+    # CJK統合漢字拡張A (U+3400-U+4DBF) と CJK統合漢字 (U+4E00-U+9FFF)
+    kanji = ((codes >= 0x3400) & (codes <= 0x4DBF)) | (
+        (codes >= 0x4E00) & (codes <= 0x9FFF)
+    )
+    return ScriptCounts(
+        int(len(codes) - np.count_nonzero(spaces)),
+        int(np.count_nonzero(kana)),
+        int(np.count_nonzero(kanji)),
+    )
+
+
+def _utf8_code_points(data: bytes) -> np.ndarray:
+    """Code points of the 1- and 3-byte sequences of a UTF-8 buffer.
+
+    Other sequences (2- and 4-byte) are returned as 0xFFFF, which is counted
+    as an ordinary character. Continuation bytes are skipped, so a window
+    may start in the middle of a character.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    leads = np.flatnonzero((buf & 0xC0) != 0x80)
+    codes = np.full(len(leads), 0xFFFF, dtype=np.uint32)
+    lead_bytes = buf[leads]
+    ascii_mask = lead_bytes < 0x80
+    codes[ascii_mask] = lead_bytes[ascii_mask]
+    three = np.flatnonzero(((lead_bytes & 0xF0) == 0xE0) & (leads + 2 < len(buf)))
+    at = leads[three]
+    codes[three] = (
+        ((buf[at].astype(np.uint32) & 0x0F) << 12)
+        | ((buf[at + 1].astype(np.uint32) & 0x3F) << 6)
+        | (buf[at + 2].astype(np.uint32) & 0x3F)
+    )
+    return codes
+
+
+def count_scripts(
+    text: Union[str, bytes], sample_chars: int = SAMPLE_CHARS
+) -> ScriptCounts:
+    """Kana, kanji and non-space character counts over a sample of ``text``.
+
+    ``bytes`` are read as UTF-8; a character is about 3 bytes in Japanese
+    text, so 3 * ``sample_chars`` bytes are sampled.
+    """
+    is_bytes = isinstance(text, (bytes, bytearray, memoryview))
+    sample = sample_chars * 3 if is_bytes else sample_chars
+    total = ScriptCounts(0, 0, 0)
+    for start, end in _windows(len(text), sample):
+        if is_bytes:
+            codes = _utf8_code_points(bytes(text[start:end]))
+        else:
+            codes = np.frombuffer(text[start:end].encode("utf-32-le"), np.uint32)
+        counts = _count_code_points(codes)
+        total = ScriptCounts(*(a + b for a, b in zip(total, counts)))
+    return total
+
+
+def japanese_ratio(text: Union[str, bytes], sample_chars: int = SAMPLE_CHARS) -> float:
+    """Share of kana/kanji among the non-space characters of ``text``"""
+    counts = count_scripts(text, sample_chars)
+    return counts.japanese / counts.chars if counts.chars else 0.0
+
+
+def is_japanese(
+    text: Union[str, bytes],
+    min_ratio: float = MIN_JA_RATIO,
+    min_kana_ratio: float = MIN_KANA_RATIO,
+    min_chars: int = MIN_CHARS,
+    sample_chars: int = SAMPLE_CHARS,
+) -> bool:
+    counts = count_scripts(text, sample_chars)
+    if counts.chars < min_chars or counts.japanese == 0:
+        return False
+    return (
+        counts.japanese / counts.chars >= min_ratio
+        and counts.kana / counts.japanese >= min_kana_ratio
+    )
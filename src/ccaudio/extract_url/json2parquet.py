@@ -1,47 +1,246 @@
 import glob
 import os
-from concurrent.futures import ProcessPoolExecutor
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
 from tqdm import tqdm
 
-# 入力と出力ディレクトリ
-input_files = sorted(glob.glob("data/cc/audio/2025-18/*.jsonl"))
-output_dir = "data/cc/audio/2025-18-parquet"
-os.makedirs(output_dir, exist_ok=True)
-
-files_per_group = 100  # 100ファイル単位で処理
-num_workers = 8  # 並列数
-
-# グループ単位で分割
-file_groups = [
-    input_files[i : i + files_per_group]
-    for i in range(0, len(input_files), files_per_group)
-]
-
-
-def process_group(group_idx_and_files):
-    group_idx, files = group_idx_and_files
-    dfs = []
-    for file in files:
-        try:
-            df = pd.read_json(file, lines=True, dtype=False)
-            dfs.append(df)
-        except Exception as e:
-            print(f"[Group {group_idx}] Error in {file}: {e}")
-    if dfs:
-        df_all = pd.concat(dfs, ignore_index=True)
-        out_path = os.path.join(output_dir, f"group_{group_idx:05d}.parquet")
-
-        df_all.to_parquet(out_path, index=False)
-
-
-# 並列実行
-with ProcessPoolExecutor(max_workers=num_workers) as executor:
-    list(
-        tqdm(
-            executor.map(process_group, enumerate(file_groups)),
-            total=len(file_groups),
-            desc="Processing groups",
+from ccaudio.extract_url.jsonl_io import is_jsonl, read_jsonl
+
+# 各ステージの出力スキーマ
+SCHEMAS = {
+    # rss2audio
+    "rss": pa.schema(
+        [
+            ("audio_url", pa.string()),
+            ("title", pa.string()),
+            ("description", pa.string()),
+            ("language", pa.string()),
+            ("page_url", pa.string()),
+        ]
+    ),
+    # goodhtml2audio / pipeline
+    "html": pa.schema(
+        [
+            ("audio_url", pa.string()),
+            ("description", pa.string()),
+            ("license", pa.string()),
+            ("url", pa.string()),
+            ("title", pa.string()),
+            ("quality", pa.float64()),
+            ("text", pa.string()),
+        ]
+    ),
+}
+# 値の種類が少ない列だけ辞書エンコード
+DICTIONARY_COLUMNS = ("language", "license")
+ROW_GROUP_SIZE = 100_000
+MAX_FILE_SIZE_MB = 512
+COMPRESSION_LEVEL = 6
+
+
+class RollingParquetWriter:
+    """Write row groups to numbered parquet files, starting a new file once
+    the current one exceeds ``max_file_size`` bytes.
+
+    Files are written under temporary names and renamed by ``close()``, so
+    the first part of a group exists only if the whole group was written.
+    """
+
+    def __init__(
+        self,
+        path_template,
+        schema,
+        max_file_size=MAX_FILE_SIZE_MB << 20,
+        compression_level=COMPRESSION_LEVEL,
+    ):
+        self.path_template = path_template
+        self.schema = schema
+        self.max_file_size = max_file_size
+        self.compression_level = compression_level
+        self.paths = []
+        self.sink = None
+        self.writer = None
+        self.num_rows = 0
+
+    def _open(self):
+        path = self.path_template.format(part=len(self.paths))
+        self.paths.append(path)
+        self.sink = pa.OSFile(f"{path}.tmp", "wb")
+        self.writer = pq.ParquetWriter(
+            self.sink,
+            self.schema,
+            compression="zstd",
+            compression_level=self.compression_level,
+            use_dictionary=[
+                name for name in DICTIONARY_COLUMNS if name in self.schema.names
+            ],
         )
+
+    def _close_file(self):
+        self.writer.close()
+        self.sink.close()
+        self.writer = None
+        self.sink = None
+
+    def write(self, rows):
+        if self.writer is None:
+            self._open()
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        self.writer.write_table(table, row_group_size=len(rows))
+        self.num_rows += len(rows)
+        if self.sink.tell() >= self.max_file_size:
+            self._close_file()
+
+    def close(self):
+        if self.writer is not None:
+            self._close_file()
+        for path in self.paths:
+            os.replace(f"{path}.tmp", path)
+
+    def abort(self):
+        if self.writer is not None:
+            self._close_file()
+        for path in self.paths:
+            if os.path.exists(f"{path}.tmp"):
+                os.unlink(f"{path}.tmp")
+
+
+def convert_group(
+    input_paths,
+    path_template,
+    schema_name,
+    row_group_size=ROW_GROUP_SIZE,
+    max_file_size=MAX_FILE_SIZE_MB << 20,
+    compression_level=COMPRESSION_LEVEL,
+):
+    """JSONLファイル群をストリーミングでparquetに変換（メモリは行グループ分のみ）"""
+    writer = RollingParquetWriter(
+        path_template, SCHEMAS[schema_name], max_file_size, compression_level
     )
+    rows = []
+    try:
+        for input_path in input_paths:
+            try:
+                for record in read_jsonl(input_path):
+                    rows.append(record)
+                    if len(rows) >= row_group_size:
+                        writer.write(rows)
+                        rows = []
+            except (OSError, ValueError, EOFError) as e:
+                # 壊れたファイルは読めたところまで使う
+                logger.error(f"Error in {input_path}: {e}")
+        if rows:
+            writer.write(rows)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.num_rows
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        default="data/cc/audio/2025-18",
+        help="Directory containing JSONL files",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="data/cc/audio/2025-18-parquet",
+        help="Output directory for parquet files",
+    )
+    parser.add_argument(
+        "--schema",
+        type=str,
+        choices=list(SCHEMAS),
+        default="rss",
+        help="Output schema (rss: rss2audio, html: goodhtml2audio/pipeline)",
+    )
+    parser.add_argument(
+        "--files_per_group",
+        type=int,
+        default=100,
+        help="Number of JSONL files converted by one task",
+    )
+    parser.add_argument(
+        "--row_group_size",
+        type=int,
+        default=ROW_GROUP_SIZE,
+        help="Rows per parquet row group (also the rows held in memory per task)",
+    )
+    parser.add_argument(
+        "--max_file_size",
+        type=int,
+        default=MAX_FILE_SIZE_MB,
+        help="Start a new parquet file once the current one exceeds this (MB)",
+    )
+    parser.add_argument(
+        "--compression_level",
+        type=int,
+        default=COMPRESSION_LEVEL,
+        help="zstd compression level",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=8,
+        help="Number of parallel workers",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Overwrite existing files",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    # *.jsonl*は書き込み途中で止まった*.jsonl.gz.tmp.<pid>にも一致する
+    input_files = sorted(
+        path
+        for path in glob.glob(os.path.join(args.input_dir, "*.jsonl*"))
+        if is_jsonl(path)
+    )
+    file_groups = [
+        input_files[i : i + args.files_per_group]
+        for i in range(0, len(input_files), args.files_per_group)
+    ]
+
+    with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
+        futures = []
+        for group_idx, files in enumerate(file_groups):
+            path_template = os.path.join(
+                args.output_dir, f"group_{group_idx:05d}_{{part:03d}}.parquet"
+            )
+            first_path = path_template.format(part=0)
+            if os.path.exists(first_path) and not args.overwrite:
+                logger.info(f"File already exists: {first_path}")
+                continue
+            futures.append(
+                executor.submit(
+                    convert_group,
+                    files,
+                    path_template,
+                    args.schema,
+                    args.row_group_size,
+                    args.max_file_size << 20,
+                    args.compression_level,
+                )
+            )
+        num_rows = 0
+        for future in tqdm(
+            as_completed(futures),
+            total=len(futures),
+            desc="Processing groups",
+        ):
+            num_rows += future.result()
+    logger.info(f"Converted {num_rows} rows in {len(futures)} groups.")
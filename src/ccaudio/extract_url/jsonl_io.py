@@ -0,0 +1,97 @@
+import gzip
+import io
+import json
+import os
+from typing import IO, Iterator, Optional
+
+JSONL_SUFFIXES = {
+    "none": ".jsonl",
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst",
+}
+COMPRESSIONS = tuple(JSONL_SUFFIXES)
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 6
+
+
+def is_jsonl(path: str) -> bool:
+    return path.endswith(tuple(JSONL_SUFFIXES.values()))
+
+
+def infer_compression(path: str) -> str:
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return "none"
+
+
+def jsonl_name(name: str, compression: str) -> str:
+    """Turn a WARC or JSONL file name into a JSONL name with ``compression``"""
+    for suffix in (".warc.gz", *JSONL_SUFFIXES.values()):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    return name + JSONL_SUFFIXES[compression]
+
+
+def open_text(path: str, mode: str, compression: Optional[str] = None) -> IO[str]:
+    """Open a (possibly compressed) text file; ``mode`` is "r" or "w"."""
+    compression = compression or infer_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "zstd compression requires the 'zstandard' package"
+            ) from e
+        raw = open(path, mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    with open_text(path, "r") as infile:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+
+class JsonlWriter:
+    """Write records one by one to a (possibly compressed) JSONL file.
+
+    Records go to a temporary file next to ``path`` which is renamed into
+    place only when the ``with`` block exits cleanly, so ``path`` either does
+    not exist or holds a complete output.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        self.path = path
+        self.compression = compression or infer_compression(path)
+        self.tmp_path = f"{path}.tmp.{os.getpid()}"
+        self.outfile = None
+        self.count = 0
+
+    def __enter__(self):
+        self.outfile = open_text(self.tmp_path, "w", self.compression)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        assert self.outfile is not None
+        self.outfile.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+    def write(self, record: dict) -> None:
+        assert self.outfile is not None
+        self.outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
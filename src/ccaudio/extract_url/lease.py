@@ -0,0 +1,304 @@
+"""File leases on a shared filesystem for running a stage on several nodes.
+
+Every unit of work (one output file) is claimed by creating
+``<key>.lease`` with ``O_EXCL``; the owner refreshes its mtime from a
+heartbeat thread and writes ``<key>.done`` once the output is in place.
+A lease whose mtime is older than ``ttl`` belongs to a crashed node: it is
+renamed away and the work is claimed again.
+
+Outputs are still written atomically, so in the rare race where a live
+lease is reclaimed the work is done twice but no file is left half written.
+Leases compare mtimes with the local clock; ``ttl`` should be much larger
+than the clock skew between nodes.
+
+    uv run python src/ccaudio/extract_url/lease.py status --lease_dir data/cc/leases
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from typing import NamedTuple, Optional
+
+from loguru import logger
+
+LEASE_SUFFIX = ".lease"
+DONE_SUFFIX = ".done"
+TTL_SECONDS = 600
+HEARTBEAT_SECONDS = 60
+# How often leases held by other nodes are tried again
+POLL_SECONDS = 30
+PROGRESS_SECONDS = 300
+
+
+class Lease(NamedTuple):
+    key: str
+    path: str
+    token: str
+
+
+def read_token(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return json.load(f).get("token")
+    except (OSError, ValueError):
+        return None
+
+
+class LeaseQueue:
+    """Leases for the work units of one stage, stored in ``lease_dir``"""
+
+    def __init__(
+        self,
+        lease_dir: str,
+        ttl: float = TTL_SECONDS,
+        heartbeat: float = HEARTBEAT_SECONDS,
+        poll: float = POLL_SECONDS,
+    ):
+        self.lease_dir = lease_dir
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.poll = poll
+        self.owner = {"host": socket.gethostname(), "pid": os.getpid()}
+        self.held = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_progress = time.monotonic()
+        os.makedirs(lease_dir, exist_ok=True)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.lease_dir, key + suffix)
+
+    def is_done(self, key: str) -> bool:
+        return os.path.exists(self._path(key, DONE_SUFFIX))
+
+    def claim(self, key: str) -> Optional[Lease]:
+        """Take the lease of ``key``, or None if it is done or held by a live owner"""
+        if self.is_done(key):
+            return None
+        path = self._path(key, LEASE_SUFFIX)
+        token = uuid.uuid4().hex
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._reclaim_expired(path):
+                    return None
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump({"token": token, "claimed_at": time.time(), **self.owner}, f)
+            # The previous owner may have finished just before its lease expired
+            if self.is_done(key):
+                os.unlink(path)
+                return None
+            lease = Lease(key, path, token)
+            with self._lock:
+                self.held[key] = lease
+            return lease
+        return None
+
+    def _reclaim_expired(self, path: str) -> bool:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return True
+        if time.time() - mtime < self.ttl:
+            return False
+        stale_token = read_token(path)
+        tombstone = f"{path}.expired.{uuid.uuid4().hex}"
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            # Someone else reclaimed it first
+            return True
+        if read_token(tombstone) != stale_token:
+            # We moved a lease that was just created by another node; put it back
+            try:
+                os.link(tombstone, path)
+            except FileExistsError:
+                pass
+        os.unlink(tombstone)
+        logger.warning(f"Reclaimed expired lease {path}")
+        return True
+
+    def complete(self, lease: Lease) -> None:
+        with open(self._path(lease.key, DONE_SUFFIX), "w") as f:
+            json.dump({"finished_at": time.time(), **self.owner}, f)
+        self.release(lease)
+
+    def release(self, lease: Lease) -> None:
+        with self._lock:
+            self.held.pop(lease.key, None)
+        if read_token(lease.path) == lease.token:
+            try:
+                os.unlink(lease.path)
+            except FileNotFoundError:
+                pass
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.heartbeat):
+            with self._lock:
+                leases = list(self.held.values())
+            for lease in leases:
+                try:
+                    os.utime(lease.path)
+                except FileNotFoundError:
+                    logger.warning(f"Lost lease {lease.path}")
+
+    def __enter__(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            leases = list(self.held.values())
+        for lease in leases:
+            self.release(lease)
+
+    def log_progress(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._last_progress < PROGRESS_SECONDS:
+            return
+        self._last_progress = time.monotonic()
+        status = lease_status(self.lease_dir, self.ttl)
+        logger.info(
+            f"{self.lease_dir}: {status['done']} done, {status['active']} running "
+            f"on {len(status['hosts'])} hosts, {status['expired']} expired"
+        )
+
+    def run(self, executor, jobs, max_pending: Optional[int] = None):
+        """Submit ``jobs`` (key, fn, args) whose lease we get; yield (key, result).
+
+        Jobs leased by other nodes are tried again every ``poll`` seconds
+        until they are done, so work left by a crashed node is picked up once
+        its lease expires. A failing job releases its lease and re-raises.
+        """
+        max_pending = max_pending or 2 * (os.cpu_count() or 1)
+        waiting = deque(jobs)
+        busy = []
+        running = {}
+        last_poll = time.monotonic()
+        with self:
+            while waiting or busy or running:
+                while waiting and len(running) < max_pending:
+                    key, fn, args = waiting.popleft()
+                    if self.is_done(key):
+                        continue
+                    lease = self.claim(key)
+                    if lease is None:
+                        if not self.is_done(key):
+                            busy.append((key, fn, args))
+                        continue
+                    running[executor.submit(fn, *args)] = lease
+
+                if running:
+                    finished, _ = wait(
+                        running, timeout=self.poll, return_when=FIRST_COMPLETED
+                    )
+                    for future in finished:
+                        lease = running.pop(future)
+                        try:
+                            result = future.result()
+                        except BaseException:
+                            self.release(lease)
+                            raise
+                        self.complete(lease)
+                        yield lease.key, result
+                elif busy:
+                    time.sleep(max(0.0, self.poll - (time.monotonic() - last_poll)))
+
+                if busy and not waiting and time.monotonic() - last_poll >= self.poll:
+                    waiting.extend(busy)
+                    busy = []
+                    last_poll = time.monotonic()
+                self.log_progress()
+        self.log_progress(force=True)
+
+
+def make_lease_queue(lease_dir, stage, output_dir) -> Optional[LeaseQueue]:
+    """Lease queue of a stage for one output directory (None without --lease_dir)"""
+    if not lease_dir:
+        return None
+    return LeaseQueue(
+        os.path.join(lease_dir, stage, os.path.basename(os.path.normpath(output_dir)))
+    )
+
+
+def run_jobs(
+    executor,
+    jobs,
+    leases: Optional[LeaseQueue] = None,
+    max_pending: Optional[int] = None,
+):
+    """Run (key, fn, args) jobs on ``executor``; yield (key, result) as they finish"""
+    if leases is not None:
+        yield from leases.run(executor, jobs, max_pending)
+        return
+    futures = {executor.submit(fn, *args): key for key, fn, args in jobs}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+def lease_status(lease_dir: str, ttl: float = TTL_SECONDS) -> dict:
+    status = {"done": 0, "active": 0, "expired": 0, "hosts": set()}
+    now = time.time()
+    with os.scandir(lease_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(DONE_SUFFIX):
+                status["done"] += 1
+            elif entry.name.endswith(LEASE_SUFFIX):
+                try:
+                    age = now - entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if age < ttl:
+                    status["active"] += 1
+                    try:
+                        with open(entry.path) as f:
+                            status["hosts"].add(json.load(f).get("host"))
+                    except (OSError, ValueError):
+                        pass
+                else:
+                    status["expired"] += 1
+    return status
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument("command", choices=["status"])
+    parser.add_argument(
+        "--lease_dir",
+        type=str,
+        default="data/cc/leases",
+        help="Lease directory shared by all nodes",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=TTL_SECONDS,
+        help="Seconds after which a lease without heartbeat is expired",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for root, _, files in sorted(os.walk(args.lease_dir)):
+        if not any(f.endswith((LEASE_SUFFIX, DONE_SUFFIX)) for f in files):
+            continue
+        status = lease_status(root, args.ttl)
+        hosts = ", ".join(sorted(h for h in status["hosts"] if h))
+        print(
+            f"{os.path.relpath(root, args.lease_dir)}: {status['done']} done, "
+            f"{status['active']} running, {status['expired']} expired"
+            + (f" ({hosts})" if hosts else "")
+        )
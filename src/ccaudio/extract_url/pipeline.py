@@ -0,0 +1,466 @@
+"""Run url2html → html2goodhtml → goodhtml2audio as one streaming pipeline.
+
+Scanner processes read WARCs and put batches of Japanese HTML pages on a
+bounded queue; worker processes filter and score the pages and extract the
+audio links; the main process writes one output file per WARC. Intermediate
+HTML is kept only if asked for with ``--persist``.
+
+Each WARC's output is renamed into place once all of its batches have been
+written, so an interrupted run resumes at WARC granularity.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+from argparse import ArgumentParser
+from collections import Counter
+from contextlib import ExitStack
+
+from loguru import logger
+from tqdm import tqdm
+
+from ccaudio.extract_url.cc_index import query_index, warc_filename_of
+from ccaudio.extract_url.goodhtml2audio import audio_records
+from ccaudio.extract_url.html2goodhtml import (
+    JA_DETECTORS,
+    MIN_JA_RATIO,
+    filter_page,
+    init_worker,
+    log_stage_stats,
+    score_pages,
+)
+from ccaudio.extract_url.jsonl_io import COMPRESSIONS, JsonlWriter, jsonl_name
+from ccaudio.extract_url.url2html import JapaneseHtmlHandler, log_prefilter_stats
+from ccaudio.extract_url.warc_scanner import iter_responses
+
+PERSIST_STAGES = ("html", "goodhtml")
+BATCH_SIZE = 64
+QUEUE_SIZE = 32
+# How often the main process checks that its children are still alive
+MONITOR_SECONDS = 30
+
+
+def run_scanner(task_queue, page_queue, result_queue, batch_size, prefilter):
+    """Scan WARCs from ``task_queue`` and send their HTML pages downstream.
+
+    A ``scanned`` message with the number of batches sent closes each WARC.
+    """
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        input_path, ranges, html_output_path = task
+        handler = JapaneseHtmlHandler(prefilter=prefilter)
+        num_pages = 0
+        num_batches = 0
+        try:
+            with ExitStack() as stack:
+                html_writer = None
+                if html_output_path:
+                    html_writer = stack.enter_context(JsonlWriter(html_output_path))
+                batch = []
+                for record, payload in iter_responses(input_path, ranges):
+                    handler.stats["records"] += 1
+                    for page in handler.process(record, payload):
+                        if html_writer is not None:
+                            html_writer.write(page)
+                        num_pages += 1
+                        batch.append(page)
+                        if len(batch) >= batch_size:
+                            page_queue.put((input_path, batch))
+                            num_batches += 1
+                            batch = []
+                if batch:
+                    page_queue.put((input_path, batch))
+                    num_batches += 1
+        except Exception as e:
+            logger.exception(f"Failed to scan {input_path}")
+            result_queue.put(("failed", input_path, repr(e)))
+            continue
+        handler.stats["written"] = num_pages
+        log_prefilter_stats(input_path, handler.stats)
+        result_queue.put(("scanned", input_path, num_batches, handler.stats))
+
+
+def run_worker(
+    page_queue, result_queue, min_ja_ratio, ja_detector, backend, keep_goodhtml
+):
+    """Filter and score page batches and extract their audio links"""
+    init_worker()
+    while True:
+        item = page_queue.get()
+        if item is None:
+            break
+        input_path, pages = item
+        stats = Counter()
+        try:
+            accepted = []
+            for data in pages:
+                page = filter_page(data, stats, min_ja_ratio, ja_detector)
+                if page is not None:
+                    accepted.append(page)
+            goodhtml = score_pages(accepted, stats) if accepted else []
+            records = []
+            for data in goodhtml:
+                records.extend(audio_records(data, backend))
+        except Exception as e:
+            logger.exception(f"Failed to process a batch of {input_path}")
+            result_queue.put(("failed", input_path, repr(e)))
+            continue
+        result_queue.put(
+            (
+                "results",
+                input_path,
+                records,
+                goodhtml if keep_goodhtml else None,
+                stats,
+            )
+        )
+
+
+class WarcOutput:
+    """Output files of one WARC, renamed into place once every batch arrived"""
+
+    def __init__(self, output_path, goodhtml_output_path=None):
+        self.stack = ExitStack()
+        self.writer = self.stack.enter_context(JsonlWriter(output_path))
+        self.goodhtml_writer = None
+        if goodhtml_output_path:
+            self.goodhtml_writer = self.stack.enter_context(
+                JsonlWriter(goodhtml_output_path)
+            )
+        self.num_batches = 0
+        self.expected_batches = None
+
+    @property
+    def done(self):
+        return self.num_batches == self.expected_batches
+
+    def write(self, records, goodhtml):
+        for record in records:
+            self.writer.write(record)
+        if self.goodhtml_writer is not None:
+            for record in goodhtml:
+                self.goodhtml_writer.write(record)
+        self.num_batches += 1
+
+    def commit(self):
+        self.stack.close()
+
+    def discard(self, message):
+        # JsonlWriter removes its temporary file when exiting with an error
+        error = RuntimeError(message)
+        self.stack.__exit__(RuntimeError, error, None)
+
+
+def check_processes(processes):
+    for process in processes:
+        if process.exitcode not in (None, 0):
+            raise RuntimeError(f"{process.name} exited with code {process.exitcode}")
+
+
+def put_draining(target_queue, item, result_queue):
+    """Put ``item`` while discarding results, so that no child blocks on a put"""
+    while True:
+        try:
+            target_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            drain(result_queue)
+
+
+def drain(result_queue):
+    try:
+        while True:
+            result_queue.get(timeout=0.1)
+    except queue.Empty:
+        pass
+
+
+def run_pipeline(tasks, output_paths, goodhtml_paths, args):
+    """Process ``tasks`` (input path, ranges, html output path) and write outputs.
+
+    Returns the number of WARCs that failed; they have no output and are
+    picked up again by the next run.
+    """
+    task_queue = mp.Queue()
+    page_queue = mp.Queue(maxsize=args.queue_size)
+    result_queue = mp.Queue(maxsize=args.queue_size)
+    scanners = [
+        mp.Process(
+            target=run_scanner,
+            args=(
+                task_queue,
+                page_queue,
+                result_queue,
+                args.batch_size,
+                not args.no_prefilter,
+            ),
+            name=f"scanner-{i}",
+        )
+        for i in range(args.num_scanners)
+    ]
+    workers = [
+        mp.Process(
+            target=run_worker,
+            args=(
+                page_queue,
+                result_queue,
+                args.min_ja_ratio,
+                args.ja_detector,
+                args.backend,
+                "goodhtml" in args.persist,
+            ),
+            name=f"worker-{i}",
+        )
+        for i in range(args.num_workers)
+    ]
+    processes = scanners + workers
+    for process in processes:
+        process.start()
+    for task in tasks:
+        task_queue.put(task)
+    for _ in scanners:
+        task_queue.put(None)
+
+    outputs = {}
+    finished = set()
+    scan_stats = Counter()
+    filter_stats = Counter()
+    num_failed = 0
+    progress = tqdm(total=len(tasks), desc="Processing WARC", unit="file")
+    try:
+        while len(finished) < len(tasks):
+            try:
+                message = result_queue.get(timeout=MONITOR_SECONDS)
+            except queue.Empty:
+                check_processes(processes)
+                continue
+            kind, input_path = message[:2]
+            if input_path in finished:
+                # Late batches of a WARC that already failed
+                continue
+            if kind == "failed":
+                if input_path in outputs:
+                    outputs.pop(input_path).discard(message[2])
+                logger.error(f"Giving up on {input_path}: {message[2]}")
+                finished.add(input_path)
+                num_failed += 1
+                progress.update()
+                continue
+
+            if input_path not in outputs:
+                outputs[input_path] = WarcOutput(
+                    output_paths[input_path], goodhtml_paths.get(input_path)
+                )
+            output = outputs[input_path]
+            if kind == "scanned":
+                output.expected_batches = message[2]
+                scan_stats.update(message[3])
+            else:
+                records, goodhtml, stats = message[2:]
+                output.write(records, goodhtml)
+                filter_stats.update(stats)
+            if output.done:
+                outputs.pop(input_path).commit()
+                finished.add(input_path)
+                progress.update()
+    except BaseException:
+        for output in outputs.values():
+            output.discard("pipeline interrupted")
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        progress.close()
+
+    # Batches of failed WARCs may still be in flight; discard their results
+    for _ in workers:
+        put_draining(page_queue, None, result_queue)
+    while any(process.is_alive() for process in processes):
+        drain(result_queue)
+    for process in processes:
+        process.join()
+
+    logger.info(f"html: {dict(scan_stats)}")
+    if filter_stats:
+        log_stage_stats("goodhtml", filter_stats)
+    return num_failed
+
+
+def plan_tasks(
+    input_paths,
+    output_dir,
+    html_output_dir,
+    goodhtml_output_dir,
+    args,
+    ranges_by_warc=None,
+):
+    """Tasks of the WARCs without a committed output, and their output paths"""
+    tasks = []
+    output_paths = {}
+    goodhtml_paths = {}
+    for input_path in input_paths:
+        name = jsonl_name(os.path.basename(input_path), args.compression)
+        output_path = os.path.join(output_dir, name)
+        # 最終出力があるWARCは処理済み
+        if os.path.exists(output_path) and not args.overwrite:
+            logger.info(f"File already exists: {output_path}")
+            continue
+        output_paths[input_path] = output_path
+        if "goodhtml" in args.persist:
+            goodhtml_paths[input_path] = os.path.join(goodhtml_output_dir, name)
+        html_output_path = None
+        if "html" in args.persist:
+            html_output_path = os.path.join(html_output_dir, name)
+        ranges = None
+        if ranges_by_warc is not None:
+            ranges = ranges_by_warc.get(warc_filename_of(input_path), [])
+        tasks.append((input_path, ranges, html_output_path))
+    return tasks, output_paths, goodhtml_paths
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--input_file",
+        type=str,
+        default="data/cc/url/2025-18.txt",
+        help="File containing urls of warc files",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="data/cc/html_audio",
+        help="Output directory for audio URLs found in HTML pages",
+    )
+    parser.add_argument(
+        "--persist",
+        type=str,
+        nargs="*",
+        choices=PERSIST_STAGES,
+        default=[],
+        help="Intermediate outputs to keep on disk",
+    )
+    parser.add_argument(
+        "--html_output_dir",
+        type=str,
+        default="data/cc/html",
+        help="Output directory for Japanese HTML pages (with --persist html)",
+    )
+    parser.add_argument(
+        "--goodhtml_output_dir",
+        type=str,
+        default="data/cc/goodhtml",
+        help="Output directory for filtered HTML pages (with --persist goodhtml)",
+    )
+    parser.add_argument(
+        "--max_num_files",
+        type=int,
+        default=None,
+        help="Maximum number of WARC files to process",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Overwrite existing files",
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=COMPRESSIONS,
+        default="gzip",
+        help="Compression of the output JSONL files",
+    )
+    parser.add_argument(
+        "--num_scanners",
+        type=int,
+        default=2,
+        help="Processes reading WARCs",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 1) - 2),
+        help="Processes filtering pages and extracting audio links",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Pages per batch passed between processes",
+    )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=QUEUE_SIZE,
+        help="Batches buffered between stages",
+    )
+    parser.add_argument(
+        "--no_prefilter",
+        action="store_true",
+        help="Decode every HTML payload (baseline for measuring the prefilter)",
+    )
+    parser.add_argument(
+        "--min_ja_ratio",
+        type=float,
+        default=MIN_JA_RATIO,
+        help="Skip pages whose text has fewer kana/kanji than this (0 disables)",
+    )
+    parser.add_argument(
+        "--ja_detector",
+        type=str,
+        choices=list(JA_DETECTORS),
+        default="crawl_mm",
+        help="Language check on the extracted text (builtin: kana/kanji ratio)",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["lxml", "bs4"],
+        default="lxml",
+        help="HTML parser used for pages that may contain audio links",
+    )
+    parser.add_argument(
+        "--index_path",
+        type=str,
+        default=None,
+        help="Common Crawl columnar index (parquet); fetch only matching records",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    snapshot = os.path.basename(args.input_file).split(".")[0]
+    output_dir = os.path.join(args.output_dir, snapshot)
+    html_output_dir = os.path.join(args.html_output_dir, snapshot)
+    goodhtml_output_dir = os.path.join(args.goodhtml_output_dir, snapshot)
+    os.makedirs(output_dir, exist_ok=True)
+    if "html" in args.persist:
+        os.makedirs(html_output_dir, exist_ok=True)
+    if "goodhtml" in args.persist:
+        os.makedirs(goodhtml_output_dir, exist_ok=True)
+    with open(args.input_file, "r") as f:
+        input_paths = f.readlines()
+    input_paths = [url.strip() for url in input_paths]
+    input_paths = input_paths[: args.max_num_files]
+    ranges_by_warc = None
+    if args.index_path:
+        ranges_by_warc = query_index(
+            args.index_path,
+            JapaneseHtmlHandler.mime_types,
+            JapaneseHtmlHandler.index_languages,
+            [warc_filename_of(path) for path in input_paths],
+        )
+
+    tasks, output_paths, goodhtml_paths = plan_tasks(
+        input_paths,
+        output_dir,
+        html_output_dir,
+        goodhtml_output_dir,
+        args,
+        ranges_by_warc,
+    )
+    num_failed = run_pipeline(tasks, output_paths, goodhtml_paths, args)
+    logger.info(f"Processed {len(tasks) - num_failed} files, {num_failed} failed.")
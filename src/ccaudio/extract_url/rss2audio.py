@@ -1,32 +1,61 @@
-import json
+import io
 import os
 import re
 from argparse import ArgumentParser
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 
-import requests
 from bs4 import BeautifulSoup
 from loguru import logger
+from lxml import etree
 from tqdm import tqdm
-from warcio.archiveiterator import ArchiveIterator
 
+from ccaudio.extract_url.cc_index import FEED_MIME_TYPES, query_index, warc_filename_of
+from ccaudio.extract_url.feed_cache import FeedCache
+from ccaudio.extract_url.fetch import (
+    PrefetchExecutor,
+    add_fetch_args,
+    resolve_location,
+)
+from ccaudio.extract_url.jsonl_io import COMPRESSIONS, jsonl_name
+from ccaudio.extract_url.lease import make_lease_queue, run_jobs
+from ccaudio.extract_url.warc_scanner import WarcHandler, scan_warc
 
-def is_rss_feed(http_headers, payload):
-    """RSS/Atomかどうか判定"""
-    ctype = http_headers.get_header("Content-Type") or ""
-    if "rss+xml" in ctype or "atom+xml" in ctype or "xml" in ctype:
-        return True
-    if (
-        payload.strip().startswith(b"<?xml")
-        or payload.strip().startswith(b"<rss")
-        or payload.strip().startswith(b"<feed")
-    ):
+AUDIO_URL_REGEX = re.compile(r"\.(mp3|m4a|aac|wav|ogg|flac)$")
+
+# Payload prefix inspected when the Content-Type does not say XML
+FEED_SNIFF_BYTES = 512
+FEED_SIGNATURES = (b"<?xml", b"<rss", b"<feed")
+# Content types that never carry a feed; rejected before reading the payload
+NON_FEED_CONTENT_TYPES = (
+    "image/",
+    "audio/",
+    "video/",
+    "font/",
+    "application/pdf",
+    "application/zip",
+)
+
+
+def is_feed_content_type(http_headers):
+    """Content-Typeのみで判定: True/False、判定できなければNone"""
+    ctype = (http_headers.get_header("Content-Type") or "").lower()
+    if "xml" in ctype:
         return True
-    return False
+    if ctype.startswith(NON_FEED_CONTENT_TYPES):
+        return False
+    return None
 
 
-def extract_audio_urls_from_rss(xml_content):
-    """RSS XMLから音声URL・タイトル・説明を<item>ごとに抽出"""
+def is_rss_feed(http_headers, payload):
+    """RSS/Atomかどうか判定 (payloadは先頭の数百バイトで十分)"""
+    by_content_type = is_feed_content_type(http_headers)
+    if by_content_type is not None:
+        return by_content_type
+    return payload[:FEED_SNIFF_BYTES].lstrip().startswith(FEED_SIGNATURES)
+
+
+def extract_audio_urls_from_rss_soup(xml_content):
+    """RSS XMLから音声URL・タイトル・説明を<item>ごとに抽出 (BeautifulSoup版)"""
     soup = BeautifulSoup(xml_content, "xml")
     entries = []
 
@@ -46,7 +75,7 @@ def extract_audio_urls_from_rss(xml_content):
             if media and media.get("url"):
                 url = media.get("url")
 
-        if url and re.search(r"\.(mp3|m4a|aac|wav|ogg|flac)$", url):
+        if url and AUDIO_URL_REGEX.search(url):
             title = item.find("title")
             description = item.find("description")
 
@@ -62,40 +91,175 @@ def extract_audio_urls_from_rss(xml_content):
     return entries
 
 
-def extract_from_warc(input_path, output_path):
-    """WARCからRSSフィードを探し音声URLを抽出"""
-    results = []
-    with requests.get(input_path, stream=True) as r:
-        r.raise_for_status()
-        for record in ArchiveIterator(r.raw):
-            if record.rec_type != "response":
-                continue
-            http_headers = record.http_headers
-            payload = record.content_stream().read()
+def _names(element):
+    """(local name, prefixed name) of an element, as BeautifulSoup matches them"""
+    tag = element.tag
+    if not isinstance(tag, str):
+        return None, None
+    # Undeclared prefixes stay in the tag ("x:title"); BeautifulSoup drops them
+    local = tag.rsplit("}", 1)[-1].rsplit(":", 1)[-1]
+    prefix = element.prefix
+    return local, f"{prefix}:{local}" if prefix else local
+
 
-            if not is_rss_feed(http_headers, payload):
+def extract_audio_urls_from_rss(xml_content):
+    """RSS XMLから音声URL・タイトル・説明を<item>ごとに抽出.
+
+    Streams the document with lxml's iterparse instead of building a tree and
+    frees every <item> once it has been read. The output is the same as
+    ``extract_audio_urls_from_rss_soup``: the first matching descendant of
+    each <item> is used, and tags match by local name except
+    ``media:content``.
+    """
+    entries = []
+    language = None
+    channel_state = None  # None -> "open" -> "closed" for the first <channel>
+    channel_depth = None
+    language_element = None
+    item = None  # state of the <item> being read
+    item_depth = None
+    depth = 0
+
+    try:
+        context = etree.iterparse(
+            io.BytesIO(xml_content),
+            events=("start", "end"),
+            recover=True,
+            resolve_entities=False,
+            no_network=True,
+            huge_tree=True,
+        )
+        for event, element in context:
+            local, qualified = _names(element)
+            if event == "start":
+                depth += 1
+                if local is None:
+                    continue
+                if local == "channel" and channel_state is None:
+                    channel_state = "open"
+                    channel_depth = depth
+                elif (
+                    local == "language"
+                    and channel_state == "open"
+                    and language_element is None
+                ):
+                    language_element = element
+
+                if item is None:
+                    if local == "item":
+                        item = {}
+                        item_depth = depth
+                    continue
+                if local == "enclosure" and "enclosure" not in item:
+                    item["enclosure"] = element.get("url")
+                elif qualified == "media:content" and "media" not in item:
+                    item["media"] = element.get("url")
+                elif local in ("title", "description") and local not in item:
+                    item[local] = element
                 continue
 
-            try:
-                entries = extract_audio_urls_from_rss(payload)
-                if entries:
-                    page_url = record.rec_headers.get_header("WARC-Target-URI")
-
-                    for entry in entries:
-                        results.append(
-                            {
-                                "audio_url": entry["audio_url"],
-                                "title": entry["title"],
-                                "description": entry["description"],
-                                "language": entry["language"],
-                                "page_url": page_url,
-                            }
-                        )
-            except Exception as e:
-                print(f"[!] Parse error: {e}")
-    with open(output_path, "w", encoding="utf-8") as outfile:
-        for result in results:
-            outfile.write(json.dumps(result, ensure_ascii=False) + "\n")
+            # end event
+            if element is language_element:
+                language = "".join(element.itertext()).strip()
+            if channel_state == "open" and depth == channel_depth:
+                channel_state = "closed"
+            if item is not None and depth == item_depth and local == "item":
+                url = item.get("enclosure") or item.get("media")
+                if url and AUDIO_URL_REGEX.search(url):
+                    entries.append(
+                        {
+                            "audio_url": url,
+                            "title": _text(item.get("title")),
+                            "description": _text(item.get("description")),
+                        }
+                    )
+                item = None
+                item_depth = None
+                # Drop the parsed item and its predecessors to keep memory flat
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+            depth -= 1
+
+    except etree.XMLSyntaxError:
+        # Nothing recoverable for lxml, e.g. an empty document
+        return extract_audio_urls_from_rss_soup(xml_content)
+
+    for entry in entries:
+        entry["language"] = language if language else ""
+    return entries
+
+
+def _text(element):
+    return "".join(element.itertext()).strip() if element is not None else ""
+
+
+class RssFeedHandler(WarcHandler):
+    """RSS/Atomフィードから音声URLを抽出"""
+
+    name = "rss"
+    mime_types = FEED_MIME_TYPES
+
+    def __init__(self, feed_cache_path=None):
+        super().__init__()
+        # 過去のWARC・スナップショットで処理済みのフィードとエピソードを除外
+        self.feed_cache = FeedCache(feed_cache_path) if feed_cache_path else None
+
+    def process(self, record, payload):
+        http_headers = record.http_headers
+        by_content_type = is_feed_content_type(http_headers)
+        if by_content_type is False:
+            self.stats["rejected_by_headers"] += 1
+            return
+        if by_content_type is None:
+            if not is_rss_feed(http_headers, payload.head(FEED_SNIFF_BYTES)):
+                self.stats["rejected_by_sniff"] += 1
+                return
+        payload = payload.read()
+        self.stats["feeds"] += 1
+        page_url = record.rec_headers.get_header("WARC-Target-URI")
+        if self.feed_cache is not None and self.feed_cache.seen_feed(page_url, payload):
+            self.stats["unchanged_feeds"] += 1
+            return
+
+        try:
+            entries = extract_audio_urls_from_rss(payload)
+        except Exception as e:
+            self.stats["parse_errors"] += 1
+            print(f"[!] Parse error: {e}")
+            return
+        if self.feed_cache is not None:
+            self.feed_cache.add_feed(page_url, payload)
+        if entries and self.feed_cache is not None:
+            new_urls = self.feed_cache.new_episodes(e["audio_url"] for e in entries)
+            new_entries = []
+            for entry in entries:
+                # 同じフィード内で重複するエピソードも最初の1件だけ残す
+                if entry["audio_url"] in new_urls:
+                    new_urls.discard(entry["audio_url"])
+                    new_entries.append(entry)
+            self.stats["seen_episodes"] += len(entries) - len(new_entries)
+            entries = new_entries
+        for entry in entries:
+            yield {
+                "audio_url": entry["audio_url"],
+                "title": entry["title"],
+                "description": entry["description"],
+                "language": entry["language"],
+                "page_url": page_url,
+            }
+
+    def finish(self):
+        # 出力が確定してからキャッシュに反映する（失敗したWARCは再処理される）
+        if self.feed_cache is not None:
+            self.feed_cache.commit()
+            self.feed_cache.close()
+
+
+def extract_from_warc(input_path, output_path, ranges=None, feed_cache_path=None):
+    """WARCからRSSフィードを探し音声URLを抽出"""
+    handler = RssFeedHandler(feed_cache_path)
+    return scan_warc(input_path, [(handler, output_path)], ranges)[handler.name]
 
 
 def parse_args():
@@ -123,8 +287,48 @@ def parse_args():
         action="store_true",
         help="Overwrite existing files",
     )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=COMPRESSIONS,
+        default="gzip",
+        help="Compression of the output JSONL files",
+    )
+    parser.add_argument(
+        "--index_path",
+        type=str,
+        default=None,
+        help="Common Crawl columnar index (parquet); fetch only matching records",
+    )
+    parser.add_argument(
+        "--index_languages",
+        type=str,
+        nargs="*",
+        default=[],
+        help="content_languages codes to select from the index (all by default)",
+    )
+    parser.add_argument(
+        "--feed_cache",
+        type=str,
+        default=None,
+        help="SQLite file of feeds/episodes already extracted; skip them across runs",
+    )
+    parser.add_argument(
+        "--lease_dir",
+        type=str,
+        default=None,
+        help="Shared lease directory for running this stage on several nodes",
+    )
+    add_fetch_args(parser)
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.overwrite and args.feed_cache:
+        # 再処理するWARCのフィードはキャッシュ済みなので、全て除外されて空になる
+        parser.error(
+            "--overwrite cannot be combined with --feed_cache: feeds of the "
+            "reprocessed WARCs are already in the cache and would all be skipped"
+        )
+    return args
 
 
 # 使用例
@@ -140,24 +344,52 @@ if __name__ == "__main__":
     input_paths = [url.strip() for url in input_paths]
     warc_urls = sorted(input_paths)
     input_paths = input_paths[: args.max_num_files]
+    ranges_by_warc = None
+    if args.index_path:
+        ranges_by_warc = query_index(
+            args.index_path,
+            FEED_MIME_TYPES,
+            args.index_languages,
+            [warc_filename_of(path) for path in input_paths],
+        )
 
-    with ProcessPoolExecutor() as executor:
-        futures = []
+    # 範囲指定の読み込みはWARC全体を先に取得しない
+    max_downloads = 0 if ranges_by_warc is not None else args.max_downloads
+    with (
+        ProcessPoolExecutor(max_workers=args.num_workers) as pool,
+        PrefetchExecutor(pool, max_downloads, args.spool_dir) as executor,
+    ):
+        jobs = []
         for input_path in input_paths:
             output_path = os.path.join(
                 output_dir,
-                os.path.basename(input_path).replace(".warc.gz", ".jsonl"),
+                jsonl_name(os.path.basename(input_path), args.compression),
             )
             if os.path.exists(output_path) and not args.overwrite:
                 logger.info(f"File already exists: {output_path}")
                 continue
-            futures.append(executor.submit(extract_from_warc, input_path, output_path))
+            ranges = None
+            if ranges_by_warc is not None:
+                ranges = ranges_by_warc.get(warc_filename_of(input_path), [])
+            jobs.append(
+                (
+                    os.path.basename(output_path),
+                    extract_from_warc,
+                    (
+                        resolve_location(input_path, args.source_dir),
+                        output_path,
+                        ranges,
+                        args.feed_cache,
+                    ),
+                )
+            )
 
-        for future in tqdm(
-            as_completed(futures),
-            total=len(futures),
+        leases = make_lease_queue(args.lease_dir, "rss2audio", output_dir)
+        for _ in tqdm(
+            run_jobs(executor, jobs, leases, executor.max_pending),
+            total=len(jobs),
             desc="Processing HTML",
             unit="line",
         ):
-            future.result()
-    logger.info(f"Processed {len(futures)} files.")
+            pass
+    logger.info(f"Processed {len(jobs)} files.")
@@ -0,0 +1,360 @@
+"""Corpus statistics over parquet outputs (json2parquet / dedup).
+
+Only the columns needed are read, batch by batch. Hosts are taken from the
+URLs with an Arrow regex and each distinct host is mapped to its registrable
+domain once, so tldextract runs per host instead of per row.
+
+    uv run ccaudio stats data/cc/audio/2025-18-parquet --plot --output_dir stats
+"""
+
+import glob
+import os
+from argparse import ArgumentParser
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import tldextract
+from loguru import logger
+from tqdm import tqdm
+
+HOST_REGEX = r"^[a-zA-Z][a-zA-Z0-9+.-]*://(?:[^@/?#]*@)?(?P<host>[^:/?#]*)"
+BATCH_SIZE = 100_000
+QUALITY_BINS = 20
+# 秒単位の区切り
+DURATION_EDGES = [0, 10, 30, 60, 300, 600, 1800, 3600, np.inf]
+# 集計途中の部分表がこの数を超えたらまとめる
+MAX_PARTIALS = 64
+TOP_K = 20
+
+
+@lru_cache(maxsize=2)
+def get_extractor(offline: bool = False) -> tldextract.TLDExtract:
+    # offline: use the Public Suffix List snapshot bundled with tldextract
+    return tldextract.TLDExtract(suffix_list_urls=() if offline else None)
+
+
+@lru_cache(maxsize=1_000_000)
+def registrable_domain(host: str, offline: bool = False) -> str:
+    ext = get_extractor(offline)(host)
+    return ".".join(part for part in [ext.domain, ext.suffix] if part)
+
+
+def url_domains(urls: pa.Array, offline: bool = False) -> pa.Array:
+    """Registrable domain of every URL (null where there is none)"""
+    hosts = pc.utf8_lower(pc.struct_field(pc.extract_regex(urls, HOST_REGEX), [0]))
+    hosts = hosts.dictionary_encode()
+    domains = pa.array(
+        [
+            registrable_domain(host, offline) or None
+            for host in hosts.dictionary.to_pylist()
+        ],
+        pa.string(),
+    )
+    return domains.take(hosts.indices)
+
+
+class CountAccumulator:
+    """Counts of the values of one column, merged with Arrow group-bys"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.partials = []
+
+    def _merge(self, tables) -> pa.Table:
+        return (
+            pa.concat_tables(tables)
+            .group_by(self.name)
+            .aggregate([("count", "sum")])
+            .rename_columns([self.name, "count"])
+        )
+
+    def update(self, values: pa.Array) -> None:
+        table = pa.table({self.name: values}).filter(pc.is_valid(values))
+        counts = table.group_by(self.name).aggregate([(self.name, "count")])
+        self.partials.append(counts.rename_columns([self.name, "count"]))
+        if len(self.partials) > MAX_PARTIALS:
+            self.partials = [self._merge(self.partials)]
+
+    def table(self) -> pa.Table:
+        if not self.partials:
+            return pa.table({self.name: [], "count": [], "percent": []})
+        counts = self._merge(self.partials).sort_by([("count", "descending")])
+        total = pc.sum(counts["count"]).as_py()
+        percent = pc.multiply(
+            pc.divide(pc.cast(counts["count"], pa.float64()), total), 100
+        )
+        return counts.append_column("percent", percent)
+
+
+class HistogramAccumulator:
+    """Histogram of a numeric column over fixed bin edges"""
+
+    def __init__(self, name: str, edges):
+        self.name = name
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.total = 0.0
+        self.num_values = 0
+
+    def update(self, values: pa.Array) -> None:
+        values = pc.drop_null(pc.cast(values, pa.float64())).to_numpy()
+        values = values[np.isfinite(values)]
+        self.counts += np.histogram(values, self.edges)[0]
+        self.total += float(values.sum())
+        self.num_values += len(values)
+
+    def table(self) -> pa.Table:
+        return pa.table(
+            {
+                "bin_start": self.edges[:-1],
+                "bin_end": self.edges[1:],
+                "count": self.counts,
+            }
+        )
+
+
+class CorpusStats:
+    """Domain, language, quality and duration statistics of parquet files"""
+
+    def __init__(
+        self,
+        url_column: str = "audio_url",
+        quality_bins: int = QUALITY_BINS,
+        offline: bool = False,
+    ):
+        self.url_column = url_column
+        self.offline = offline
+        self.num_rows = 0
+        self.counts = {
+            "domain": CountAccumulator("domain"),
+            "language": CountAccumulator("language"),
+        }
+        self.histograms = {
+            "quality": HistogramAccumulator(
+                "quality", np.linspace(0.0, 1.0, quality_bins + 1)
+            ),
+            "duration": HistogramAccumulator("duration", DURATION_EDGES),
+        }
+
+    def columns(self, schema: pa.Schema) -> list[str]:
+        wanted = [self.url_column, "language", "quality", "duration"]
+        return [name for name in wanted if name in schema.names]
+
+    def update(self, batch: pa.RecordBatch) -> None:
+        self.num_rows += batch.num_rows
+        names = batch.schema.names
+        if self.url_column in names:
+            self.counts["domain"].update(
+                url_domains(batch[self.url_column], self.offline)
+            )
+        if "language" in names:
+            self.counts["language"].update(batch["language"])
+        for name, histogram in self.histograms.items():
+            if name in names:
+                histogram.update(batch[name])
+
+    def tables(self) -> dict[str, pa.Table]:
+        tables = {name: acc.table() for name, acc in self.counts.items()}
+        for name, histogram in self.histograms.items():
+            if histogram.num_values:
+                tables[name] = histogram.table()
+        return tables
+
+    def summary(self) -> dict:
+        summary = {"rows": self.num_rows}
+        quality = self.histograms["quality"]
+        if quality.num_values:
+            summary["mean_quality"] = quality.total / quality.num_values
+        duration = self.histograms["duration"]
+        if duration.num_values:
+            summary["hours"] = duration.total / 3600
+        return summary
+
+
+def list_parquet_files(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                sorted(glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True))
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def compute_stats(
+    paths: list[str],
+    url_column: str = "audio_url",
+    languages: Optional[list[str]] = None,
+    batch_size: int = BATCH_SIZE,
+    offline: bool = False,
+) -> CorpusStats:
+    """``offline`` uses the bundled Public Suffix List instead of fetching it"""
+    dataset = ds.dataset(list_parquet_files(paths), format="parquet")
+    stats = CorpusStats(url_column, offline=offline)
+    columns = stats.columns(dataset.schema)
+    row_filter = None
+    if languages:
+        row_filter = pc.field("language").isin(languages)
+    scanner = dataset.scanner(columns=columns, filter=row_filter, batch_size=batch_size)
+    for batch in tqdm(scanner.to_batches(), desc="Reading parquet", unit="batch"):
+        stats.update(batch)
+    return stats
+
+
+def format_table(table: pa.Table, top_k: Optional[int] = None) -> str:
+    rows = table.slice(0, top_k).to_pylist() if top_k else table.to_pylist()
+    names = table.column_names
+    cells = [
+        [f"{v:.2f}" if isinstance(v, float) else str(v) for v in row.values()]
+        for row in rows
+    ]
+    widths = [max([len(n)] + [len(c[i]) for c in cells]) for i, n in enumerate(names)]
+    lines = [names] + cells
+    return "\n".join(
+        "  ".join(c.ljust(w) for c, w in zip(line, widths)).rstrip() for line in lines
+    )
+
+
+def plot_counts(table: pa.Table, name: str, path: str, top_k: int) -> None:
+    import matplotlib.cm as cm
+    import matplotlib.pyplot as plt
+
+    table = table.slice(0, top_k)
+    labels = [str(v) for v in table[name].to_pylist()]
+    percentages = table["percent"].to_pylist()
+    colors = cm.viridis(plt.Normalize(0, max(percentages))(percentages))
+    fig, ax = plt.subplots(figsize=(18, 8))
+    bars = ax.bar(labels, percentages, color=colors)
+    ax.spines["right"].set_visible(False)
+    ax.spines["top"].set_visible(False)
+    plt.xticks(rotation=45, ha="right")
+    ax.set_ylabel("Percentage (%)")
+    for bar, pct in zip(bars, percentages):
+        ax.text(
+            bar.get_x() + bar.get_width() / 2,
+            bar.get_height() + 0.002,
+            f"{pct:.2f}",
+            ha="center",
+            va="bottom",
+            rotation=45,
+        )
+    ax.grid(axis="y", linestyle="--", alpha=0.8)
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+    plt.close(fig)
+
+
+def plot_histogram(table: pa.Table, path: str) -> None:
+    import matplotlib.pyplot as plt
+
+    labels = [
+        f"{start:g}-{end:g}"
+        for start, end in zip(
+            table["bin_start"].to_pylist(), table["bin_end"].to_pylist()
+        )
+    ]
+    fig, ax = plt.subplots(figsize=(18, 8))
+    ax.bar(labels, table["count"].to_pylist())
+    ax.spines["right"].set_visible(False)
+    ax.spines["top"].set_visible(False)
+    plt.xticks(rotation=45, ha="right")
+    ax.set_ylabel("Count")
+    ax.grid(axis="y", linestyle="--", alpha=0.8)
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+    plt.close(fig)
+
+
+def add_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "paths",
+        type=str,
+        nargs="+",
+        help="Parquet files or directories containing them",
+    )
+    parser.add_argument(
+        "--url_column",
+        type=str,
+        default="audio_url",
+        help="Column whose registrable domains are counted",
+    )
+    parser.add_argument(
+        "--languages",
+        type=str,
+        nargs="*",
+        default=None,
+        help="Only count rows with these language values (e.g. ja ja-JP)",
+    )
+    parser.add_argument(
+        "--top_k",
+        type=int,
+        default=TOP_K,
+        help="Rows shown and plotted per table",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Write every table as CSV (and plots with --plot) here",
+    )
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help="Save bar charts of the tables as PNG",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Use the Public Suffix List bundled with tldextract",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Rows per record batch read from parquet",
+    )
+
+
+def run(args) -> None:
+    import pyarrow.csv as csv
+
+    stats = compute_stats(
+        args.paths, args.url_column, args.languages, args.batch_size, args.offline
+    )
+    tables = stats.tables()
+    for key, value in stats.summary().items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    for name, table in tables.items():
+        top_k = args.top_k if name in stats.counts else None
+        print(f"\n[{name}]\n{format_table(table, top_k)}")
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, table in tables.items():
+            csv.write_csv(table, os.path.join(args.output_dir, f"{name}.csv"))
+            if not args.plot or not table.num_rows:
+                continue
+            path = os.path.join(args.output_dir, f"{name}.png")
+            if name in stats.counts:
+                plot_counts(table, name, path, args.top_k)
+            else:
+                plot_histogram(table, path)
+        logger.info(f"Wrote statistics to {args.output_dir}")
+    elif args.plot:
+        logger.warning("--plot needs --output_dir")
+
+
+def parse_args():
+    parser = ArgumentParser()
+    add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -1,23 +1,67 @@
-import json
+import codecs
 import os
 import re
+import time
 from argparse import ArgumentParser
 from concurrent.futures import ProcessPoolExecutor
 
 import chardet
-import requests
 from loguru import logger
 from tqdm import tqdm
-from warcio.archiveiterator import ArchiveIterator
+
+from ccaudio.extract_url.cc_index import HTML_MIME_TYPES, query_index, warc_filename_of
+from ccaudio.extract_url.fetch import (
+    PrefetchExecutor,
+    add_fetch_args,
+    resolve_location,
+)
+from ccaudio.extract_url.jsonl_io import COMPRESSIONS, jsonl_name
+from ccaudio.extract_url.lease import make_lease_queue, run_jobs
+from ccaudio.extract_url.warc_scanner import WarcHandler, scan_warc
 
 # lang="ja" 検出
 LANG_JA_REGEX = re.compile(r'<html[^>]*lang=["\']?ja["\']?', re.IGNORECASE)
 
+# Byte-level prefilter: only the first PREFILTER_BYTES of each payload are
+# inspected before deciding whether the page is worth decoding.
+PREFILTER_BYTES = 8192
+LANG_JA_BYTES_REGEX = re.compile(rb'<html[^>]*lang=["\']?ja["\']?', re.IGNORECASE)
+HTML_TAG_BYTES_REGEX = re.compile(rb"<html[^>]*>", re.IGNORECASE)
+# Encodings in which ASCII markup is not stored as ASCII bytes
+WIDE_CHARSET_BYTES_REGEX = re.compile(
+    rb"charset=[\"']?\s*(utf-?16|utf-?32|ucs-?2)", re.I
+)
+WIDE_BOMS = (
+    codecs.BOM_UTF32_LE,
+    codecs.BOM_UTF32_BE,
+    codecs.BOM_UTF16_LE,
+    codecs.BOM_UTF16_BE,
+)
+
 
 def is_japanese_html_raw(html_str):
     return LANG_JA_REGEX.search(html_str)
 
 
+def is_japanese_html_candidate(head, complete, content_type=""):
+    """Check the first bytes of a payload against LANG_JA_REGEX without decoding.
+
+    Returns False only if the decoded page cannot match ``is_japanese_html_raw``:
+    either the whole payload was seen (``complete``) or its ``<html>`` tag was
+    found without a Japanese lang attribute. Pages whose charset is not
+    ASCII-compatible are always passed on to the full decode.
+    """
+    if LANG_JA_BYTES_REGEX.search(head):
+        return True
+    if head.startswith(WIDE_BOMS) or WIDE_CHARSET_BYTES_REGEX.search(
+        content_type.encode("latin-1", "ignore") + b" " + head
+    ):
+        return True
+    if complete:
+        return False
+    return HTML_TAG_BYTES_REGEX.search(head) is None
+
+
 def try_decode(raw_html):
     try:
         return raw_html.decode("utf-8")
@@ -30,36 +74,89 @@ def try_decode(raw_html):
             return None
 
 
-def process_warc(input_path, output_path):
-    results = []
-    with requests.get(input_path, stream=True) as r:
-        r.raise_for_status()
-        for record in ArchiveIterator(r.raw):
-            if record.rec_type != "response":
-                continue
+class JapaneseHtmlHandler(WarcHandler):
+    """Keep decoded HTML pages whose <html> tag declares lang="ja"."""
 
-            content_type = record.http_headers.get_header("Content-Type")
-            if not content_type or "html" not in content_type:
-                continue
+    name = "html"
+    mime_types = HTML_MIME_TYPES
+    index_languages = ("jpn",)
 
-            url = record.rec_headers.get_header("WARC-Target-URI")
-            html = record.content_stream().read()
+    def __init__(self, prefilter=True):
+        super().__init__()
+        self.prefilter = prefilter
 
-            html = try_decode(html)
-            if html is None:
-                continue
+    def process(self, record, payload):
+        content_type = record.http_headers.get_header("Content-Type")
+        if not content_type or "html" not in content_type:
+            return
 
-            if not is_japanese_html_raw(html):
-                continue
+        self.stats["html_records"] += 1
+        self.stats["html_bytes"] += int(
+            record.rec_headers.get_header("Content-Length") or 0
+        )
+        url = record.rec_headers.get_header("WARC-Target-URI")
 
-            write_data = {
-                "url": url,
-                "html": html,
-            }
-            results.append(write_data)
-    with open(output_path, "w", encoding="utf-8") as outfile:
-        for write_data in results:
-            outfile.write(json.dumps(write_data, ensure_ascii=False) + "\n")
+        if self.prefilter:
+            start = time.perf_counter()
+            head = payload.head(PREFILTER_BYTES)
+            complete = payload.complete and len(head) == len(payload.data)
+            candidate = is_japanese_html_candidate(head, complete, content_type)
+            self.stats["prefilter_seconds"] += time.perf_counter() - start
+            if not candidate:
+                return
+        html = payload.read()
+        self.stats["candidates"] += 1
+        self.stats["decoded_bytes"] += len(html)
+
+        start = time.perf_counter()
+        html = try_decode(html)
+        matched = html is not None and is_japanese_html_raw(html)
+        self.stats["decode_seconds"] += time.perf_counter() - start
+        if not matched:
+            return
+
+        yield {
+            "url": url,
+            "html": html,
+        }
+
+
+def process_warc(input_path, output_path, prefilter=True, ranges=None):
+    """Extract Japanese HTML pages from a WARC.
+
+    With ``ranges`` (from a Common Crawl index) only those records are fetched;
+    otherwise the whole WARC is streamed.
+    """
+    handler = JapaneseHtmlHandler(prefilter)
+    stats = scan_warc(input_path, [(handler, output_path)], ranges)[handler.name]
+    log_prefilter_stats(input_path, stats)
+    return stats
+
+
+def log_prefilter_stats(input_path, stats):
+    """Log the prefilter hit rate and its estimated decode speedup for a WARC.
+
+    The speedup compares the measured prefilter + decode time with the time a
+    full decode of every HTML payload would take at the candidates' per-byte
+    decode rate.
+    """
+    if not stats["html_records"]:
+        return
+    hit_rate = stats["candidates"] / stats["html_records"]
+    spent = stats["prefilter_seconds"] + stats["decode_seconds"]
+    if stats["decoded_bytes"] and spent > 0:
+        decode_rate = stats["decode_seconds"] / stats["decoded_bytes"]
+        speedup = f"{decode_rate * stats['html_bytes'] / spent:.1f}x"
+    else:
+        speedup = "n/a"
+    logger.info(
+        f"{os.path.basename(input_path)}: prefilter passed "
+        f"{stats['candidates']}/{stats['html_records']} HTML records "
+        f"({hit_rate:.1%}), wrote {stats['written']}, "
+        f"prefilter {stats['prefilter_seconds']:.2f}s, "
+        f"decode {stats['decode_seconds']:.2f}s, "
+        f"estimated decode speedup {speedup}"
+    )
 
 
 def parse_args():
@@ -87,6 +184,38 @@ def parse_args():
         action="store_true",
         help="Overwrite existing files",
     )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=COMPRESSIONS,
+        default="gzip",
+        help="Compression of the output JSONL files",
+    )
+    parser.add_argument(
+        "--no_prefilter",
+        action="store_true",
+        help="Decode every HTML payload (baseline for measuring the prefilter)",
+    )
+    parser.add_argument(
+        "--index_path",
+        type=str,
+        default=None,
+        help="Common Crawl columnar index (parquet); fetch only matching records",
+    )
+    parser.add_argument(
+        "--index_languages",
+        type=str,
+        nargs="*",
+        default=["jpn"],
+        help="content_languages codes to select from the index",
+    )
+    parser.add_argument(
+        "--lease_dir",
+        type=str,
+        default=None,
+        help="Shared lease directory for running this stage on several nodes",
+    )
+    add_fetch_args(parser)
 
     return parser.parse_args()
 
@@ -102,18 +231,48 @@ if __name__ == "__main__":
     input_paths = [url.strip() for url in input_paths]
     warc_urls = sorted(input_paths)
     input_paths = input_paths[: args.max_num_files]
-    with ProcessPoolExecutor() as executor:
-        futures = []
+    ranges_by_warc = None
+    if args.index_path:
+        ranges_by_warc = query_index(
+            args.index_path,
+            HTML_MIME_TYPES,
+            args.index_languages,
+            [warc_filename_of(path) for path in input_paths],
+        )
+    # 範囲指定の読み込みはWARC全体を先に取得しない
+    max_downloads = 0 if ranges_by_warc is not None else args.max_downloads
+    with (
+        ProcessPoolExecutor(max_workers=args.num_workers) as pool,
+        PrefetchExecutor(pool, max_downloads, args.spool_dir) as executor,
+    ):
+        jobs = []
         for input_path in input_paths:
             output_path = os.path.join(
                 output_dir,
-                os.path.basename(input_path).replace(".warc.gz", ".jsonl"),
+                jsonl_name(os.path.basename(input_path), args.compression),
             )
             if os.path.exists(output_path) and not args.overwrite:
                 logger.info(f"File already exists: {output_path}")
                 continue
-            futures.append(executor.submit(process_warc, input_path, output_path))
-        for future in tqdm(futures):
-            future.result()
+            ranges = None
+            if ranges_by_warc is not None:
+                ranges = ranges_by_warc.get(warc_filename_of(input_path), [])
+            jobs.append(
+                (
+                    os.path.basename(output_path),
+                    process_warc,
+                    (
+                        resolve_location(input_path, args.source_dir),
+                        output_path,
+                        not args.no_prefilter,
+                        ranges,
+                    ),
+                )
+            )
+        leases = make_lease_queue(args.lease_dir, "url2html", output_dir)
+        for _ in tqdm(
+            run_jobs(executor, jobs, leases, executor.max_pending), total=len(jobs)
+        ):
+            pass
 
     logger.info("All files processed.")
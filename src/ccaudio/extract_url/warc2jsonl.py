@@ -0,0 +1,194 @@
+import os
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from loguru import logger
+from tqdm import tqdm
+
+from ccaudio.extract_url.cc_index import query_index, warc_filename_of
+from ccaudio.extract_url.fetch import (
+    PrefetchExecutor,
+    add_fetch_args,
+    resolve_location,
+)
+from ccaudio.extract_url.jsonl_io import COMPRESSIONS, jsonl_name
+from ccaudio.extract_url.lease import make_lease_queue, run_jobs
+from ccaudio.extract_url.rss2audio import RssFeedHandler
+from ccaudio.extract_url.url2html import JapaneseHtmlHandler, log_prefilter_stats
+from ccaudio.extract_url.warc_scanner import scan_warc
+
+HANDLERS = {
+    JapaneseHtmlHandler.name: JapaneseHtmlHandler,
+    RssFeedHandler.name: RssFeedHandler,
+}
+
+
+def make_handler(name, args):
+    if name == JapaneseHtmlHandler.name:
+        return JapaneseHtmlHandler(prefilter=not args.no_prefilter)
+    if name == RssFeedHandler.name:
+        return RssFeedHandler(feed_cache_path=args.feed_cache)
+    return HANDLERS[name]()
+
+
+def process_warc(input_path, handlers, ranges=None):
+    """Scan one WARC with several handlers; ``handlers`` pairs each with its output"""
+    stats = scan_warc(input_path, handlers, ranges)
+    if JapaneseHtmlHandler.name in stats:
+        log_prefilter_stats(input_path, stats[JapaneseHtmlHandler.name])
+    return stats
+
+
+def query_ranges(index_path, handler_names, input_paths):
+    """Union of the index hits of all handlers in the input WARCs, grouped by WARC file"""
+    warc_filenames = [warc_filename_of(path) for path in input_paths]
+    ranges_by_warc = defaultdict(list)
+    for name in handler_names:
+        handler = HANDLERS[name]
+        hits = query_index(
+            index_path, handler.mime_types, handler.index_languages, warc_filenames
+        )
+        for warc_filename, ranges in hits.items():
+            ranges_by_warc[warc_filename].extend(ranges)
+    return ranges_by_warc
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--input_file",
+        type=str,
+        default="data/cc/url/2025-18.txt",
+        help="File containing urls of warc files",
+    )
+    parser.add_argument(
+        "--handlers",
+        type=str,
+        nargs="+",
+        choices=list(HANDLERS),
+        default=list(HANDLERS),
+        help="Extractors to run on every record of each WARC",
+    )
+    parser.add_argument(
+        "--html_output_dir",
+        type=str,
+        default="data/cc/html",
+        help="Output directory for Japanese HTML pages",
+    )
+    parser.add_argument(
+        "--rss_output_dir",
+        type=str,
+        default="data/cc/audio",
+        help="Output directory for audio URLs found in RSS/Atom feeds",
+    )
+    parser.add_argument(
+        "--max_num_files",
+        type=int,
+        default=None,
+        help="Maximum number of WARC files to process",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Overwrite existing files",
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=COMPRESSIONS,
+        default="gzip",
+        help="Compression of the output JSONL files",
+    )
+    parser.add_argument(
+        "--no_prefilter",
+        action="store_true",
+        help="Decode every HTML payload (baseline for measuring the prefilter)",
+    )
+    parser.add_argument(
+        "--index_path",
+        type=str,
+        default=None,
+        help="Common Crawl columnar index (parquet); fetch only matching records",
+    )
+    parser.add_argument(
+        "--feed_cache",
+        type=str,
+        default=None,
+        help="SQLite file of feeds/episodes already extracted; skip them across runs",
+    )
+    parser.add_argument(
+        "--lease_dir",
+        type=str,
+        default=None,
+        help="Shared lease directory for running this stage on several nodes",
+    )
+    add_fetch_args(parser)
+
+    args = parser.parse_args()
+    if args.overwrite and args.feed_cache and RssFeedHandler.name in args.handlers:
+        # 再処理するWARCのフィードはキャッシュ済みなので、全て除外されて空になる
+        parser.error(
+            "--overwrite cannot be combined with --feed_cache: feeds of the "
+            "reprocessed WARCs are already in the cache and would all be skipped"
+        )
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    snapshot = os.path.basename(args.input_file).split(".")[0]
+    output_dirs = {
+        JapaneseHtmlHandler.name: os.path.join(args.html_output_dir, snapshot),
+        RssFeedHandler.name: os.path.join(args.rss_output_dir, snapshot),
+    }
+    for name in args.handlers:
+        os.makedirs(output_dirs[name], exist_ok=True)
+    with open(args.input_file, "r") as f:
+        input_paths = f.readlines()
+    input_paths = [url.strip() for url in input_paths]
+    input_paths = input_paths[: args.max_num_files]
+    ranges_by_warc = None
+    if args.index_path:
+        ranges_by_warc = query_ranges(args.index_path, args.handlers, input_paths)
+
+    totals = defaultdict(Counter)
+    # 範囲指定の読み込みはWARC全体を先に取得しない
+    max_downloads = 0 if ranges_by_warc is not None else args.max_downloads
+    with (
+        ProcessPoolExecutor(max_workers=args.num_workers) as pool,
+        PrefetchExecutor(pool, max_downloads, args.spool_dir) as executor,
+    ):
+        jobs = []
+        for input_path in input_paths:
+            name = jsonl_name(os.path.basename(input_path), args.compression)
+            handlers = []
+            for handler_name in args.handlers:
+                output_path = os.path.join(output_dirs[handler_name], name)
+                if os.path.exists(output_path) and not args.overwrite:
+                    logger.info(f"File already exists: {output_path}")
+                    continue
+                handlers.append((make_handler(handler_name, args), output_path))
+            if not handlers:
+                continue
+            ranges = None
+            if ranges_by_warc is not None:
+                ranges = ranges_by_warc.get(warc_filename_of(input_path), [])
+            location = resolve_location(input_path, args.source_dir)
+            jobs.append((name, process_warc, (location, handlers, ranges)))
+
+        # 同じWARCでもハンドラの組み合わせごとに別の作業として扱う
+        stage = os.path.join("warc2jsonl", "+".join(sorted(args.handlers)))
+        leases = make_lease_queue(args.lease_dir, stage, snapshot)
+        for _, result in tqdm(
+            run_jobs(executor, jobs, leases, executor.max_pending),
+            total=len(jobs),
+            desc="Scanning WARC",
+            unit="file",
+        ):
+            for name, stats in result.items():
+                totals[name].update(stats)
+
+    for name, stats in totals.items():
+        logger.info(f"{name}: {dict(stats)}")
+    logger.info(f"Processed {len(jobs)} files.")
@@ -0,0 +1,103 @@
+from collections import Counter
+from contextlib import ExitStack
+from typing import Iterable, Iterator, Optional
+
+from ccaudio.extract_url.jsonl_io import JsonlWriter
+from ccaudio.extract_url.warc_source import (
+    RecordRange,
+    iter_ranged_records,
+    iter_warc_records,
+)
+
+
+class RecordPayload:
+    """Lazily read payload of a WARC record, shared by all handlers.
+
+    Handlers that only need to sniff the beginning of a payload call
+    ``head()``; the rest of the record is read only if some handler asks for
+    it with ``read()``.
+    """
+
+    def __init__(self, record):
+        self.stream = record.content_stream()
+        self.data = b""
+        self.complete = False
+
+    def head(self, size: int) -> bytes:
+        while len(self.data) < size and not self.complete:
+            chunk = self.stream.read(size - len(self.data))
+            if chunk:
+                self.data += chunk
+            else:
+                self.complete = True
+        return self.data[:size]
+
+    def read(self) -> bytes:
+        if not self.complete:
+            self.data += self.stream.read()
+            self.complete = True
+        return self.data
+
+
+class WarcHandler:
+    """Base class for the per-record extractors run by ``scan_warc``.
+
+    ``process`` is called for every response record and yields the output
+    records for this handler's stream. Handlers count whatever they like in
+    ``self.stats``. ``finish`` runs once the outputs of a WARC have been
+    written successfully.
+    """
+
+    name = ""
+    # Columnar index selection used in ranged mode (see cc_index.query_index)
+    mime_types: tuple[str, ...] = ()
+    index_languages: tuple[str, ...] = ()
+
+    def __init__(self):
+        self.stats = Counter()
+
+    def process(self, record, payload: RecordPayload) -> Iterable[dict]:
+        raise NotImplementedError
+
+    def finish(self) -> None:
+        pass
+
+
+def iter_responses(
+    input_path: str, ranges: Optional[list[RecordRange]] = None
+) -> Iterator[tuple[object, RecordPayload]]:
+    """Yield the response records of a WARC with their lazily read payloads"""
+    if ranges is None:
+        records = iter_warc_records(input_path)
+    else:
+        records = iter_ranged_records(input_path, ranges)
+    for record in records:
+        if record.rec_type == "response":
+            yield record, RecordPayload(record)
+
+
+def scan_warc(
+    input_path: str,
+    handlers: list[tuple[WarcHandler, str]],
+    ranges: Optional[list[RecordRange]] = None,
+) -> dict[str, Counter]:
+    """Read a WARC once and feed every response record to each handler.
+
+    ``handlers`` pairs each handler with its output path. With ``ranges``
+    only those records are fetched; otherwise the whole WARC is streamed.
+    Returns the handlers' counters by name.
+    """
+    with ExitStack() as stack:
+        writers = [
+            stack.enter_context(JsonlWriter(output_path)) for _, output_path in handlers
+        ]
+        for record, payload in iter_responses(input_path, ranges):
+            for (handler, _), writer in zip(handlers, writers):
+                handler.stats["records"] += 1
+                for output in handler.process(record, payload):
+                    writer.write(output)
+
+    for (handler, _), writer in zip(handlers, writers):
+        handler.stats["written"] = writer.count
+        handler.finish()
+    return {handler.name: handler.stats for handler, _ in handlers}
@@ -0,0 +1,87 @@
+import io
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple
+
+from warcio.archiveiterator import ArchiveIterator
+
+from ccaudio.extract_url.fetch import is_remote, open_url, read_url_range
+
+# Neighbouring records closer than this are fetched with a single request
+MAX_RANGE_GAP = 64 * 1024
+# Upper bound on the size of one coalesced request
+MAX_RANGE_SIZE = 16 * 1024 * 1024
+
+
+class RecordRange(NamedTuple):
+    offset: int
+    length: int
+
+
+class CoalescedRange(NamedTuple):
+    start: int
+    end: int
+    records: list[RecordRange]
+
+
+@contextmanager
+def open_warc(location: str):
+    """Open a WARC by URL or local path as a binary stream"""
+    if is_remote(location):
+        with open_url(location) as f:
+            yield f
+    else:
+        with open(location, "rb") as f:
+            yield f
+
+
+def iter_warc_records(location: str) -> Iterator:
+    """Stream every record of a WARC file"""
+    with open_warc(location) as stream:
+        yield from ArchiveIterator(stream)
+
+
+def coalesce_ranges(
+    ranges: list[RecordRange],
+    max_gap: int = MAX_RANGE_GAP,
+    max_size: int = MAX_RANGE_SIZE,
+) -> list[CoalescedRange]:
+    """Merge nearby record ranges so they can be fetched with one request"""
+    coalesced: list[CoalescedRange] = []
+    for record in sorted(set(ranges)):
+        end = record.offset + record.length
+        if coalesced:
+            last = coalesced[-1]
+            if record.offset - last.end <= max_gap and end - last.start <= max_size:
+                last.records.append(record)
+                coalesced[-1] = last._replace(end=max(last.end, end))
+                continue
+        coalesced.append(CoalescedRange(record.offset, end, [record]))
+    return coalesced
+
+
+def read_range(location: str, start: int, end: int) -> bytes:
+    """Read bytes ``[start, end)`` of a WARC by HTTP Range request or local seek"""
+    if is_remote(location):
+        return read_url_range(location, start, end)
+    with open(location, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def iter_ranged_records(
+    location: str,
+    ranges: list[RecordRange],
+    max_gap: int = MAX_RANGE_GAP,
+    max_size: int = MAX_RANGE_SIZE,
+) -> Iterator:
+    """Fetch only the given records of a WARC, coalescing nearby ranges.
+
+    Every record of a Common Crawl WARC is a separate gzip member, so the bytes
+    of a single record can be parsed on their own.
+    """
+    for block in coalesce_ranges(ranges, max_gap, max_size):
+        data = read_range(location, block.start, block.end)
+        for record in block.records:
+            begin = record.offset - block.start
+            member = io.BytesIO(data[begin : begin + record.length])
+            yield from ArchiveIterator(member)
@@ -0,0 +1,415 @@
+"""Acoustic near-duplicate detection over shar output.
+
+The same episode reaches the corpus under several URLs (mirrors, CDN
+variants, feeds re-published across snapshots), which URL dedup cannot see.
+Every cut is decoded to 8 kHz mono and reduced to a set of landmark hashes:
+pairs of spectrogram peaks (f1, f2, dt), which survive re-encoding, gain
+changes and shifted starts. The sets are compressed to MinHash signatures,
+candidate pairs are found with banded LSH and confirmed by the estimated
+Jaccard similarity, and every connected group keeps a single cut.
+
+    uv run python src/ccaudio/fingerprint.py --shar_dirs ccaudio_raw \\
+        --output_dir data/fingerprint
+    uv run python src/ccaudio/preprocess.py ... --drop_list data/fingerprint/drop.txt
+
+Signatures are stored per shard together with the size and mtime of the
+shard's files, so only new or changed shards are fingerprinted again. Cuts
+are referred to as ``<absolute shar dir>/<cut id>`` because the crawler
+numbers cuts from zero in every output directory, and every snapshot is
+written to a directory called ``ccaudio_raw`` by default.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tarfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from lhotse import CutSet
+from lhotse.cut import Cut
+from loguru import logger
+from tqdm import tqdm
+
+SAMPLING_RATE = 8000
+FRAME_SIZE = 512
+HOP_SIZE = 256
+# Neighbourhood of a spectral peak (frames, bins)
+PEAK_TIME_RADIUS = 3
+PEAK_FREQ_RADIUS = 5
+PEAKS_PER_SECOND = 30
+# Each peak is paired with the next FAN_OUT peaks at most MAX_DT frames later
+FAN_OUT = 5
+MAX_DT = 63
+# Only the beginning of long episodes is fingerprinted
+MAX_SECONDS = 600.0
+NUM_PERM = 128
+NUM_BANDS = 32
+THRESHOLD = 0.4
+# Cuts with fewer landmarks (silence, very short clips) are never deduplicated
+MIN_HASHES = 50
+HASH_CHUNK = 8192
+
+
+def decode_mono(cut: Cut, sampling_rate: int) -> np.ndarray:
+    """Audio of a cut whose data is in memory, downmixed and resampled"""
+    if cut.num_channels > 1:
+        cut = cut.to_mono(mono_downmix=True)
+    if cut.sampling_rate != sampling_rate:
+        cut = cut.resample(sampling_rate)
+    return cut.load_audio()[0]
+
+
+def spectrogram(audio: np.ndarray) -> np.ndarray:
+    """Log-magnitude STFT, shape (frames, FRAME_SIZE // 2 + 1)"""
+    if len(audio) < FRAME_SIZE:
+        return np.zeros((0, FRAME_SIZE // 2 + 1), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FRAME_SIZE)[::HOP_SIZE]
+    spectrum = np.fft.rfft(frames * np.hanning(FRAME_SIZE).astype(np.float32))
+    return np.log(np.abs(spectrum).astype(np.float32) + 1e-6)
+
+
+def max_filter(values: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (radius, radius)
+    padded = np.pad(values, pad, constant_values=-np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1, axis)
+    return windows.max(axis=-1)
+
+
+def find_peaks(spec: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(frame, bin) of the strongest local maxima, sorted by frame"""
+    if spec.size == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    neighbourhood = max_filter(
+        max_filter(spec, PEAK_FREQ_RADIUS, axis=1), PEAK_TIME_RADIUS, axis=0
+    )
+    is_peak = (spec == neighbourhood) & (spec > spec.mean())
+    times, freqs = np.nonzero(is_peak)
+    max_peaks = int(PEAKS_PER_SECOND * len(spec) * HOP_SIZE / SAMPLING_RATE) + 1
+    if len(times) > max_peaks:
+        strongest = np.argpartition(spec[times, freqs], -max_peaks)[-max_peaks:]
+        strongest.sort()
+        times, freqs = times[strongest], freqs[strongest]
+    return times, freqs
+
+
+def landmark_hashes(audio: np.ndarray) -> np.ndarray:
+    """Unique 24-bit (f1, f2, dt) hashes of peak pairs"""
+    times, freqs = find_peaks(spectrogram(audio))
+    # Pair each peak with the first FAN_OUT peaks of the following frames
+    first_later = np.searchsorted(times, times, side="right")
+    hashes = []
+    for k in range(FAN_OUT):
+        anchor = np.flatnonzero(first_later + k < len(times))
+        target = first_later[anchor] + k
+        dt = times[target] - times[anchor]
+        valid = dt <= MAX_DT
+        anchor, target, dt = anchor[valid], target[valid], dt[valid]
+        hashes.append((freqs[anchor] << 15) | (freqs[target] << 6) | dt)
+    return np.unique(np.concatenate(hashes)).astype(np.uint32)
+
+
+def permutations(num_perm: int = NUM_PERM, seed: int = 0) -> tuple:
+    """Odd multipliers and offsets of the hash functions (a * x + b) mod 2**32"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**32, num_perm, dtype=np.uint64) | 1
+    b = rng.integers(0, 2**32, num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(hashes: np.ndarray, perms: tuple) -> np.ndarray:
+    a, b = perms
+    signature = np.full(len(a), np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(hashes), HASH_CHUNK):
+        chunk = hashes[start : start + HASH_CHUNK].astype(np.uint64)[:, None]
+        permuted = (chunk * a + b) & 0xFFFFFFFF
+        signature = np.minimum(signature, permuted.min(axis=0))
+    return signature.astype(np.uint32)
+
+
+def dir_id(shar_dir) -> str:
+    """Key of a shar directory in signature files and keep/drop lists"""
+    return os.path.abspath(os.path.normpath(shar_dir))
+
+
+def source_version(cuts_path: str, recording_path: str) -> np.ndarray:
+    """Size and mtime of the files of a shard"""
+    version = []
+    for path in (cuts_path, recording_path):
+        stat = os.stat(path)
+        version += [stat.st_size, stat.st_mtime]
+    return np.array(version, dtype=np.float64)
+
+
+def is_current(output_path: str, version: np.ndarray) -> bool:
+    if not os.path.exists(output_path):
+        return False
+    with np.load(output_path) as data:
+        return "source" in data and np.array_equal(data["source"], version)
+
+
+def fingerprint_shard(
+    cuts_path: str,
+    recording_path: str,
+    output_path: str,
+    shar_dir: str,
+    num_perm: int = NUM_PERM,
+    max_seconds: Optional[float] = MAX_SECONDS,
+) -> int:
+    """Write MinHash signatures of the cuts of one shard; returns the cut count"""
+    perms = permutations(num_perm)
+    # Taken before reading, so a shard that grows meanwhile is redone next time
+    version = source_version(cuts_path, recording_path)
+    cuts = CutSet.from_shar({"cuts": [cuts_path], "recording": [recording_path]})
+    cut_ids, signatures, num_hashes, durations, sampling_rates = [], [], [], [], []
+    for cut in cuts:
+        if max_seconds is not None and cut.duration > max_seconds:
+            cut = cut.truncate(duration=max_seconds)
+        try:
+            hashes = landmark_hashes(decode_mono(cut, SAMPLING_RATE))
+        except Exception as e:
+            logger.warning(f"Could not decode {cut.id} in {cuts_path}: {e!r}")
+            hashes = np.zeros(0, np.uint32)
+        cut_ids.append(cut.id)
+        signatures.append(minhash(hashes, perms))
+        num_hashes.append(len(hashes))
+        durations.append(cut.recording.duration)
+        sampling_rates.append(cut.recording.sampling_rate)
+
+    tmp_path = f"{output_path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        shar_dir=np.array(shar_dir),
+        source=version,
+        cut_ids=np.array(cut_ids, dtype=str),
+        signatures=np.array(signatures, dtype=np.uint32).reshape(-1, num_perm),
+        num_hashes=np.array(num_hashes, dtype=np.int64),
+        durations=np.array(durations, dtype=np.float64),
+        sampling_rates=np.array(sampling_rates, dtype=np.int64),
+    )
+    os.replace(tmp_path, output_path)
+    return len(cut_ids)
+
+
+def fingerprint_dirs(
+    shar_dirs: list[str],
+    output_dir: str,
+    num_perm: int = NUM_PERM,
+    max_seconds: Optional[float] = MAX_SECONDS,
+    num_workers: Optional[int] = None,
+) -> list[str]:
+    """Fingerprint new or changed shards; returns the signature files to use.
+
+    Shards that cannot be read (e.g. still being written by the crawler) are
+    skipped and tried again by the next run.
+    """
+    ids = [dir_id(shar_dir) for shar_dir in shar_dirs]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"A shar directory is given more than once: {shar_dirs}")
+    jobs, paths = [], []
+    for shar_dir, shar_id in zip(shar_dirs, ids):
+        name = os.path.basename(shar_id)
+        digest = hashlib.sha1(shar_id.encode("utf-8")).hexdigest()[:12]
+        signature_dir = os.path.join(output_dir, "signatures", f"{name}-{digest}")
+        os.makedirs(signature_dir, exist_ok=True)
+        for cuts_path in sorted(Path(shar_dir).glob("cuts.*.jsonl.gz")):
+            shard = cuts_path.name.split(".")[1]
+            recording_path = str(cuts_path.parent / f"recording.{shard}.tar")
+            output_path = os.path.join(signature_dir, f"{shard}.npz")
+            try:
+                version = source_version(str(cuts_path), recording_path)
+            except OSError as e:
+                logger.warning(f"Skipping shard {cuts_path}: {e!r}")
+                continue
+            if is_current(output_path, version):
+                paths.append(output_path)
+            else:
+                jobs.append((str(cuts_path), recording_path, output_path, shar_id))
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(fingerprint_shard, *job, num_perm, max_seconds): job
+            for job in jobs
+        }
+        for future in tqdm(
+            as_completed(futures), total=len(futures), desc="Fingerprinting"
+        ):
+            cuts_path, _, output_path, _ = futures[future]
+            try:
+                future.result()
+            except (OSError, EOFError, zlib.error, tarfile.TarError, ValueError) as e:
+                logger.warning(f"Skipping unreadable shard {cuts_path}: {e!r}")
+                # Signatures of an earlier version of the shard are still valid
+                if not os.path.exists(output_path):
+                    continue
+            paths.append(output_path)
+    return sorted(paths)
+
+
+def candidate_pairs(signatures: np.ndarray, num_bands: int) -> np.ndarray:
+    """Pairs (i, j), i < j, that share at least one LSH band"""
+    num_cuts, num_perm = signatures.shape
+    rows = num_perm // num_bands
+    bands = signatures[:, : rows * num_bands].reshape(num_cuts, num_bands, rows)
+    # 帯ごとに行をまとめて1つの64bit値にする（オーバーフローは折り返し）
+    multipliers = np.random.default_rng(1).integers(1, 2**63, rows, dtype=np.uint64)
+    keys = (bands.astype(np.uint64) * multipliers).sum(axis=2)
+    pairs = []
+    for band in range(num_bands):
+        order = np.argsort(keys[:, band], kind="stable")
+        sorted_keys = keys[order, band]
+        # 同じ値が続く区間の先頭と、区間内の残りを組にする
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        run_start = np.repeat(starts, np.diff(np.r_[starts, num_cuts]))
+        members = np.flatnonzero(np.arange(num_cuts) != run_start)
+        if len(members):
+            pairs.append(np.stack([order[run_start[members]], order[members]], 1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def find_root(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_duplicates(
+    signature_paths: list[str],
+    output_dir: str,
+    num_bands: int = NUM_BANDS,
+    threshold: float = THRESHOLD,
+) -> dict:
+    """Group near-duplicate cuts and write keep.txt, drop.txt and duplicates.jsonl"""
+    keys, signatures, num_hashes, durations, sampling_rates = [], [], [], [], []
+    for path in signature_paths:
+        with np.load(path) as data:
+            shar_dir = str(data["shar_dir"])
+            keys.extend(f"{shar_dir}/{cut_id}" for cut_id in data["cut_ids"])
+            signatures.append(data["signatures"])
+            num_hashes.append(data["num_hashes"])
+            durations.append(data["durations"])
+            sampling_rates.append(data["sampling_rates"])
+    if not keys:
+        # 空のshar_dir、またはすべてのシャードが読めなかった場合
+        logger.warning("No fingerprinted cuts, writing empty keep and drop lists")
+        os.makedirs(output_dir, exist_ok=True)
+        for name in ("keep.txt", "drop.txt", "duplicates.jsonl"):
+            open(os.path.join(output_dir, name), "w").close()
+        return {"cuts": 0, "candidate_pairs": 0, "matched_pairs": 0, "dropped": 0}
+    signatures = np.concatenate(signatures)
+    num_hashes = np.concatenate(num_hashes)
+    durations = np.concatenate(durations)
+    sampling_rates = np.concatenate(sampling_rates)
+
+    eligible = np.flatnonzero(num_hashes >= MIN_HASHES)
+    pairs = eligible[candidate_pairs(signatures[eligible], num_bands)]
+    similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+    matched = similarity >= threshold
+
+    parent = np.arange(len(keys))
+    for i, j in pairs[matched]:
+        root_i, root_j = find_root(parent, i), find_root(parent, j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    roots = np.array([find_root(parent, i) for i in range(len(keys))], dtype=np.int64)
+
+    # 各グループで標本化周波数が高く、長いものを残す
+    order = np.lexsort((np.arange(len(keys)), -durations, -sampling_rates, roots))
+    first = np.r_[True, roots[order][1:] != roots[order][:-1]]
+    keep_of_root = dict(zip(roots[order][first], order[first]))
+    best_similarity = {}
+    for (i, j), sim in zip(pairs[matched], similarity[matched]):
+        for cut in (i, j):
+            best_similarity[cut] = max(best_similarity.get(cut, 0.0), float(sim))
+
+    os.makedirs(output_dir, exist_ok=True)
+    num_dropped = 0
+    with (
+        open(os.path.join(output_dir, "keep.txt"), "w") as keep_file,
+        open(os.path.join(output_dir, "drop.txt"), "w") as drop_file,
+        open(os.path.join(output_dir, "duplicates.jsonl"), "w") as dup_file,
+    ):
+        for i, key in enumerate(keys):
+            kept = keep_of_root[roots[i]]
+            if kept == i:
+                keep_file.write(f"{key}\n")
+                continue
+            num_dropped += 1
+            drop_file.write(f"{key}\n")
+            record = {
+                "drop": key,
+                "keep": keys[kept],
+                "similarity": best_similarity.get(i),
+            }
+            dup_file.write(json.dumps(record) + "\n")
+    stats = {
+        "cuts": len(keys),
+        "candidate_pairs": len(pairs),
+        "matched_pairs": int(matched.sum()),
+        "dropped": num_dropped,
+    }
+    logger.info(f"Near-duplicates: {stats}")
+    return stats
+
+
+def load_drop_list(path: Optional[str], shar_dir) -> set[str]:
+    """Cut ids of ``shar_dir`` listed in a drop list written by this module"""
+    if not path:
+        return set()
+    shar_id = dir_id(shar_dir)
+    drop = set()
+    with open(path, "r") as f:
+        for line in f:
+            key = line.strip()
+            if not key:
+                continue
+            # Bare cut ids apply to any directory
+            dir_name, _, cut_id = key.rpartition("/")
+            if not dir_name or dir_name == shar_id:
+                drop.add(cut_id)
+    return drop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shar_dirs", type=str, nargs="+", required=True)
+    parser.add_argument("--output_dir", type=str, default="data/fingerprint")
+    parser.add_argument("--num_perm", type=int, default=NUM_PERM)
+    parser.add_argument(
+        "--num_bands",
+        type=int,
+        default=NUM_BANDS,
+        help="LSH bands; more bands find pairs of lower similarity",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Estimated Jaccard similarity of landmark sets to call a duplicate",
+    )
+    parser.add_argument(
+        "--max_seconds",
+        type=float,
+        default=MAX_SECONDS,
+        help="Fingerprint only the first seconds of each cut",
+    )
+    parser.add_argument("--num_workers", type=int, default=None)
+    args = parser.parse_args()
+
+    signature_paths = fingerprint_dirs(
+        args.shar_dirs,
+        args.output_dir,
+        args.num_perm,
+        args.max_seconds,
+        args.num_workers,
+    )
+    find_duplicates(signature_paths, args.output_dir, args.num_bands, args.threshold)
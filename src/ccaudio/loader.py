@@ -0,0 +1,212 @@
+"""Duration-bucketed, prefetching batch loader over shar output.
+
+Batches are planned from the cut manifests alone (``cuts.*.jsonl.gz``):
+``DynamicBucketingSampler`` groups cuts of similar duration, shuffles within
+a window and caps every batch by total seconds, so little of a batch is
+padding. Audio is then read by random access through ``SharIndex`` and
+decoded by a thread pool a few batches ahead of the consumer.
+
+    uv run python src/ccaudio/loader.py --shar_dir data/shar --max_duration 600
+"""
+
+import argparse
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+from lhotse import CutSet
+from lhotse.cut import Cut
+from lhotse.dataset import DynamicBucketingSampler, SimpleCutSampler
+from loguru import logger
+
+from ccaudio.fingerprint import decode_mono, load_drop_list
+from ccaudio.shar_index import SharIndex, build
+
+SAMPLING_RATE = 16000
+NUM_BUCKETS = 10
+# Cuts from which the bucket boundaries are estimated / shuffled together
+SHUFFLE_BUFFER = 10000
+NUM_WORKERS = 8
+# Batches decoded ahead of the consumer
+PREFETCH = 4
+
+
+class AudioBatch(NamedTuple):
+    cut_ids: list[str]
+    # (batch, max_samples) mono float32, zero-padded at the end
+    audio: np.ndarray
+    lengths: np.ndarray
+
+
+class LoaderStats:
+    def __init__(self, sampling_rate: int):
+        self.sampling_rate = sampling_rate
+        self.batches = 0
+        self.cuts = 0
+        self.samples = 0
+        self.padded_samples = 0
+        self.start = time.perf_counter()
+
+    def update(self, batch: AudioBatch) -> None:
+        self.batches += 1
+        self.cuts += len(batch.cut_ids)
+        self.samples += int(batch.lengths.sum())
+        self.padded_samples += batch.audio.size
+
+    def summary(self) -> dict:
+        seconds = time.perf_counter() - self.start
+        audio_seconds = self.samples / self.sampling_rate
+        return {
+            "batches": self.batches,
+            "cuts": self.cuts,
+            "audio_hours": audio_seconds / 3600,
+            "cuts_per_second": self.cuts / seconds,
+            "audio_seconds_per_second": audio_seconds / seconds,
+            "padding_ratio": 1 - self.samples / max(1, self.padded_samples),
+        }
+
+
+def read_manifests(shar_dir: Path) -> CutSet:
+    """Cuts of a shar directory without their audio"""
+    cut_paths = sorted(map(str, shar_dir.glob("cuts.*.jsonl.gz")))
+    return CutSet.from_shar({"cuts": cut_paths})
+
+
+def load_audio(index: SharIndex, cut: Cut, sampling_rate: int) -> np.ndarray:
+    return decode_mono(index.get(cut.id), sampling_rate)
+
+
+def collate(cut_ids: list[str], signals: list[np.ndarray]) -> AudioBatch:
+    lengths = np.array([len(signal) for signal in signals], dtype=np.int64)
+    audio = np.zeros((len(signals), lengths.max()), dtype=np.float32)
+    for row, signal in zip(audio, signals):
+        row[: len(signal)] = signal
+    return AudioBatch(cut_ids, audio, lengths)
+
+
+def iter_batches(
+    shar_dir,
+    max_duration: float,
+    sampling_rate: int = SAMPLING_RATE,
+    num_buckets: Optional[int] = NUM_BUCKETS,
+    shuffle_buffer: int = SHUFFLE_BUFFER,
+    num_workers: int = NUM_WORKERS,
+    prefetch: int = PREFETCH,
+    max_cut_duration: Optional[float] = None,
+    seed: int = 0,
+    index_dir=None,
+    stats: Optional[LoaderStats] = None,
+    drop_list: Optional[str] = None,
+) -> Iterator[AudioBatch]:
+    """Yield padded batches whose cuts add up to at most ``max_duration`` seconds.
+
+    ``num_buckets=None`` samples without bucketing (for comparison). Cuts in
+    ``drop_list`` (see ``fingerprint.py``) are skipped.
+    """
+    shar_dir = Path(shar_dir)
+    # Indexes only the shards that are new since the last run
+    build(shar_dir, index_dir)
+    cuts = read_manifests(shar_dir)
+    if max_cut_duration is not None:
+        cuts = cuts.filter(lambda cut: cut.duration <= max_cut_duration)
+    drop = load_drop_list(drop_list, shar_dir)
+    if drop:
+        cuts = cuts.filter(lambda cut: cut.id not in drop)
+    if num_buckets:
+        sampler = DynamicBucketingSampler(
+            cuts,
+            max_duration=max_duration,
+            num_buckets=num_buckets,
+            shuffle=True,
+            buffer_size=shuffle_buffer,
+            num_cuts_for_bins_estimate=shuffle_buffer,
+            seed=seed,
+        )
+    else:
+        sampler = SimpleCutSampler(
+            cuts, max_duration=max_duration, shuffle=True, seed=seed
+        )
+
+    with (
+        SharIndex(shar_dir, index_dir) as index,
+        ThreadPoolExecutor(num_workers) as executor,
+    ):
+        pending = deque()
+
+        def finish_oldest() -> AudioBatch:
+            cut_ids, futures = pending.popleft()
+            batch = collate(cut_ids, [future.result() for future in futures])
+            if stats is not None:
+                stats.update(batch)
+            return batch
+
+        for batch_cuts in sampler:
+            futures = [
+                executor.submit(load_audio, index, cut, sampling_rate)
+                for cut in batch_cuts
+            ]
+            pending.append(([cut.id for cut in batch_cuts], futures))
+            if len(pending) > prefetch:
+                yield finish_oldest()
+        while pending:
+            yield finish_oldest()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shar_dir", type=str, required=True)
+    parser.add_argument("--index_dir", type=str, default=None)
+    parser.add_argument(
+        "--max_duration",
+        type=float,
+        default=600.0,
+        help="Total seconds of audio per batch",
+    )
+    parser.add_argument("--sr", type=int, default=SAMPLING_RATE)
+    parser.add_argument("--num_buckets", type=int, default=NUM_BUCKETS)
+    parser.add_argument(
+        "--no_bucketing",
+        action="store_true",
+        help="Sample without duration buckets (baseline for the padding ratio)",
+    )
+    parser.add_argument("--shuffle_buffer", type=int, default=SHUFFLE_BUFFER)
+    parser.add_argument("--num_workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--prefetch", type=int, default=PREFETCH)
+    parser.add_argument(
+        "--max_cut_duration",
+        type=float,
+        default=None,
+        help="Skip cuts longer than this (seconds)",
+    )
+    parser.add_argument(
+        "--drop_list",
+        type=str,
+        default=None,
+        help="Skip the near-duplicate cuts listed by fingerprint.py",
+    )
+    parser.add_argument("--max_batches", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stats = LoaderStats(args.sr)
+    batches = iter_batches(
+        args.shar_dir,
+        args.max_duration,
+        sampling_rate=args.sr,
+        num_buckets=None if args.no_bucketing else args.num_buckets,
+        shuffle_buffer=args.shuffle_buffer,
+        num_workers=args.num_workers,
+        prefetch=args.prefetch,
+        max_cut_duration=args.max_cut_duration,
+        seed=args.seed,
+        index_dir=args.index_dir,
+        stats=stats,
+        drop_list=args.drop_list,
+    )
+    for _ in islice(batches, args.max_batches):
+        pass
+    logger.info(stats.summary())
@@ -1,7 +1,7 @@
 import argparse
 import io
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 import soundfile as sf
 import torch
@@ -11,6 +11,8 @@ from lhotse.cut.data import DataCut
 from lhotse.shar import SharWriter
 from tqdm import tqdm
 
+from ccaudio.fingerprint import load_drop_list
+
 
 def convert_audio(cut: Union[MonoCut, MultiCut], sr: int) -> Union[MonoCut, MultiCut]:
     if isinstance(cut, MultiCut):
@@ -54,11 +56,17 @@ def separate(cut: Union[MonoCut, MultiCut], separator: Separator) -> MultiCut:
     return cut
 
 
-def main(shar_dir: Path, output_dir: Path, sr: int) -> None:
+def main(
+    shar_dir: Path, output_dir: Path, sr: int, drop_list: Optional[str] = None
+) -> None:
     cut_paths = sorted(list(map(str, shar_dir.glob("cuts.*.jsonl.gz"))))
     recording_paths = sorted(list(map(str, shar_dir.glob("recording.*.tar"))))
 
     cuts = CutSet.from_shar({"cuts": cut_paths, "recording": recording_paths})
+    # 音響的な重複として落とすカット
+    drop = load_drop_list(drop_list, shar_dir)
+    if drop:
+        cuts = cuts.filter(lambda cut: cut.id not in drop)
 
     separator = Separator()
 
@@ -82,6 +90,12 @@ if __name__ == "__main__":
     parser.add_argument("--shar_dir", type=str, required=True)
     parser.add_argument("--output_dir", type=str, required=True)
     parser.add_argument("--sr", type=int, required=False, default=16000)
+    parser.add_argument(
+        "--drop_list",
+        type=str,
+        default=None,
+        help="drop.txt written by fingerprint.py",
+    )
     args = parser.parse_args()
 
-    main(Path(args.shar_dir), Path(args.output_dir), args.sr)
+    main(Path(args.shar_dir), Path(args.output_dir), args.sr, args.drop_list)
@@ -0,0 +1,373 @@
+"""Rewrite shar directories into shards of a target size.
+
+The crawler and ``preprocess.py`` write shards of a fixed number of cuts, and
+interrupted runs leave many small or partial shards behind. ``reshard`` packs
+the cuts of one or more shar directories, in order, into shards of about
+``--shard_mb`` megabytes of tar data or ``--shard_hours`` hours of audio. Tar
+members are copied byte for byte (nothing is decoded) and the cut manifests
+are rewritten to match the new shards.
+
+The crawler numbers cuts from ``audio_00000000`` in every directory, so a cut
+whose id was already taken by an earlier input is renamed to
+``<input index>_<cut id>`` (e.g. ``1_audio_00000000``) in its manifest line,
+recording and tar member names.
+
+The end of an interrupted shard is tolerated: only cuts whose manifest line
+and members in every field tar are complete are kept. A field tar that is
+missing altogether is an error; use ``--fields`` to copy only the fields
+every input has.
+
+    uv run ccaudio reshard ccaudio_raw --output_dir ccaudio_resharded --shard_mb 1024
+"""
+
+import gzip
+import io
+import json
+import os
+import tarfile
+import zlib
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from loguru import logger
+from tqdm import tqdm
+
+from ccaudio.shar_index import member_cut_id, shard_of
+
+SHARD_MB = 1024.0
+# Added by CutSet.from_shar and refer to the shards the cuts were read from
+ORIGIN_FIELDS = ("shard_origin", "shar_epoch")
+
+
+class Member(NamedTuple):
+    name: str
+    offset: int
+    size: int
+    mtime: int
+
+
+class Item(NamedTuple):
+    cut_id: str
+    line: str
+    duration: float
+    # Per field: source tar and its (data, metadata) members
+    members: dict
+
+
+def list_fields(shar_dir: Path) -> list[str]:
+    return sorted({path.name.split(".")[0] for path in shar_dir.glob("*.*.tar")})
+
+
+def read_cut_lines(cuts_path: Path) -> list[str]:
+    """Complete lines of a possibly truncated ``cuts.*.jsonl.gz``"""
+    lines = []
+    try:
+        with gzip.open(cuts_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                if line.strip():
+                    lines.append(line.rstrip("\n"))
+    except (EOFError, zlib.error, OSError, UnicodeDecodeError) as e:
+        logger.warning(f"{cuts_path} is truncated after {len(lines)} cuts: {e!r}")
+    return lines
+
+
+def read_members(tar_path: Path) -> list[Member]:
+    """Members of a possibly truncated tar whose data is complete"""
+    # A missing tar is an error, not a truncated one (see reshard)
+    file_size = tar_path.stat().st_size
+    members = []
+    try:
+        with tarfile.open(tar_path, mode="r:") as tar:
+            for member in tar:
+                if member.offset_data + member.size > file_size:
+                    break
+                members.append(
+                    Member(member.name, member.offset_data, member.size, member.mtime)
+                )
+    except (tarfile.TarError, EOFError, OSError) as e:
+        logger.warning(f"{tar_path} is truncated after {len(members)} members: {e!r}")
+    return members
+
+
+def strip_origin(line: str) -> str:
+    if not any(f'"{field}"' in line for field in ORIGIN_FIELDS):
+        return line
+    cut = json.loads(line)
+    for field in ORIGIN_FIELDS:
+        (cut.get("custom") or {}).pop(field, None)
+    return json.dumps(cut, ensure_ascii=False)
+
+
+def scan_shard(cuts_path: Path, fields: list[str]) -> tuple[list[Item], int]:
+    """Complete items of a shard and the number of cuts dropped as incomplete"""
+    lines = read_cut_lines(cuts_path)
+    shard = shard_of(cuts_path)
+    num_items = len(lines)
+    pairs = {}
+    for field in fields:
+        tar_path = cuts_path.parent / f"{field}.{shard}.tar"
+        members = read_members(tar_path)
+        pairs[field] = (str(tar_path), list(zip(members[0::2], members[1::2])))
+        num_items = min(num_items, len(pairs[field][1]))
+
+    items = []
+    for i in range(num_items):
+        cut = json.loads(lines[i])
+        members = {}
+        for field, (tar_path, field_pairs) in pairs.items():
+            data, meta = field_pairs[i]
+            if not (
+                member_cut_id(data.name) == cut["id"]
+                and member_cut_id(meta.name) == cut["id"]
+            ):
+                raise RuntimeError(
+                    f"{tar_path}: member {data.name} is not cut {cut['id']}"
+                )
+            members[field] = (tar_path, data, meta)
+        items.append(Item(cut["id"], strip_origin(lines[i]), cut["duration"], members))
+    return items, len(lines) - num_items
+
+
+def rename_item(item: Item, cut_id: str) -> Item:
+    """Give an item a new cut id; the tar members are renamed when copied"""
+    cut = json.loads(item.line)
+    cut["id"] = cut_id
+    recording = cut.get("recording")
+    if recording and recording.get("id") == item.cut_id:
+        recording["id"] = cut_id
+    return item._replace(cut_id=cut_id, line=json.dumps(cut, ensure_ascii=False))
+
+
+def unique_items(items_by_dir: list[list[Item]]) -> tuple[list[Item], int]:
+    """Items of all inputs in order, renaming ids taken by an earlier item"""
+    items = []
+    seen = set()
+    num_renamed = 0
+    for index, dir_items in enumerate(items_by_dir):
+        for item in dir_items:
+            cut_id = item.cut_id
+            while cut_id in seen:
+                cut_id = f"{index}_{cut_id}"
+            if cut_id != item.cut_id:
+                item = rename_item(item, cut_id)
+                num_renamed += 1
+            seen.add(cut_id)
+            items.append(item)
+    return items, num_renamed
+
+
+def item_bytes(item: Item) -> int:
+    return sum(data.size + meta.size for _, data, meta in item.members.values())
+
+
+def plan_shards(
+    items: list[Item],
+    shard_bytes: Optional[float] = None,
+    shard_seconds: Optional[float] = None,
+) -> list[list[Item]]:
+    """Greedily pack items, in order, into shards of at most the target size.
+
+    An item larger than the target gets a shard of its own.
+    """
+    if (shard_bytes is None) == (shard_seconds is None):
+        raise ValueError("Exactly one of shard_bytes and shard_seconds is required")
+    shards = [[]]
+    total = 0.0
+    for item in items:
+        size = item_bytes(item) if shard_bytes is not None else item.duration
+        target = shard_bytes if shard_bytes is not None else shard_seconds
+        if shards[-1] and total + size > target:
+            shards.append([])
+            total = 0.0
+        shards[-1].append(item)
+        total += size
+    return [shard for shard in shards if shard]
+
+
+def copy_member(
+    src, dst: tarfile.TarFile, member: Member, cut_id: str, is_meta: bool = False
+) -> None:
+    """Copy a member under the name of ``cut_id``, keeping its extension"""
+    source_id = member_cut_id(member.name)
+    info = tarfile.TarInfo(cut_id + member.name[len(source_id) :])
+    info.size = member.size
+    info.mtime = member.mtime
+    src.seek(member.offset)
+    if not is_meta or cut_id == source_id:
+        dst.addfile(info, src)
+        return
+
+    # メタデータ（録音のマニフェストなど）のIDも書き換える
+    payload = src.read(member.size)
+    try:
+        meta = json.loads(payload)
+    except ValueError:
+        meta = None
+    if isinstance(meta, dict) and meta.get("id") == source_id:
+        meta["id"] = cut_id
+        payload = (json.dumps(meta, ensure_ascii=False) + "\n").encode("utf-8")
+        info.size = len(payload)
+    dst.addfile(info, io.BytesIO(payload))
+
+
+def write_shard(
+    output_dir: str, shard: int, items: list[Item], fields: list[str]
+) -> int:
+    """Write one output shard; returns its size in bytes"""
+    output_dir = Path(output_dir)
+    sources = {}
+    try:
+        for field in fields:
+            tar_path = output_dir / f"{field}.{shard:06d}.tar"
+            with tarfile.open(f"{tar_path}.tmp", mode="w") as tar:
+                for item in items:
+                    src_path, data, meta = item.members[field]
+                    if src_path not in sources:
+                        sources[src_path] = open(src_path, "rb")
+                    copy_member(sources[src_path], tar, data, item.cut_id)
+                    copy_member(sources[src_path], tar, meta, item.cut_id, is_meta=True)
+            os.replace(f"{tar_path}.tmp", tar_path)
+    finally:
+        for f in sources.values():
+            f.close()
+
+    # カットは最後に書く（カットがあるシャードはtarも揃っている）
+    cuts_path = output_dir / f"cuts.{shard:06d}.jsonl.gz"
+    with gzip.open(f"{cuts_path}.tmp", "wt", encoding="utf-8") as f:
+        for item in items:
+            f.write(item.line + "\n")
+    os.replace(f"{cuts_path}.tmp", cuts_path)
+    return sum(item_bytes(item) for item in items)
+
+
+def reshard(
+    shar_dirs: list[str],
+    output_dir: str,
+    shard_bytes: Optional[float] = None,
+    shard_seconds: Optional[float] = None,
+    fields: Optional[list[str]] = None,
+    overwrite: bool = False,
+    num_workers: Optional[int] = None,
+) -> dict:
+    """Copy the cuts of ``shar_dirs`` to ``output_dir`` in shards of the target size"""
+    if os.path.normpath(output_dir) in {os.path.normpath(d) for d in shar_dirs}:
+        raise ValueError("output_dir must differ from the input directories")
+    if os.path.exists(output_dir) and os.listdir(output_dir) and not overwrite:
+        logger.info(f"{output_dir} is not empty, skipping")
+        return {}
+    if fields is None:
+        fields = sorted({f for d in shar_dirs for f in list_fields(Path(d))})
+    cuts_paths = [
+        (index, path)
+        for index, d in enumerate(shar_dirs)
+        for path in sorted(Path(d).glob("cuts.*.jsonl.gz"))
+    ]
+    # 欠けたフィールドを途中で止まったシャードとして扱うと、全カットが黙って落ちる
+    missing = [
+        str(path.parent / f"{field}.{shard_of(path)}.tar")
+        for _, path in cuts_paths
+        for field in fields
+        if not (path.parent / f"{field}.{shard_of(path)}.tar").exists()
+    ]
+    if missing:
+        raise ValueError(
+            f"{len(missing)} field tars are missing, e.g. {missing[0]}; "
+            "pass --fields to copy only the fields every input has"
+        )
+
+    items_by_dir = [[] for _ in shar_dirs]
+    stats = {"input_shards": len(cuts_paths), "partial_shards": 0, "dropped_cuts": 0}
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            (index, executor.submit(scan_shard, path, fields))
+            for index, path in cuts_paths
+        ]
+        for index, future in tqdm(futures, desc="Scanning shards", unit="shard"):
+            shard_items, num_dropped = future.result()
+            items_by_dir[index].extend(shard_items)
+            if num_dropped:
+                stats["partial_shards"] += 1
+                stats["dropped_cuts"] += num_dropped
+    items, stats["renamed_cuts"] = unique_items(items_by_dir)
+
+    shards = plan_shards(items, shard_bytes, shard_seconds)
+    os.makedirs(output_dir, exist_ok=True)
+    for path in Path(output_dir).glob("*.*.*"):
+        if path.name.startswith(("cuts.", *(f"{field}." for field in fields))):
+            path.unlink()
+    num_bytes = 0
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(write_shard, output_dir, i, shard, fields)
+            for i, shard in enumerate(shards)
+        ]
+        for future in tqdm(futures, desc="Writing shards", unit="shard"):
+            num_bytes += future.result()
+
+    stats.update(
+        cuts=len(items),
+        output_shards=len(shards),
+        hours=sum(item.duration for item in items) / 3600,
+        gb=num_bytes / 1e9,
+    )
+    logger.info(f"Resharded into {output_dir}: {stats}")
+    return stats
+
+
+def add_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "shar_dirs",
+        type=str,
+        nargs="+",
+        help="Shar directories read in order",
+    )
+    parser.add_argument("--output_dir", type=str, required=True)
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument(
+        "--shard_mb",
+        type=float,
+        default=None,
+        help=f"Target tar data per shard in MB (default: {SHARD_MB:g})",
+    )
+    size.add_argument(
+        "--shard_hours",
+        type=float,
+        default=None,
+        help="Target audio per shard in hours",
+    )
+    parser.add_argument(
+        "--fields",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Shar fields to copy (default: every field found in the inputs)",
+    )
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--num_workers", type=int, default=None)
+
+
+def run(args) -> None:
+    shard_bytes, shard_seconds = None, None
+    if args.shard_hours is not None:
+        shard_seconds = args.shard_hours * 3600
+    else:
+        shard_bytes = (args.shard_mb or SHARD_MB) * 1e6
+    reshard(
+        args.shar_dirs,
+        args.output_dir,
+        shard_bytes,
+        shard_seconds,
+        args.fields,
+        args.overwrite,
+        args.num_workers,
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_arguments(parser)
+    run(parser.parse_args())
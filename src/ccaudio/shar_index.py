@@ -0,0 +1,302 @@
+"""Random-access index over lhotse shar shards.
+
+``CutSet.from_shar`` can only stream the tars from the start. ``build``
+records, for every cut of every shard, the byte offset and size of its data
+member in each field tar (``recording.000000.tar``, ...) together with the
+cut manifest. ``SharIndex`` loads those tables once, memory-maps the tars and
+returns any cut by id or audio_url with a single slice of the mapped file.
+
+The index files are written to ``<shar_dir>_index`` by default rather than
+into the shar directory itself, because ``CutSet.from_shar(in_dir=...)``
+treats every file there as a field.
+
+    uv run python src/ccaudio/shar_index.py build --shar_dir data/shar
+    uv run python src/ccaudio/shar_index.py get --shar_dir data/shar \\
+        --cut_id audio_00000001 --output sample.flac
+"""
+
+import argparse
+import gzip
+import json
+import mmap
+import os
+import tarfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from lhotse.cut import Cut
+from lhotse.serialization import deserialize_item
+from lhotse.shar.utils import fill_shar_placeholder
+from loguru import logger
+from tqdm import tqdm
+
+INDEX_FIELDS = ("recording",)
+# Member names of cuts that have no data for a field
+NO_DATA_SUFFIXES = (".nodata", ".nometa")
+
+
+def default_index_dir(shar_dir: Union[str, Path]) -> Path:
+    return Path(f"{os.path.normpath(shar_dir)}_index")
+
+
+def shard_of(path: Union[str, Path]) -> str:
+    """Shard number of a shar file, e.g. ``000003`` for ``cuts.000003.jsonl.gz``"""
+    return Path(path).name.split(".")[1]
+
+
+def member_cut_id(name: str) -> str:
+    """Cut id of a tar member, e.g. ``audio_1`` for ``audio_1.flac``"""
+    return name.rsplit(".", 1)[0]
+
+
+def index_schema(fields) -> pa.Schema:
+    columns = [
+        ("cut_id", pa.string()),
+        ("audio_url", pa.string()),
+        ("shard", pa.string()),
+        ("cut", pa.string()),
+    ]
+    for field in fields:
+        columns += [
+            (f"{field}_member", pa.string()),
+            (f"{field}_offset", pa.int64()),
+            (f"{field}_size", pa.int64()),
+        ]
+    return pa.schema(columns)
+
+
+def read_tar_members(tar_path: Union[str, Path]) -> list[tuple[str, int, int]]:
+    """(name, data offset, size) of the data members of a shar tar, in order.
+
+    Members come in (data, metadata) pairs; only the headers are read.
+    """
+    with tarfile.open(tar_path, mode="r:") as tar:
+        members = tar.getmembers()
+    if len(members) % 2:
+        raise RuntimeError(f"Uneven number of members in {tar_path}")
+    return [(member.name, member.offset_data, member.size) for member in members[0::2]]
+
+
+def index_shard(
+    cuts_path: Union[str, Path],
+    index_path: Union[str, Path],
+    fields=INDEX_FIELDS,
+) -> int:
+    """Write the index of one shard; returns the number of cuts"""
+    cuts_path = Path(cuts_path)
+    shard = shard_of(cuts_path)
+    with gzip.open(cuts_path, "rt", encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    cut_dicts = [json.loads(line) for line in lines]
+    columns = {
+        "cut_id": [cut["id"] for cut in cut_dicts],
+        "audio_url": [(cut.get("custom") or {}).get("audio_url") for cut in cut_dicts],
+        "shard": [shard] * len(lines),
+        "cut": lines,
+    }
+    for field in fields:
+        tar_path = cuts_path.parent / f"{field}.{shard}.tar"
+        members = read_tar_members(tar_path)
+        if len(members) != len(lines):
+            raise RuntimeError(
+                f"{tar_path} has {len(members)} items but {cuts_path} has "
+                f"{len(lines)} cuts"
+            )
+        for cut_id, (name, _, _) in zip(columns["cut_id"], members):
+            if member_cut_id(name) != cut_id:
+                raise RuntimeError(f"{tar_path}: member {name} is not cut {cut_id}")
+        no_data = [name.endswith(NO_DATA_SUFFIXES) for name, _, _ in members]
+        columns[f"{field}_member"] = [name for name, _, _ in members]
+        columns[f"{field}_offset"] = [
+            -1 if missing else offset
+            for missing, (_, offset, _) in zip(no_data, members)
+        ]
+        columns[f"{field}_size"] = [
+            0 if missing else size for missing, (_, _, size) in zip(no_data, members)
+        ]
+
+    tmp_path = f"{index_path}.tmp"
+    pq.write_table(pa.table(columns, schema=index_schema(fields)), tmp_path)
+    os.replace(tmp_path, index_path)
+    return len(lines)
+
+
+def build(
+    shar_dir: Union[str, Path],
+    index_dir: Optional[Union[str, Path]] = None,
+    fields=INDEX_FIELDS,
+    overwrite: bool = False,
+    num_workers: Optional[int] = None,
+) -> int:
+    """Index every shard of ``shar_dir`` whose index is missing or stale"""
+    shar_dir = Path(shar_dir)
+    index_dir = Path(index_dir) if index_dir else default_index_dir(shar_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for cuts_path in sorted(shar_dir.glob("cuts.*.jsonl.gz")):
+        shard = shard_of(cuts_path)
+        index_path = index_dir / f"index.{shard}.parquet"
+        inputs = [cuts_path] + [shar_dir / f"{f}.{shard}.tar" for f in fields]
+        if (
+            index_path.exists()
+            and not overwrite
+            and index_path.stat().st_mtime >= max(p.stat().st_mtime for p in inputs)
+        ):
+            continue
+        jobs.append((cuts_path, index_path))
+
+    num_cuts = 0
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(index_shard, cuts_path, index_path, fields)
+            for cuts_path, index_path in jobs
+        ]
+        for future in tqdm(futures, desc="Indexing shards", unit="shard"):
+            num_cuts += future.result()
+    logger.info(f"Indexed {num_cuts} cuts in {len(jobs)} shards into {index_dir}")
+    return num_cuts
+
+
+class SharIndex:
+    """Look up cuts of a shar directory by id or audio_url without scanning tars"""
+
+    def __init__(
+        self,
+        shar_dir: Union[str, Path],
+        index_dir: Optional[Union[str, Path]] = None,
+        fields=INDEX_FIELDS,
+    ):
+        self.shar_dir = Path(shar_dir)
+        index_dir = Path(index_dir) if index_dir else default_index_dir(shar_dir)
+        index_paths = sorted(index_dir.glob("index.*.parquet"))
+        if not index_paths:
+            raise FileNotFoundError(f"No index in {index_dir}; run build first")
+        self.fields = fields
+        self.table = pa.concat_tables(
+            pq.read_table(p) for p in index_paths
+        ).combine_chunks()
+        self.by_id = {
+            cut_id: i for i, cut_id in enumerate(self.table["cut_id"].to_pylist())
+        }
+        self.by_url = {}
+        for i, url in enumerate(self.table["audio_url"].to_pylist()):
+            if url:
+                self.by_url.setdefault(url, i)
+        self.shards = self.table["shard"].to_pylist()
+        self.columns = {
+            name: self.table[name].to_pylist()
+            for name in self.table.column_names
+            if name.startswith(tuple(f"{field}_" for field in fields))
+        }
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __contains__(self, cut_id: str) -> bool:
+        return cut_id in self.by_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        for mapped, f in self._maps.values():
+            mapped.close()
+            f.close()
+        self._maps = {}
+
+    def _mapped(self, tar_path: Path) -> mmap.mmap:
+        # Readers may share one index across threads
+        with self._lock:
+            if tar_path not in self._maps:
+                f = open(tar_path, "rb")
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[tar_path] = (mapped, f)
+            return self._maps[tar_path][0]
+
+    def read_bytes(self, cut_id: str, field: str = "recording") -> Optional[bytes]:
+        """Raw data member of a cut (e.g. the FLAC file), None if it has none"""
+        row = self.by_id[cut_id]
+        offset = self.columns[f"{field}_offset"][row]
+        if offset < 0:
+            return None
+        size = self.columns[f"{field}_size"][row]
+        mapped = self._mapped(self.shar_dir / f"{field}.{self.shards[row]}.tar")
+        return mapped[offset : offset + size]
+
+    def get(self, cut_id: str) -> Cut:
+        """The cut with its fields loaded in memory, as ``CutSet.from_shar`` yields it"""
+        row = self.by_id[cut_id]
+        cut = deserialize_item(json.loads(self.table["cut"][row].as_py()))
+        for field in self.fields:
+            data = self.read_bytes(cut_id, field)
+            if data is None:
+                setattr(cut, field, None)
+                continue
+            fill_shar_placeholder(
+                manifest=cut,
+                data=data,
+                tarpath=self.columns[f"{field}_member"][row],
+                field=field,
+            )
+        return cut
+
+    def get_by_url(self, audio_url: str) -> Cut:
+        return self.get(self.table["cut_id"][self.by_url[audio_url]].as_py())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["build", "get"])
+    parser.add_argument("--shar_dir", type=str, required=True)
+    parser.add_argument(
+        "--index_dir",
+        type=str,
+        default=None,
+        help="Where the index is stored (default: <shar_dir>_index)",
+    )
+    parser.add_argument(
+        "--fields",
+        type=str,
+        nargs="+",
+        default=list(INDEX_FIELDS),
+        help="Shar fields whose tars are indexed",
+    )
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--num_workers", type=int, default=None)
+    parser.add_argument("--cut_id", type=str, default=None)
+    parser.add_argument("--audio_url", type=str, default=None)
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the recording data of the cut to this file",
+    )
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(
+            args.shar_dir, args.index_dir, args.fields, args.overwrite, args.num_workers
+        )
+    else:
+        with SharIndex(args.shar_dir, args.index_dir, args.fields) as index:
+            if args.cut_id:
+                cut = index.get(args.cut_id)
+            else:
+                cut = index.get_by_url(args.audio_url)
+            print(cut)
+            if args.output:
+                data = index.read_bytes(cut.id)
+                if data is None:
+                    logger.error(f"{cut.id} has no recording data, nothing written")
+                else:
+                    with open(args.output, "wb") as f:
+                        f.write(data)
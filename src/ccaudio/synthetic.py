@@ -0,0 +1,152 @@
+import io
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import soundfile as sf
+from lhotse import MonoCut, MultiCut, Recording
+from lhotse.shar import SharWriter
+
+SIGNAL_KINDS = ("tone", "noise", "speech", "mixture")
+
+
+@dataclass(frozen=True)
+class SyntheticSpec:
+    """Description of one synthetic recording written to a shar fixture"""
+
+    kind: str
+    sampling_rate: int
+    num_channels: int
+    duration: float
+
+    @property
+    def name(self) -> str:
+        return (
+            f"{self.kind}_{self.sampling_rate}hz_{self.num_channels}ch_"
+            f"{self.duration:g}s"
+        )
+
+
+def _tone(t: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    freqs = rng.uniform(110.0, 2000.0, size=3)
+    amps = rng.uniform(0.1, 0.3, size=3)
+    return sum(a * np.sin(2 * np.pi * f * t) for f, a in zip(freqs, amps))
+
+
+def _noise(t: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # White noise shaped by 1/sqrt(f) in the frequency domain, i.e. pink noise
+    white = rng.standard_normal(t.shape[0])
+    spectrum = np.fft.rfft(white)
+    spectrum /= np.sqrt(np.arange(1, spectrum.shape[0] + 1))
+    noise = np.fft.irfft(spectrum, n=t.shape[0])
+    return 0.3 * noise / (np.abs(noise).max() + 1e-9)
+
+
+def _speech(t: np.ndarray, sampling_rate: int, rng: np.random.Generator) -> np.ndarray:
+    # Harmonic source with a wandering f0, syllable-rate amplitude modulation
+    # and pauses, which is close enough to speech for demucs' vocal stem
+    f0 = 120.0 + 30.0 * np.sin(2 * np.pi * rng.uniform(0.2, 0.5) * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sampling_rate
+    harmonics = sum(np.sin(k * phase) / k for k in range(1, 12))
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(3.0, 5.0) * t))
+    pauses = (np.sin(2 * np.pi * rng.uniform(0.1, 0.3) * t) > -0.6).astype(t.dtype)
+    return 0.2 * harmonics * syllables * pauses
+
+
+def make_signal(
+    spec: SyntheticSpec, rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """Generate a (num_channels, num_samples) float32 signal for ``spec``"""
+    rng = rng if rng is not None else np.random.default_rng(0)
+    num_samples = int(round(spec.duration * spec.sampling_rate))
+    t = np.arange(num_samples, dtype=np.float64) / spec.sampling_rate
+
+    channels = []
+    for _ in range(spec.num_channels):
+        if spec.kind == "tone":
+            signal = _tone(t, rng)
+        elif spec.kind == "noise":
+            signal = _noise(t, rng)
+        elif spec.kind == "speech":
+            signal = _speech(t, spec.sampling_rate, rng)
+        elif spec.kind == "mixture":
+            signal = (
+                _speech(t, spec.sampling_rate, rng)
+                + 0.5 * _tone(t, rng)
+                + 0.3 * _noise(t, rng)
+            )
+        else:
+            raise ValueError(f"Unknown signal kind: {spec.kind}")
+        channels.append(signal)
+
+    audio = np.stack(channels).astype(np.float32)
+    peak = np.abs(audio).max()
+    if peak > 0.99:
+        audio *= 0.99 / peak
+    return audio
+
+
+def make_cut(
+    spec: SyntheticSpec, index: int, rng: Optional[np.random.Generator] = None
+) -> Union[MonoCut, MultiCut]:
+    """Build a cut shaped like the ones written by ``LhotseSharPipeline``"""
+    audio = make_signal(spec, rng)
+
+    buf = io.BytesIO()
+    sf.write(buf, audio.T, spec.sampling_rate, format="FLAC")
+
+    recording_id = f"audio_{index:08d}"
+    recording = Recording.from_bytes(buf.getvalue(), recording_id=recording_id)
+    assert recording.channel_ids is not None
+
+    custom = {
+        "audio_url": f"https://example.com/{spec.name}.flac",
+        "title": spec.name,
+        "description": f"Synthetic {spec.kind} signal",
+        "page_url": "https://example.com/feed.xml",
+        "language": "ja",
+        "synthetic": asdict(spec),
+    }
+
+    if recording.num_channels == 1:
+        return MonoCut(
+            id=recording_id,
+            start=0,
+            duration=recording.duration,
+            channel=0,
+            recording=recording,
+            custom=custom,
+        )
+    return MultiCut(
+        id=recording_id,
+        start=0,
+        duration=recording.duration,
+        channel=recording.channel_ids,
+        recording=recording,
+        custom=custom,
+    )
+
+
+def write_synthetic_shar(
+    output_dir: Union[str, Path],
+    specs: Iterable[SyntheticSpec],
+    shard_size: int = 100,
+    seed: int = 0,
+) -> list[SyntheticSpec]:
+    """Write one cut per spec to ``output_dir`` in the crawler's shar layout"""
+    rng = np.random.default_rng(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    written = []
+    with SharWriter(
+        str(output_dir),
+        fields={"recording": "flac"},
+        shard_size=shard_size,
+        warn_unused_fields=False,
+    ) as writer:
+        for i, spec in enumerate(specs):
+            writer.write(make_cut(spec, i, rng))
+            written.append(spec)
+    return written
@@ -0,0 +1,63 @@
+import gzip
+import os
+
+import pyarrow.parquet as pq
+
+from ccaudio.catalog import update_catalog
+from ccaudio.synthetic import SyntheticSpec, write_synthetic_shar
+
+
+def test_incremental_catalog(tmp_path) -> None:
+    shar_dir = tmp_path / "shar"
+    catalog_path = str(tmp_path / "catalog.parquet")
+    specs = [SyntheticSpec("tone", 16000, n, 0.5) for n in (1, 2, 1)]
+    write_synthetic_shar(shar_dir, specs, shard_size=2)
+
+    stats = update_catalog([str(shar_dir)], catalog_path, num_workers=1)
+    assert (stats["updated"], stats["cuts"]) == (2, 3)
+    table = pq.read_table(catalog_path)
+    assert table["shard"].to_pylist() == ["000000", "000000", "000001"]
+    assert table["num_channels"].to_pylist() == [1, 2, 1]
+    assert table["host"].to_pylist() == ["example.com"] * 3
+    assert table["language"].to_pylist() == ["ja"] * 3
+    assert '"synthetic"' in table["custom"][0].as_py()
+
+    # Nothing changed: nothing is read again
+    assert update_catalog([str(shar_dir)], catalog_path)["updated"] == 0
+
+    # A new finished shard is added; one still being written is skipped
+    (shar_dir / "cuts.000001.jsonl.gz").unlink()
+    with gzip.open(shar_dir / "cuts.000002.jsonl.gz", "wt") as f:
+        f.write('{"id": "x", "duration": 2.0, "channel": 0, "custom": {}}\n')
+    with open(shar_dir / "cuts.000003.jsonl.gz", "wb") as f:
+        f.write(gzip.compress(b'{"id": "y", "duration": 1.0}\n' * 100)[:40])
+    stats = update_catalog([str(shar_dir)], catalog_path, num_workers=1)
+    assert stats == {
+        "shards": 3,
+        "updated": 1,
+        "skipped": 1,
+        "removed": 1,
+        "cuts": 3,
+    }
+    table = pq.read_table(catalog_path)
+    assert table["cut_id"].to_pylist()[-1] == "x"
+    assert not os.path.exists(f"{catalog_path}.tmp")
+
+
+def test_catalog_keys_shar_dirs_by_absolute_path(tmp_path, monkeypatch) -> None:
+    shar_dir = tmp_path / "shar"
+    catalog_path = str(tmp_path / "catalog.parquet")
+    # Only a shard still being written: an empty catalog is written
+    shar_dir.mkdir()
+    with open(shar_dir / "cuts.000000.jsonl.gz", "wb") as f:
+        f.write(gzip.compress(b'{"id": "y", "duration": 1.0}\n' * 100)[:40])
+    stats = update_catalog([str(shar_dir)], catalog_path, num_workers=1)
+    assert (stats["skipped"], stats["cuts"]) == (1, 0)
+    assert pq.read_table(catalog_path).num_rows == 0
+
+    write_synthetic_shar(shar_dir, [SyntheticSpec("tone", 16000, 1, 0.5)] * 2)
+    monkeypatch.chdir(tmp_path)
+    assert update_catalog(["shar"], catalog_path)["cuts"] == 2
+    assert update_catalog([str(shar_dir) + "/"], catalog_path)["updated"] == 0
+    table = pq.read_table(catalog_path)
+    assert table["shar_dir"].to_pylist() == [str(shar_dir)] * 2
@@ -0,0 +1,128 @@
+import gzip
+import os
+
+import pytest
+import requests
+
+from ccaudio.extract_url import cc2url
+from ccaudio.extract_url.cc2url import (
+    cached_fetch,
+    iter_urls_from_warc_path,
+    write_urls_from_warc_path,
+)
+
+URL = "https://data.example/crawl-data/CC-MAIN-2025-18/warc.paths.gz"
+
+
+class StubResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+
+class StubSession:
+    """Returns the queued responses in order and records the request headers"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.headers = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.headers.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def stub_session(monkeypatch, responses) -> StubSession:
+    session = StubSession(responses)
+    monkeypatch.setattr(cc2url, "get_session", lambda: session)
+    return session
+
+
+def read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_cached_fetch_revalidates(tmp_path, monkeypatch) -> None:
+    cache_dir = str(tmp_path / "cache")
+    validators = {"ETag": '"v1"', "Last-Modified": "Sat, 01 Mar 2025 00:00:00 GMT"}
+    session = stub_session(
+        monkeypatch,
+        [
+            StubResponse(200, b"v1", validators),
+            StubResponse(304),
+            StubResponse(200, b"v2", {"ETag": '"v2"'}),
+            requests.ConnectionError("down"),
+        ],
+    )
+
+    path = cached_fetch(URL, cache_dir)
+    assert read(path) == b"v1"
+    assert session.headers[0] == {}
+
+    # 304: the cached copy is kept
+    assert cached_fetch(URL, cache_dir) == path
+    assert read(path) == b"v1"
+    assert session.headers[1] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Sat, 01 Mar 2025 00:00:00 GMT",
+    }
+
+    assert read(cached_fetch(URL, cache_dir)) == b"v2"
+    assert session.headers[2] == session.headers[1]
+
+    # The server is unreachable: the cached copy is used as is
+    assert read(cached_fetch(URL, cache_dir)) == b"v2"
+    assert session.headers[3] == {"If-None-Match": '"v2"'}
+    assert not [name for name in os.listdir(os.path.dirname(path)) if ".tmp." in name]
+
+
+def test_cached_fetch_raises_without_cached_copy(tmp_path, monkeypatch) -> None:
+    stub_session(monkeypatch, [requests.ConnectionError("down"), StubResponse(404)])
+    with pytest.raises(requests.ConnectionError):
+        cached_fetch(URL, str(tmp_path))
+    with pytest.raises(requests.HTTPError):
+        cached_fetch(URL, str(tmp_path))
+
+
+def test_iter_urls_from_warc_path(tmp_path, monkeypatch) -> None:
+    warcs = [
+        f"crawl-data/CC-MAIN-2025-18/segments/{i}/warc/{i}.warc.gz" for i in range(50)
+    ]
+    # No trailing newline, and chunks that split lines
+    body = gzip.compress("\n".join(warcs).encode())
+    monkeypatch.setattr(cc2url, "CHUNK_SIZE", 7)
+    stub_session(monkeypatch, [StubResponse(200, body)])
+
+    prefix = "https://data.example/"
+    urls = list(iter_urls_from_warc_path(URL + "\n", prefix, str(tmp_path)))
+    assert urls == [prefix + warc for warc in warcs]
+
+
+def test_write_urls_reports_failure(tmp_path, monkeypatch) -> None:
+    stub_session(monkeypatch, [StubResponse(200, b"not gzip")])
+    output_path = str(tmp_path / "2025-18.txt")
+    assert write_urls_from_warc_path(URL, output_path, "", str(tmp_path)) is None
+    assert os.listdir(tmp_path) == ["data.example"]
+
+    stub_session(monkeypatch, [StubResponse(200, gzip.compress(b"a\nb\n"))])
+    assert write_urls_from_warc_path(URL, output_path, "", str(tmp_path)) == 2
+    assert read(output_path) == b"a\nb\n"
@@ -0,0 +1,87 @@
+import io
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from warcio.archiveiterator import ArchiveIterator
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from ccaudio.extract_url.cc_index import HTML_MIME_TYPES, query_index, warc_filename_of
+from ccaudio.extract_url.jsonl_io import read_jsonl
+from ccaudio.extract_url.url2html import process_warc
+from ccaudio.extract_url.warc_source import RecordRange, coalesce_ranges
+
+WARC_FILENAME = "crawl-data/CC-MAIN-2025-18/segments/0/warc/test.warc.gz"
+
+
+def write_warc(path: Path) -> list[dict]:
+    """Write a small WARC and return one columnar-index row per record"""
+    pages = []
+    for i in range(30):
+        lang, mime = [("ja", "text/html"), ("en", "text/html"), ("ja", "image/png")][
+            i % 3
+        ]
+        body = f'<html lang="{lang}"><body>{i}</body></html>'.encode()
+        pages.append((f"http://example.com/{i}", body, mime, lang))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        writer = WARCWriter(f, gzip=True)
+        for url, body, mime, _ in pages:
+            headers = StatusAndHeaders(
+                "200 OK", [("Content-Type", mime)], protocol="HTTP/1.0"
+            )
+            writer.write_record(
+                writer.create_warc_record(
+                    url, "response", payload=io.BytesIO(body), http_headers=headers
+                )
+            )
+
+    rows = []
+    with open(path, "rb") as f:
+        iterator = ArchiveIterator(f)
+        for (url, _, mime, lang), record in zip(pages, iterator):
+            record.content_stream().read()
+            rows.append(
+                {
+                    "url": url,
+                    "warc_filename": WARC_FILENAME,
+                    "warc_record_offset": iterator.get_record_offset(),
+                    "warc_record_length": iterator.get_record_length(),
+                    "content_mime_type": mime,
+                    "content_languages": "jpn" if lang == "ja" else "eng",
+                }
+            )
+    return rows
+
+
+def test_coalesce_ranges() -> None:
+    ranges = [RecordRange(0, 10), RecordRange(15, 10), RecordRange(1000, 10)]
+    blocks = coalesce_ranges(ranges, max_gap=100)
+    assert [(b.start, b.end) for b in blocks] == [(0, 25), (1000, 1010)]
+    assert coalesce_ranges(ranges, max_gap=100, max_size=20)[0].end == 10
+
+
+def test_ranged_fetch_matches_full_scan(tmp_path: Path) -> None:
+    warc_path = tmp_path / "mirror" / WARC_FILENAME
+    rows = write_warc(warc_path)
+    index_dir = tmp_path / "index" / "crawl=CC-MAIN-2025-18" / "subset=warc"
+    index_dir.mkdir(parents=True)
+    other = [{**row, "warc_filename": WARC_FILENAME + ".other"} for row in rows]
+    pq.write_table(pa.Table.from_pylist(rows + other), index_dir / "part-0.parquet")
+
+    index_path = str(tmp_path / "index")
+    assert len(query_index(index_path, HTML_MIME_TYPES, ["jpn"])) == 2
+    ranges = query_index(index_path, HTML_MIME_TYPES, ["jpn"], [WARC_FILENAME])
+    assert list(ranges) == [WARC_FILENAME]
+    assert warc_filename_of(str(warc_path)) == WARC_FILENAME
+    assert len(ranges[WARC_FILENAME]) == 10
+
+    full_path = str(tmp_path / "full.jsonl.gz")
+    ranged_path = str(tmp_path / "ranged.jsonl.gz")
+    process_warc(str(warc_path), full_path)
+    process_warc(str(warc_path), ranged_path, ranges=ranges[WARC_FILENAME])
+
+    assert list(read_jsonl(ranged_path)) == list(read_jsonl(full_path))
+    assert len(list(read_jsonl(ranged_path))) == 10
@@ -0,0 +1,102 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from ccaudio.extract_url.dedup import (
+    BloomFilter,
+    UrlIndex,
+    dedup_file,
+    normalize_url,
+    url_key,
+)
+from ccaudio.extract_url.jsonl_io import JsonlWriter, read_jsonl
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("http://Example.COM/ep/1.mp3", "https://example.com/ep/1.mp3"),
+        ("https://example.com:443/ep/1.mp3#t=10", "https://example.com/ep/1.mp3"),
+        ("https://example.com/feed/", "https://example.com/feed"),
+        (
+            "https://example.com/1.mp3?utm_source=rss&b=2&a=1&fbclid=x",
+            "https://example.com/1.mp3?a=1&b=2",
+        ),
+    ],
+)
+def test_normalize_url(a: str, b: str) -> None:
+    assert normalize_url(a) == normalize_url(b)
+
+
+def test_normalize_url_keeps_meaningful_parts() -> None:
+    assert normalize_url("https://a.com/1.mp3?id=1") != normalize_url(
+        "https://a.com/1.mp3?id=2"
+    )
+    assert normalize_url("https://a.com:8080/1.mp3") != normalize_url(
+        "https://a.com/1.mp3"
+    )
+    assert normalize_url("https://a.com/Ep.mp3") != normalize_url(
+        "https://a.com/ep.mp3"
+    )
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom = BloomFilter.for_capacity(1000, 0.01)
+    keys = [url_key(f"https://a.com/{i}.mp3") for i in range(1000)]
+    bloom.add(keys[:500])
+    assert bloom.contains(keys[:500]).all()
+    assert bloom.contains(keys[500:]).mean() < 0.05
+
+
+def test_incremental_dedup_across_snapshots(tmp_path) -> None:
+    index_dir = str(tmp_path / "index")
+    first = str(tmp_path / "first.parquet")
+    pq.write_table(
+        pa.table(
+            {
+                "audio_url": ["http://a.com/1.mp3", "https://a.com/1.mp3", "", None],
+                "title": ["t1", "dup", "empty", "none"],
+            }
+        ),
+        first,
+    )
+    index = UrlIndex(index_dir, capacity=1000)
+    assert dedup_file(index, first, str(tmp_path / "out1.parquet"), "2025-18") == (
+        4,
+        1,
+    )
+    index.close()
+    rows = pq.read_table(tmp_path / "out1.parquet").to_pylist()
+    assert rows == [
+        {"audio_url": "http://a.com/1.mp3", "title": "t1", "snapshot": "2025-18"}
+    ]
+
+    # A later snapshot only keeps unseen URLs
+    second = str(tmp_path / "second.jsonl.gz")
+    with JsonlWriter(second) as writer:
+        writer.write({"audio_url": "https://a.com/1.mp3?utm_medium=x"})
+        writer.write({"audio_url": "https://a.com/2.mp3"})
+    index = UrlIndex(index_dir, capacity=1000)
+    assert index.is_done("2025-18/first.parquet")
+    dedup_file(index, second, str(tmp_path / "out2.jsonl.gz"), "2025-21")
+    index.close()
+    assert list(read_jsonl(str(tmp_path / "out2.jsonl.gz"))) == [
+        {"audio_url": "https://a.com/2.mp3", "snapshot": "2025-21"}
+    ]
+
+    # A stale Bloom filter is rebuilt from the index
+    os.remove(os.path.join(index_dir, "bloom.npy"))
+    index = UrlIndex(index_dir, capacity=1000)
+    assert index.add_new(["https://a.com/2.mp3", "https://a.com/3.mp3"], "x", "y") == [
+        False,
+        True,
+    ]
+    provenance = index.conn.execute(
+        "SELECT audio_url, snapshot, source FROM urls ORDER BY snapshot"
+    ).fetchall()
+    assert provenance == [
+        ("http://a.com/1.mp3", "2025-18", "2025-18/first.parquet"),
+        ("https://a.com/2.mp3", "2025-21", "2025-21/second.jsonl.gz"),
+    ]
@@ -0,0 +1,94 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ccaudio.extract_url import fetch
+from ccaudio.extract_url.fetch import (
+    PrefetchExecutor,
+    open_url,
+    read_url_range,
+    resolve_location,
+)
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD with Range support; every response breaks after ``cut`` bytes"""
+
+    cut = 300_000
+    requests = []
+
+    def do_GET(self):
+        start, end = 0, len(PAYLOAD)
+        header = self.headers.get("Range")
+        type(self).requests.append(header)
+        if header:
+            first, last = header[len("bytes=") :].split("-")
+            start, end = int(first), int(last) + 1 if last else len(PAYLOAD)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(PAYLOAD[start : min(end, start + self.cut)])
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(fetch, "BACKOFF_FACTOR", 0)
+    FlakyHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/crawl-data/x/a.warc.gz"
+    httpd.shutdown()
+
+
+def test_broken_stream_is_resumed_with_range_requests(server) -> None:
+    with open_url(server) as f:
+        assert f.read() == PAYLOAD
+    assert FlakyHandler.requests[0] is None
+    assert FlakyHandler.requests[1:] == [
+        f"bytes={pos}-" for pos in range(300_000, len(PAYLOAD), 300_000)
+    ]
+    assert read_url_range(server, 100, 700_000) == PAYLOAD[100:700_000]
+
+
+def test_resume_gives_up_after_max_retries(server, monkeypatch) -> None:
+    monkeypatch.setattr(FlakyHandler, "cut", 1000)
+    with pytest.raises(fetch.RESUMABLE_ERRORS):
+        with open_url(server) as f:
+            f.read()
+
+
+def test_prefetch_and_local_mirror(server, tmp_path) -> None:
+    def size(path):
+        assert not fetch.is_remote(path)
+        return os.path.getsize(path)
+
+    spool_dir = str(tmp_path / "spool")
+    with (
+        ThreadPoolExecutor(2) as pool,
+        PrefetchExecutor(pool, 2, spool_dir) as executor,
+    ):
+        futures = [executor.submit(size, server) for _ in range(3)]
+        assert [f.result() for f in futures] == [len(PAYLOAD)] * 3
+    assert os.listdir(spool_dir) == []
+
+    mirror = tmp_path / "mirror"
+    assert resolve_location(server, str(mirror)) == server
+    (mirror / "crawl-data" / "x").mkdir(parents=True)
+    (mirror / "crawl-data" / "x" / "a.warc.gz").write_bytes(b"warc")
+    assert resolve_location(server, str(mirror)) == str(
+        mirror / "crawl-data" / "x" / "a.warc.gz"
+    )
@@ -0,0 +1,113 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ccaudio.fingerprint import (
+    find_duplicates,
+    fingerprint_dirs,
+    landmark_hashes,
+    load_drop_list,
+    minhash,
+    permutations,
+)
+from ccaudio.synthetic import SyntheticSpec, make_signal, write_synthetic_shar
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    perms = permutations()
+    return float(
+        (
+            minhash(landmark_hashes(a), perms) == minhash(landmark_hashes(b), perms)
+        ).mean()
+    )
+
+
+def test_landmarks_survive_gain_shift_and_noise() -> None:
+    spec = SyntheticSpec("speech", 8000, 1, 20.0)
+    audio = make_signal(spec, np.random.default_rng(1))[0]
+    noise = np.random.default_rng(0).standard_normal(len(audio)).astype(np.float32)
+    other = make_signal(spec, np.random.default_rng(2))[0]
+
+    assert similarity(audio, 0.3 * audio) > 0.9
+    assert similarity(audio, audio[1000:]) > 0.4
+    assert similarity(audio, audio + 0.01 * noise) > 0.4
+    assert similarity(audio, other) < 0.2
+
+
+def test_duplicates_across_shar_dirs(tmp_path) -> None:
+    # Snapshots crawled with the default SHAR_OUTPUT_DIR share the dir name
+    a = tmp_path / "2025-13" / "ccaudio_raw"
+    b = tmp_path / "2025-18" / "ccaudio_raw"
+    # 同じ乱数列から作るので 1 つ目のカットは標本化周波数違いの同じ音声になる
+    write_synthetic_shar(
+        a,
+        [
+            SyntheticSpec("speech", 16000, 1, 10.0),
+            SyntheticSpec("mixture", 16000, 1, 10.0),
+        ],
+        shard_size=1,
+    )
+    write_synthetic_shar(
+        b,
+        [
+            SyntheticSpec("speech", 8000, 1, 10.0),
+            SyntheticSpec("speech", 8000, 1, 10.0),
+        ],
+        shard_size=1,
+    )
+    output_dir = tmp_path / "fingerprint"
+    paths = fingerprint_dirs([str(a), str(b)], str(output_dir), num_workers=2)
+    assert len(paths) == 4
+    stats = find_duplicates(paths, str(output_dir))
+
+    assert stats["dropped"] == 1
+    assert (output_dir / "drop.txt").read_text().split() == [f"{b}/audio_00000000"]
+    assert len((output_dir / "keep.txt").read_text().split()) == 3
+    record = json.loads((output_dir / "duplicates.jsonl").read_text())
+    assert record["keep"] == f"{a}/audio_00000000"
+
+    drop_list = str(output_dir / "drop.txt")
+    assert load_drop_list(drop_list, b) == {"audio_00000000"}
+    assert load_drop_list(drop_list, a) == set()
+    assert load_drop_list(None, a) == set()
+
+    with pytest.raises(ValueError):
+        fingerprint_dirs([str(a), str(a) + "/"], str(output_dir))
+
+
+def test_fingerprint_dirs_is_incremental(tmp_path) -> None:
+    shar_dir = tmp_path / "ccaudio_raw"
+    specs = [SyntheticSpec("speech", 8000, 1, 2.0)] * 3
+    write_synthetic_shar(shar_dir, specs, shard_size=1)
+    output_dir = str(tmp_path / "fingerprint")
+    paths = fingerprint_dirs([str(shar_dir)], output_dir, num_workers=1)
+    mtimes = [os.stat(path).st_mtime_ns for path in paths]
+
+    # Unchanged shards are not fingerprinted again
+    assert fingerprint_dirs([str(shar_dir)], output_dir, num_workers=1) == paths
+    assert [os.stat(path).st_mtime_ns for path in paths] == mtimes
+
+    # A shard that grew is redone; an unreadable one is skipped without failing
+    write_synthetic_shar(shar_dir, [specs[0]] * 3, shard_size=2)
+    cuts_path = shar_dir / "cuts.000001.jsonl.gz"
+    cuts_path.write_bytes(cuts_path.read_bytes()[:20])
+    paths = fingerprint_dirs([str(shar_dir)], output_dir, num_workers=1)
+    assert len(paths) == 3
+    assert os.stat(paths[0]).st_mtime_ns != mtimes[0]
+    with np.load(paths[0]) as data:
+        assert list(data["cut_ids"]) == ["audio_00000000", "audio_00000001"]
+    # Signatures of the earlier version of the unreadable shard are kept
+    assert os.stat(paths[1]).st_mtime_ns == mtimes[1]
+
+
+def test_find_duplicates_without_signatures(tmp_path) -> None:
+    empty_dir = tmp_path / "ccaudio_raw"
+    empty_dir.mkdir()
+    output_dir = tmp_path / "fingerprint"
+    paths = fingerprint_dirs([str(empty_dir)], str(output_dir))
+    assert paths == []
+    assert find_duplicates(paths, str(output_dir))["cuts"] == 0
+    assert (output_dir / "drop.txt").read_text() == ""
+    assert load_drop_list(str(output_dir / "drop.txt"), empty_dir) == set()
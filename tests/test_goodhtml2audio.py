@@ -0,0 +1,84 @@
+import pytest
+from bs4 import BeautifulSoup
+
+from ccaudio.extract_url.goodhtml2audio import (
+    LICENSE_ATTRS,
+    TextIndex,
+    extract_audio_url_pairs,
+    extract_audio_url_pairs_bs4,
+    extract_audio_url_pairs_lxml,
+    has_audio_candidates,
+)
+
+PAGES = [
+    # <audio> with nested <source>, license inherited from an ancestor
+    """<!DOCTYPE html><html><head><title>t</title></head><body>
+    <div data-license="CC-BY"><p>第1回</p>
+    <audio src="/a/1.mp3"></audio>
+    <audio controls><source src="2.ogg?x=1" type="audio/ogg"></audio></div>
+    </body></html>""",
+    # Links with titles, surrounding text, comments and duplicates
+    """<html><body><p>前の文</p><!-- note -->
+    <a href="https://cdn.example.com/ep.MP3" title="Episode">DL</a>
+    <a href="https://cdn.example.com/ep.MP3">again</a>
+    <span license="CC0"><embed src="clip.wav#t=3"></span>
+    <a href="page.html">not audio</a> after</body></html>""",
+    # Nearest license wins, empty license stops the search
+    """<html><body><div license="outer"><p data-licence="">
+    <a href="x.flac">x</a></p><a href="y.m4a"></a></div>
+    <script>var s = "z.aac";</script><a href="z.aac">z</a></body></html>""",
+    # Content after </html> ends up in sibling roots in lxml
+    "<html><body><p>a</p></body></html><a href='m.mp3'>after html</a>",
+    """<html><body><p>a</p></body></html>
+<!-- end --><div><a href='q.mp3'>q</a></div>""",
+    "<html><body><audio src='a.mp3'></audio></body></html><p>t</p>"
+    "<audio><source src='b.ogg'></audio>",
+    # Leading comment and <?xml?> prolog, before and after the DOCTYPE
+    "<!-- lead --><html><body><a href='x.mp3'></a><p>a</p></body></html>",
+    "<?xml version='1.0'?><html><body><a href='x.mp3'></a><p>a</p></body></html>",
+    """<?xml version="1.0" encoding="utf-8"?>
+<!-- c --> <!DOCTYPE html><!-- d --><html><body>
+<a href="x.mp3"></a></body></html>""",
+    # No audio at all
+    "<html><body><p>音声なし</p><a href='/page'>link</a></body></html>",
+    "",
+]
+
+
+@pytest.mark.parametrize("html", PAGES)
+def test_lxml_matches_beautifulsoup(html: str) -> None:
+    base_url = "https://example.com/dir/page.html"
+    assert extract_audio_url_pairs_lxml(html, base_url) == extract_audio_url_pairs_bs4(
+        html, base_url
+    )
+
+
+@pytest.mark.parametrize("html", PAGES)
+def test_prefilter_keeps_every_candidate(html: str) -> None:
+    base_url = "https://example.com/dir/page.html"
+    if not has_audio_candidates(html, base_url):
+        assert extract_audio_url_pairs_bs4(html, base_url) == []
+
+
+def test_prefilter_with_audio_page_url() -> None:
+    # An empty href resolves to the page itself
+    html = "<html><body><a href=''>self</a></body></html>"
+    base_url = "https://example.com/ep.mp3"
+    assert has_audio_candidates(html, base_url)
+    assert extract_audio_url_pairs(html, base_url)[0]["audio_url"] == base_url
+
+
+@pytest.mark.parametrize("html", PAGES)
+def test_text_index_matches_tree_walk(html: str) -> None:
+    soup = BeautifulSoup(html, "html.parser")
+    index = TextIndex(soup)
+    for tag in soup.find_all(True):
+        assert index.previous_string(tag) is tag.find_previous(string=True)
+        assert index.next_string(tag) is tag.find_next(string=True)
+        licenses = [
+            ancestor[attr]
+            for ancestor in [tag] + list(tag.parents)
+            for attr in LICENSE_ATTRS
+            if attr in ancestor.attrs
+        ]
+        assert index.license(tag) == (licenses[0] if licenses else "")
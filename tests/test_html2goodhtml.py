@@ -0,0 +1,99 @@
+import sys
+from collections import Counter, OrderedDict
+from types import ModuleType
+
+import pytest
+
+from ccaudio.extract_url import html2goodhtml
+from ccaudio.extract_url.html2goodhtml import classify_texts, filter_page
+
+JA_PARAGRAPH = (
+    "このポッドキャストでは、毎週新しい話題をお届けしています。"
+    "今回は地域の図書館で働く方々にお話を伺い、本の選び方について考えました。"
+)
+EN_PARAGRAPH = (
+    "This podcast brings you a new topic every week. This time we talked to "
+    "people working at the local library about how they choose books."
+)
+
+
+def page(title: str, paragraph: str) -> dict:
+    body = "".join(f"<p>{paragraph}</p>" for _ in range(5))
+    html = (
+        f"<html><head><title>{title}</title></head><body>"
+        f"<nav>Home Menu Login</nav><article><h1>{title}</h1>{body}</article>"
+        "</body></html>"
+    )
+    return {"url": "https://example.com/episode", "html": html}
+
+
+class StubClassifier:
+    def __init__(self):
+        self.calls = []
+
+    def classify(self, text: str) -> float:
+        self.calls.append(text)
+        return len(text) / 1000
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    model = StubClassifier()
+    monkeypatch.setattr(html2goodhtml, "_model", model)
+    monkeypatch.setattr(html2goodhtml, "_quality_cache", OrderedDict())
+    return model
+
+
+def test_filter_page_keeps_japanese_and_rejects_english() -> None:
+    stats = Counter()
+    accepted = filter_page(
+        page("第1回 図書館", JA_PARAGRAPH), stats, ja_detector="builtin"
+    )
+    assert accepted["title"] == "第1回 図書館"
+    assert "図書館" in accepted["text"]
+
+    assert (
+        filter_page(page("Episode 1", EN_PARAGRAPH), stats, ja_detector="builtin")
+        is None
+    )
+    assert stats["rejected_ja_ratio"] == 1
+    # Without the prefilter the final language check rejects it
+    assert (
+        filter_page(page("Episode 1", EN_PARAGRAPH), stats, 0, ja_detector="builtin")
+        is None
+    )
+    assert stats["rejected_is_japanese"] == 1
+    assert stats["pages"] == 3
+
+
+def test_classify_texts_caches_scores(stub_model, monkeypatch) -> None:
+    assert classify_texts(["a", "bb", "a"]) == [0.001, 0.002, 0.001]
+    assert stub_model.calls == ["a", "bb"]
+    assert classify_texts(["bb", "ccc"]) == [0.002, 0.003]
+    assert stub_model.calls == ["a", "bb", "ccc"]
+
+    monkeypatch.setattr(html2goodhtml, "QUALITY_CACHE_SIZE", 2)
+    classify_texts(["dddd"])
+    classify_texts(["a"])
+    assert stub_model.calls[-1] == "a"
+
+
+def test_get_model_loads_crawl_mm_classifier(monkeypatch) -> None:
+    module = ModuleType("crawl_mm.utils.edu_classifier")
+    module.QualityClassifier = StubClassifier
+    monkeypatch.setitem(sys.modules, "crawl_mm", ModuleType("crawl_mm"))
+    monkeypatch.setitem(sys.modules, "crawl_mm.utils", ModuleType("crawl_mm.utils"))
+    monkeypatch.setitem(sys.modules, "crawl_mm.utils.edu_classifier", module)
+    monkeypatch.setattr(html2goodhtml, "_model", None)
+
+    model = html2goodhtml.get_model()
+    assert isinstance(model, StubClassifier)
+    assert html2goodhtml.get_model() is model
+
+
+def test_score_pages(stub_model) -> None:
+    stats = Counter()
+    accepted = filter_page(page("第1回", JA_PARAGRAPH), stats, ja_detector="builtin")
+    [record] = html2goodhtml.score_pages([accepted], stats)
+    assert record["quality"] == len(accepted["text"]) / 1000
+    assert stats["classify_seconds"] > 0
@@ -0,0 +1,41 @@
+import pytest
+
+from ccaudio.extract_url.ja_detect import count_scripts, is_japanese, japanese_ratio
+
+JA = "吾輩は猫である。名前はまだ無い。どこで生れたかとんと見当がつかぬ。"
+ZH = "我是一只猫。我还没有名字。我不知道自己是在哪里出生的。"
+EN = "I am a cat. As yet I have no name. I have no idea where I was born."
+KO = "나는 고양이로소이다. 이름은 아직 없다."
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (JA, True),
+        (JA + " " + EN, True),
+        (ZH, False),
+        (EN, False),
+        (KO, False),
+        ("カタカナ", False),  # too short
+        ("", False),
+    ],
+)
+def test_is_japanese(text: str, expected: bool) -> None:
+    assert is_japanese(text) is expected
+    assert is_japanese(text.encode("utf-8")) is expected
+
+
+def test_counts_match_on_str_and_utf8_bytes() -> None:
+    text = f"{JA}\n\t{EN}　😀é"
+    counts = count_scripts(text)
+    assert counts == count_scripts(text.encode("utf-8"))
+    assert counts.kana == sum("぀" <= c <= "ヿ" for c in text)
+    assert counts.chars == sum(not c.isspace() for c in text)
+    assert japanese_ratio(text) == pytest.approx(counts.japanese / counts.chars)
+
+
+def test_long_texts_are_sampled() -> None:
+    text = EN * 200 + JA * 200
+    counts = count_scripts(text, sample_chars=400)
+    assert counts.chars <= 400
+    assert 0 < counts.japanese < counts.chars
@@ -0,0 +1,51 @@
+import pyarrow.parquet as pq
+
+from ccaudio.extract_url.json2parquet import convert_group
+from ccaudio.extract_url.jsonl_io import JsonlWriter
+
+
+def test_convert_group_rolls_files_and_row_groups(tmp_path) -> None:
+    input_paths = []
+    records = []
+    for i in range(3):
+        path = str(tmp_path / f"{i}.jsonl.gz")
+        with JsonlWriter(path) as writer:
+            for j in range(250):
+                record = {
+                    "audio_url": f"https://a.example/{i}/{j}.mp3",
+                    "title": f"タイトル{j}",
+                    "description": "x" * (j % 50),
+                    "language": ["ja", "en", None][j % 3],
+                    "page_url": f"https://a.example/{i}",
+                    "extra": j,
+                }
+                writer.write(record)
+                records.append(record)
+        input_paths.append(path)
+
+    template = str(tmp_path / "group_00000_{part:03d}.parquet")
+    num_rows = convert_group(
+        input_paths, template, "rss", row_group_size=100, max_file_size=4096
+    )
+    assert num_rows == len(records)
+
+    paths = sorted(tmp_path.glob("group_00000_*.parquet"))
+    assert len(paths) > 1
+    assert not list(tmp_path.glob("*.tmp"))
+    rows = []
+    for path in paths:
+        parquet_file = pq.ParquetFile(path)
+        assert all(
+            parquet_file.metadata.row_group(i).num_rows <= 100
+            for i in range(parquet_file.num_row_groups)
+        )
+        column = parquet_file.metadata.row_group(0).column(3)
+        assert column.path_in_schema == "language"
+        assert "RLE_DICTIONARY" in column.encodings
+        assert column.compression == "ZSTD"
+        rows.extend(parquet_file.read().to_pylist())
+    expected = [
+        {key: value for key, value in record.items() if key != "extra"}
+        for record in records
+    ]
+    assert rows == expected
@@ -0,0 +1,49 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ccaudio.extract_url.lease import LeaseQueue, lease_status, run_jobs
+
+
+def test_claim_is_exclusive_and_expired_leases_are_reclaimed(tmp_path) -> None:
+    first = LeaseQueue(str(tmp_path), ttl=60)
+    second = LeaseQueue(str(tmp_path), ttl=60)
+    lease = first.claim("a.jsonl.gz")
+    assert lease is not None
+    assert second.claim("a.jsonl.gz") is None
+
+    # The first owner crashed: its lease stops being refreshed
+    old = time.time() - 120
+    os.utime(lease.path, (old, old))
+    assert lease_status(str(tmp_path), ttl=60)["expired"] == 1
+    reclaimed = second.claim("a.jsonl.gz")
+    assert reclaimed is not None and reclaimed.token != lease.token
+
+    # Releasing a lease we no longer own leaves the new owner's lease alone
+    first.release(lease)
+    assert os.path.exists(reclaimed.path)
+    second.complete(reclaimed)
+    assert not os.path.exists(reclaimed.path)
+    assert first.claim("a.jsonl.gz") is None
+    assert lease_status(str(tmp_path))["done"] == 1
+
+
+def test_run_skips_done_work_and_waits_for_other_nodes(tmp_path) -> None:
+    other = LeaseQueue(str(tmp_path), ttl=0.5)
+    # "b" is held by a node that crashes right away, "c" was done elsewhere
+    assert other.claim("b") is not None
+    other.complete(other.claim("c"))
+
+    leases = LeaseQueue(str(tmp_path), ttl=0.5, heartbeat=0.1, poll=0.1)
+    jobs = [(key, str.upper, (key,)) for key in ["a", "b", "c"]]
+    start = time.monotonic()
+    with ThreadPoolExecutor(2) as executor:
+        results = dict(run_jobs(executor, jobs, leases))
+    assert results == {"a": "A", "b": "B"}
+    assert time.monotonic() - start >= 0.4
+    assert lease_status(str(tmp_path), ttl=0.5) == {
+        "done": 3,
+        "active": 0,
+        "expired": 0,
+        "hosts": set(),
+    }
@@ -0,0 +1,35 @@
+from ccaudio.loader import LoaderStats, iter_batches
+from ccaudio.synthetic import SyntheticSpec, write_synthetic_shar
+
+
+def test_batches_are_capped_padded_and_complete(tmp_path) -> None:
+    shar_dir = tmp_path / "shar"
+    durations = [0.5, 3.0, 0.6, 2.8, 0.4, 3.2, 1.5, 0.5]
+    specs = [
+        SyntheticSpec("tone", [16000, 8000][i % 2], 1 + i % 2, duration)
+        for i, duration in enumerate(durations)
+    ]
+    write_synthetic_shar(str(shar_dir), specs, shard_size=3)
+
+    stats = LoaderStats(8000)
+    seen = []
+    for batch in iter_batches(
+        shar_dir,
+        max_duration=4.0,
+        sampling_rate=8000,
+        num_buckets=2,
+        shuffle_buffer=100,
+        num_workers=2,
+        prefetch=1,
+        stats=stats,
+    ):
+        assert batch.audio.shape == (len(batch.cut_ids), batch.lengths.max())
+        assert batch.lengths.sum() <= 4.0 * 8000
+        for row, length in zip(batch.audio, batch.lengths):
+            assert not row[length:].any()
+        seen.extend(batch.cut_ids)
+
+    assert sorted(seen) == [f"audio_{i:08d}" for i in range(len(specs))]
+    summary = stats.summary()
+    assert summary["cuts"] == len(specs)
+    assert 0 <= summary["padding_ratio"] < 1
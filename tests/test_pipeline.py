@@ -0,0 +1,107 @@
+import io
+import sys
+from types import ModuleType
+
+import pytest
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from ccaudio.extract_url.jsonl_io import read_jsonl
+from ccaudio.extract_url.pipeline import parse_args, plan_tasks, run_pipeline
+
+PARAGRAPH = (
+    "このポッドキャストでは、毎週新しい話題をお届けしています。"
+    "今回は地域の図書館で働く方々にお話を伺い、本の選び方について考えました。"
+)
+
+
+def japanese_page(i: int) -> bytes:
+    body = "".join(f"<p>{PARAGRAPH}</p>" for _ in range(5))
+    return (
+        f'<html lang="ja"><head><title>第{i}回</title></head><body><article>'
+        f"<h1>第{i}回</h1>{body}<p>音声はこちら "
+        f'<a href="https://cdn.example.com/{i}.mp3">第{i}回</a></p></article>'
+        "</body></html>"
+    ).encode()
+
+
+def write_warc(path, pages) -> None:
+    with open(path, "wb") as f:
+        writer = WARCWriter(f, gzip=True)
+        for url, body in pages:
+            headers = StatusAndHeaders(
+                "200 OK",
+                [("Content-Type", "text/html; charset=utf-8")],
+                protocol="HTTP/1.0",
+            )
+            writer.write_record(
+                writer.create_warc_record(
+                    url, "response", payload=io.BytesIO(body), http_headers=headers
+                )
+            )
+
+
+class StubClassifier:
+    def classify(self, text: str) -> float:
+        return 0.5
+
+
+@pytest.fixture
+def stub_crawl_mm(monkeypatch):
+    # Worker processes are forked and inherit the stub
+    module = ModuleType("crawl_mm.utils.edu_classifier")
+    module.QualityClassifier = StubClassifier
+    monkeypatch.setitem(sys.modules, "crawl_mm", ModuleType("crawl_mm"))
+    monkeypatch.setitem(sys.modules, "crawl_mm.utils", ModuleType("crawl_mm.utils"))
+    monkeypatch.setitem(sys.modules, "crawl_mm.utils.edu_classifier", module)
+
+
+def test_run_pipeline_commits_per_warc_and_resumes(tmp_path, stub_crawl_mm) -> None:
+    good = tmp_path / "good.warc.gz"
+    write_warc(
+        good,
+        [(f"https://example.com/{i}", japanese_page(i)) for i in range(5)]
+        + [("https://example.com/en", b'<html lang="en"><body>hi</body></html>')],
+    )
+    missing = tmp_path / "missing.warc.gz"
+    # Fails after some of its batches have been written
+    corrupt = tmp_path / "corrupt.warc.gz"
+    write_warc(
+        corrupt, [(f"https://example.com/c{i}", japanese_page(i)) for i in range(8)]
+    )
+    data = bytearray(corrupt.read_bytes())
+    middle = len(data) * 3 // 4
+    data[middle : middle + 64] = bytes(64)
+    corrupt.write_bytes(bytes(data))
+    input_paths = [str(good), str(missing), str(corrupt)]
+    args = parse_args(
+        [
+            "--num_scanners=2",
+            "--num_workers=2",
+            "--batch_size=2",
+            "--queue_size=1",
+            "--ja_detector=builtin",
+            "--persist",
+            "goodhtml",
+            "--compression=none",
+        ]
+    )
+    dirs = [str(tmp_path / name) for name in ("out", "html", "goodhtml")]
+    for d in dirs:
+        (tmp_path / d).mkdir()
+
+    tasks, output_paths, goodhtml_paths = plan_tasks(input_paths, *dirs, args)
+    assert len(tasks) == 3
+    assert run_pipeline(tasks, output_paths, goodhtml_paths, args) == 2
+
+    records = list(read_jsonl(output_paths[str(good)]))
+    assert sorted(r["audio_url"] for r in records) == [
+        f"https://cdn.example.com/{i}.mp3" for i in range(5)
+    ]
+    assert all(r["quality"] == 0.5 for r in records)
+    assert len(list(read_jsonl(goodhtml_paths[str(good)]))) == 5
+    # Failed WARCs leave nothing behind, so only they are planned again
+    for d in ("out", "goodhtml"):
+        assert [p.name for p in (tmp_path / d).iterdir()] == ["good.jsonl"]
+    tasks, _, _ = plan_tasks(input_paths, *dirs, args)
+    assert [task[0] for task in tasks] == [str(missing), str(corrupt)]
@@ -4,6 +4,7 @@ from demucs.api import Separator
 from lhotse import CutSet, MonoCut, MultiCut
 
 from ccaudio.preprocess import convert_audio, separate
+from ccaudio.synthetic import SyntheticSpec, write_synthetic_shar
 
 
 def test_preprocess() -> None:
@@ -22,3 +23,23 @@ def test_preprocess() -> None:
         c = separate(c, separator, Path("."))
 
         break
+
+
+def test_convert_audio_synthetic(tmp_path: Path) -> None:
+    specs = [
+        SyntheticSpec("speech", 44100, 2, 1.0),
+        SyntheticSpec("mixture", 16000, 1, 1.0),
+    ]
+    write_synthetic_shar(tmp_path, specs)
+
+    cut_paths = sorted(list(map(str, tmp_path.glob("cuts.*.jsonl.gz"))))
+    recording_paths = sorted(list(map(str, tmp_path.glob("recording.*.tar"))))
+    cuts = CutSet.from_shar({"cuts": cut_paths, "recording": recording_paths})
+
+    for cut, spec in zip(cuts.data, specs):
+        assert cut.sampling_rate == spec.sampling_rate
+        assert cut.num_channels == spec.num_channels
+        c = convert_audio(cut, 16000)
+        assert isinstance(c, MonoCut)
+        assert c.sampling_rate == 16000
+        assert c.load_audio().shape == (1, 16000)
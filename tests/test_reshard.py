@@ -0,0 +1,95 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from lhotse import CutSet
+
+from ccaudio.cli import main
+from ccaudio.reshard import reshard
+from ccaudio.synthetic import SyntheticSpec, write_synthetic_shar
+
+
+def load(shar_dir) -> dict:
+    cuts = CutSet.from_shar(in_dir=str(shar_dir))
+    return {cut.id: (cut, cut.load_audio()) for cut in cuts}
+
+
+def test_reshard_by_duration_keeps_audio(tmp_path) -> None:
+    shar_dir = tmp_path / "shar"
+    specs = [SyntheticSpec("tone", 16000, 1 + i % 2, 1.0) for i in range(7)]
+    write_synthetic_shar(shar_dir, specs, shard_size=3)
+    before = load(shar_dir)
+
+    output_dir = tmp_path / "resharded"
+    stats = reshard([str(shar_dir)], str(output_dir), shard_seconds=2.5, num_workers=2)
+
+    assert stats["cuts"] == 7
+    assert stats["output_shards"] == 4
+    assert sorted(os.listdir(output_dir))[:2] == [
+        "cuts.000000.jsonl.gz",
+        "cuts.000001.jsonl.gz",
+    ]
+    after = load(output_dir)
+    assert list(after) == list(before)
+    for cut_id, (cut, audio) in after.items():
+        assert cut.num_channels == before[cut_id][0].num_channels
+        np.testing.assert_array_equal(audio, before[cut_id][1])
+
+
+def test_reshard_drops_incomplete_tail(tmp_path) -> None:
+    shar_dir = tmp_path / "shar"
+    write_synthetic_shar(
+        shar_dir, [SyntheticSpec("noise", 16000, 1, 1.0)] * 5, shard_size=3
+    )
+    # 書き込み途中で止まったシャードを模擬する
+    tar_path = shar_dir / "recording.000001.tar"
+    os.truncate(tar_path, tar_path.stat().st_size // 2)
+
+    output_dir = tmp_path / "resharded"
+    main(["reshard", str(shar_dir), "--output_dir", str(output_dir), "--shard_mb", "1"])
+
+    after = load(output_dir)
+    assert list(after)[:3] == [f"audio_{i:08d}" for i in range(3)]
+    assert "audio_00000004" not in after
+
+
+def test_reshard_renames_ids_shared_across_inputs(tmp_path) -> None:
+    # どのクロールも audio_00000000 から番号を振る
+    first, second = tmp_path / "2025-13", tmp_path / "2025-18"
+    write_synthetic_shar(first, [SyntheticSpec("tone", 16000, 1, 1.0)] * 3, 2)
+    write_synthetic_shar(second, [SyntheticSpec("noise", 8000, 2, 1.0)] * 2, 1)
+    before = {
+        **load(first),
+        **{f"1_{cut_id}": value for cut_id, value in load(second).items()},
+    }
+
+    output_dir = tmp_path / "resharded"
+    stats = reshard([str(first), str(second)], str(output_dir), shard_bytes=1e6)
+
+    assert stats["cuts"] == 5
+    assert stats["renamed_cuts"] == 2
+    after = load(output_dir)
+    assert list(after) == list(before)
+    for cut_id, (cut, audio) in after.items():
+        assert cut.recording.id == cut_id
+        assert cut.sampling_rate == before[cut_id][0].sampling_rate
+        np.testing.assert_array_equal(audio, before[cut_id][1])
+
+    with pytest.raises(ValueError):
+        reshard([str(first), str(second)], str(first), shard_bytes=1e6)
+
+
+def test_reshard_requires_every_field(tmp_path) -> None:
+    first, second = tmp_path / "a", tmp_path / "b"
+    write_synthetic_shar(first, [SyntheticSpec("tone", 16000, 1, 1.0)] * 2)
+    write_synthetic_shar(second, [SyntheticSpec("tone", 16000, 1, 1.0)] * 2)
+    shutil.copy(second / "recording.000000.tar", second / "extra.000000.tar")
+
+    output_dir = str(tmp_path / "resharded")
+    with pytest.raises(ValueError, match="extra"):
+        reshard([str(first), str(second)], output_dir, shard_bytes=1e6)
+    stats = reshard(
+        [str(first), str(second)], output_dir, shard_bytes=1e6, fields=["recording"]
+    )
+    assert (stats["cuts"], stats["dropped_cuts"]) == (4, 0)
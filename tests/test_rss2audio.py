@@ -0,0 +1,125 @@
+import pytest
+from warcio.statusandheaders import StatusAndHeaders
+
+from ccaudio.extract_url.rss2audio import (
+    extract_audio_urls_from_rss,
+    extract_audio_urls_from_rss_soup,
+    is_rss_feed,
+)
+
+NAMESPACES = (
+    'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" '
+    'xmlns:media="http://search.yahoo.com/mrss/" '
+    'xmlns:dc="http://purl.org/dc/elements/1.1/"'
+)
+
+FEEDS = [
+    # enclosure, itunes:title before title, CDATA description
+    f"""<?xml version="1.0"?><rss {NAMESPACES}><channel><language>ja</language>
+    <item><itunes:title>IT</itunes:title><title>T</title>
+    <description><![CDATA[<b>説明</b>]]></description>
+    <enclosure url="https://a.example/1.mp3"/></item></channel></rss>""",
+    # media:content fallback, url-less enclosure, non-audio item
+    f"""<rss {NAMESPACES}><channel><dc:language>en</dc:language>
+    <item><enclosure type="audio/mpeg"/><media:content url="https://a/2.m4a">
+    <media:title>MT</media:title></media:content><title>T2</title></item>
+    <item><enclosure url="https://a/3.mp4"/></item></channel></rss>""",
+    # language after the items, second channel's language is ignored
+    """<rss><channel><item><title> spaced </title>
+    <enclosure url="https://a/4.ogg"/></item><language>ja-JP</language></channel>
+    <channel><language>fr</language></channel></rss>""",
+    # no channel, undeclared prefix, entity
+    """<rdf><item><x:title>a &amp; b</x:title><enclosure url="https://a/5.wav"/>
+    </item></rdf>""",
+    # broken markup
+    """<rss><channel><language>ja</language><item><title>broken
+    <enclosure url="https://a/6.flac"/></item></channel>""",
+    "",
+]
+
+
+@pytest.mark.parametrize("feed", FEEDS)
+def test_iterparse_matches_beautifulsoup(feed: str) -> None:
+    xml = feed.encode()
+    assert extract_audio_urls_from_rss(xml) == extract_audio_urls_from_rss_soup(xml)
+
+
+def test_is_rss_feed() -> None:
+    def headers(content_type):
+        return StatusAndHeaders("200 OK", [("Content-Type", content_type)])
+
+    assert is_rss_feed(headers("application/rss+xml"), b"")
+    assert is_rss_feed(headers("text/plain"), b"  \n<?xml version='1.0'?>")
+    assert not is_rss_feed(headers("text/html"), b"<!doctype html>")
+    assert not is_rss_feed(headers("image/png"), b"<rss>")
+
+
+def test_feed_cache_skips_seen_feeds_and_episodes(tmp_path) -> None:
+    from ccaudio.extract_url.feed_cache import FeedCache
+
+    path = str(tmp_path / "feeds.sqlite")
+    cache = FeedCache(path)
+    assert not cache.seen_feed("https://a/feed", b"v1")
+    # Only feeds whose episodes were extracted are recorded
+    assert not cache.seen_feed("https://a/feed", b"v1")
+    cache.add_feed("https://a/feed", b"v1")
+    assert cache.seen_feed("https://a/feed", b"v1")
+    assert cache.new_episodes(["u1", "u2"]) == {"u1", "u2"}
+    cache.commit()
+    cache.close()
+
+    # Uncommitted keys are dropped, committed ones persist across instances
+    cache = FeedCache(path)
+    assert cache.seen_feed("https://a/feed", b"v1")
+    assert not cache.seen_feed("https://a/feed", b"v2")
+    assert cache.new_episodes(["u2", "u3"]) == {"u3"}
+    cache.close()
+    cache = FeedCache(path)
+    assert cache.new_episodes(["u3"]) == {"u3"}
+
+
+def test_feed_that_fails_to_parse_is_retried(tmp_path, monkeypatch) -> None:
+    from types import SimpleNamespace
+
+    from ccaudio.extract_url import rss2audio
+
+    class Payload:
+        def __init__(self, data):
+            self.data = data
+
+        def head(self, size):
+            return self.data[:size]
+
+        def read(self):
+            return self.data
+
+    record = SimpleNamespace(
+        http_headers=StatusAndHeaders(
+            "200 OK", [("Content-Type", "application/rss+xml")]
+        ),
+        rec_headers=StatusAndHeaders(
+            "WARC/1.0", [("WARC-Target-URI", "https://a.example/feed")]
+        ),
+    )
+    feed = FEEDS[0].encode()
+
+    def broken(xml_content):
+        raise ValueError("broken")
+
+    path = str(tmp_path / "feeds.sqlite")
+    handler = rss2audio.RssFeedHandler(path)
+    with monkeypatch.context() as m:
+        m.setattr(rss2audio, "extract_audio_urls_from_rss", broken)
+        assert list(handler.process(record, Payload(feed))) == []
+    handler.finish()
+    assert handler.stats["parse_errors"] == 1
+
+    handler = rss2audio.RssFeedHandler(path)
+    entries = list(handler.process(record, Payload(feed)))
+    assert [e["audio_url"] for e in entries] == ["https://a.example/1.mp3"]
+    handler.finish()
+
+    handler = rss2audio.RssFeedHandler(path)
+    assert list(handler.process(record, Payload(feed))) == []
+    assert handler.stats["unchanged_feeds"] == 1
+    handler.finish()
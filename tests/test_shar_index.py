@@ -0,0 +1,53 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+from lhotse import CutSet
+
+from ccaudio.shar_index import SharIndex, build, index_shard
+from ccaudio.synthetic import SyntheticSpec, write_synthetic_shar
+
+
+def test_lookup_matches_sequential_read(tmp_path) -> None:
+    shar_dir = tmp_path / "shar"
+    specs = [
+        SyntheticSpec("tone", 16000, 1, 1.0),
+        SyntheticSpec("noise", 16000, 2, 1.0),
+        SyntheticSpec("speech", 8000, 1, 0.5),
+    ]
+    write_synthetic_shar(shar_dir, specs, shard_size=2)
+    assert build(shar_dir, num_workers=1) == 3
+    # Up-to-date shards are not indexed again
+    assert build(shar_dir, num_workers=1) == 0
+
+    cuts = CutSet.from_shar(
+        {
+            "cuts": sorted(map(str, shar_dir.glob("cuts.*.jsonl.gz"))),
+            "recording": sorted(map(str, shar_dir.glob("recording.*.tar"))),
+        }
+    )
+    with SharIndex(shar_dir) as index:
+        assert len(index) == 3
+        for cut in reversed(list(cuts)):
+            found = index.get(cut.id)
+            assert found.custom.items() <= cut.custom.items()
+            np.testing.assert_array_equal(found.load_audio(), cut.load_audio())
+        by_url = index.get_by_url(cuts[1].custom["audio_url"])
+        assert by_url.id == cuts[1].id
+        assert index.read_bytes(cuts[0].id)[:4] == b"fLaC"
+
+
+def test_member_names_must_match_cut_ids_exactly(tmp_path) -> None:
+    shar_dir = tmp_path / "shar"
+    write_synthetic_shar(shar_dir, [SyntheticSpec("tone", 16000, 1, 1.0)])
+    cuts_path = shar_dir / "cuts.000000.jsonl.gz"
+    with gzip.open(cuts_path, "rt") as f:
+        cut = json.loads(f.readline())
+    # audio_0000000 is a prefix of the member name audio_00000000.flac
+    cut["id"] = cut["id"][:-1]
+    with gzip.open(cuts_path, "wt") as f:
+        f.write(json.dumps(cut) + "\n")
+
+    with pytest.raises(RuntimeError, match="is not cut"):
+        index_shard(cuts_path, tmp_path / "index.parquet")
@@ -0,0 +1,59 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ccaudio.cli import main
+from ccaudio.extract_url.stats import compute_stats, url_domains
+
+
+def test_url_domains() -> None:
+    urls = pa.array(
+        [
+            "https://www.bbc.co.uk/a.mp3",
+            "http://User@Podcast.Example.COM:8080/x",
+            "not a url",
+            None,
+        ]
+    )
+    assert url_domains(urls, offline=True).to_pylist() == [
+        "bbc.co.uk",
+        "example.com",
+        None,
+        None,
+    ]
+
+
+def test_compute_stats_and_cli(tmp_path, capsys) -> None:
+    for i in range(2):
+        pq.write_table(
+            pa.table(
+                {
+                    "audio_url": [
+                        f"https://cdn{j}.example.jp/{i}.mp3" for j in range(3)
+                    ]
+                    + ["https://a.co.jp/1.mp3"],
+                    "language": ["ja", "ja", "en", None],
+                    "quality": [0.1, 0.99, 0.5, 1.0],
+                    "title": ["x"] * 4,
+                }
+            ),
+            tmp_path / f"{i}.parquet",
+        )
+
+    result = compute_stats([str(tmp_path)], batch_size=3, offline=True)
+    tables = result.tables()
+    assert tables["domain"].to_pydict() == {
+        "domain": ["example.jp", "a.co.jp"],
+        "count": [6, 2],
+        "percent": [75.0, 25.0],
+    }
+    assert tables["language"]["language"].to_pylist() == ["ja", "en"]
+    assert tables["quality"]["count"].to_pylist()[-1] == 4
+    assert "duration" not in tables
+    assert result.summary()["rows"] == 8
+
+    ja = compute_stats([str(tmp_path)], languages=["ja"], offline=True)
+    assert ja.tables()["domain"]["count"].to_pylist() == [4]
+
+    main(["stats", str(tmp_path), "--offline", "--output_dir", str(tmp_path / "out")])
+    assert "example.jp" in capsys.readouterr().out
+    assert (tmp_path / "out" / "domain.csv").exists()
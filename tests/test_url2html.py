@@ -0,0 +1,41 @@
+import pytest
+
+from ccaudio.extract_url.url2html import (
+    PREFILTER_BYTES,
+    is_japanese_html_candidate,
+    is_japanese_html_raw,
+    try_decode,
+)
+
+PADDING = b"<!-- " + b"x" * PREFILTER_BYTES + b" -->"
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b'<!doctype html><html lang="ja"><body>\xe6\x97\xa5</body></html>',
+        b"<html LANG=ja-JP><body></body></html>",
+        b'<html lang="en"><body></body></html>',
+        b"<html><body>no lang</body></html>",
+        '<html lang="ja"><body>日本</body></html>'.encode("shift_jis"),
+        '<html lang="ja"><body>日本</body></html>'.encode("utf-16"),
+        b'<html lang="en">' + PADDING + b"</html>",
+        PADDING + b'<html lang="ja"></html>',
+    ],
+)
+def test_prefilter_never_drops_japanese_pages(raw: bytes) -> None:
+    head = raw[:PREFILTER_BYTES]
+    complete = len(raw) <= PREFILTER_BYTES
+    decoded = try_decode(raw)
+    if decoded is not None and is_japanese_html_raw(decoded):
+        assert is_japanese_html_candidate(head, complete)
+
+
+def test_prefilter_rejects_other_languages() -> None:
+    assert not is_japanese_html_candidate(b'<html lang="en"><body></body>', True)
+    assert not is_japanese_html_candidate(
+        (b'<html lang="en">' + PADDING)[:PREFILTER_BYTES], False
+    )
+    assert is_japanese_html_candidate(
+        b"<html><body></body>", True, "text/html; charset=UTF-16"
+    )
@@ -0,0 +1,146 @@
+import json
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from ccaudio.ccaudio_downloader.ccaudio_downloader import validation
+from ccaudio.ccaudio_downloader.ccaudio_downloader.validation import (
+    AudioValidator,
+    signal_stats,
+)
+
+
+def write(path, audio: np.ndarray, sampling_rate: int) -> str:
+    sf.write(path, audio.T, sampling_rate, format="FLAC")
+    return str(path)
+
+
+@pytest.mark.parametrize("sampling_rate", [16000, 44100])
+def test_signal_stats_levels(tmp_path, sampling_rate) -> None:
+    t = np.arange(sampling_rate * 3) / sampling_rate
+    sine = 0.5 * np.sin(2 * np.pi * 440 * t)
+    stats = signal_stats(write(tmp_path / "sine.flac", sine[None], sampling_rate))
+    assert stats.rms_db == pytest.approx(20 * np.log10(0.5 / np.sqrt(2)), abs=0.5)
+    assert stats.peak_db == pytest.approx(20 * np.log10(0.5), abs=0.5)
+    assert stats.clipping_ratio == 0
+
+    clipped = np.clip(4 * sine, -1, 1)
+    stereo = np.stack([clipped, np.zeros_like(clipped)])
+    stats = signal_stats(write(tmp_path / "clipped.flac", stereo, sampling_rate))
+    assert 0.1 < stats.clipping_ratio < 0.5
+
+
+def test_validator_reasons(tmp_path) -> None:
+    validator = AudioValidator(min_duration=1.0, max_duration=10.0)
+    assert validator.check_size(0, None) == validation.EMPTY
+    assert validator.check_size(900, 1000) == validation.TRUNCATED
+    assert validator.check_size(1000, 1000) is None
+    assert validator.check_size(1200, 1000) is None
+    assert validator.check_size(1000, None) is None
+
+    assert validator.check_duration(0.5) == validation.TOO_SHORT
+    assert validator.check_duration(11.0) == validation.TOO_LONG
+    assert validator.check_duration(5.0) is None
+
+    rng = np.random.default_rng(0)
+    quiet = 1e-4 * rng.standard_normal((1, 16000))
+    stats = signal_stats(write(tmp_path / "quiet.flac", quiet, 16000))
+    assert validator.check_signal(stats) == validation.SILENT
+    loud = np.clip(rng.standard_normal((1, 16000)), -1, 1)
+    stats = signal_stats(write(tmp_path / "loud.flac", loud, 16000))
+    assert validator.check_signal(stats) == validation.CLIPPED
+
+    lenient = AudioValidator(min_rms_db=None, max_clipping_ratio=None)
+    assert not lenient.checks_signal
+    assert lenient.check_signal(stats) is None
+
+
+def test_validator_from_settings() -> None:
+    validator = AudioValidator.from_settings(
+        {"AUDIO_MIN_DURATION": None, "AUDIO_MAX_DURATION": "None"}
+    )
+    assert validator.min_duration is None
+    assert validator.max_duration is None
+    assert validator.check_duration(0.1) is None
+    assert validator.min_rms_db == -60.0
+
+    validator = AudioValidator.from_settings({"AUDIO_MIN_DURATION": "2.5"})
+    assert validator.check_duration(2.0) == validation.TOO_SHORT
+
+
+class StubStats:
+    def __init__(self):
+        self.values = {}
+
+    def inc_value(self, key, count=1):
+        self.values[key] = self.values.get(key, 0) + count
+
+
+def test_pipeline_drops_and_quarantines_rejected_items(tmp_path) -> None:
+    pytest.importorskip("scrapy")
+    pytest.importorskip("pydub")
+    from scrapy.exceptions import DropItem
+
+    from ccaudio.ccaudio_downloader.ccaudio_downloader.pipelines import (
+        LhotseSharPipeline,
+    )
+
+    def flac(audio: np.ndarray) -> bytes:
+        path = write(tmp_path / "tmp.flac", audio[None], 16000)
+        with open(path, "rb") as f:
+            return f.read()
+
+    t = np.arange(16000 * 2) / 16000
+    sine = flac(0.5 * np.sin(2 * np.pi * 440 * t))
+    items = {
+        validation.EMPTY: {"audio_data": b""},
+        validation.TRUNCATED: {"audio_data": sine[:100], "content_length": len(sine)},
+        validation.TOO_SHORT: {"audio_data": flac(np.zeros(8000) + 0.1)},
+        validation.SILENT: {"audio_data": flac(np.zeros(32000))},
+        validation.UNDECODABLE: {"audio_data": b"not audio" * 100},
+    }
+
+    stats = StubStats()
+    quarantine_dir = tmp_path / "quarantine"
+    pipeline = LhotseSharPipeline(
+        output_dir=str(tmp_path / "shar"),
+        quarantine_dir=str(quarantine_dir),
+        stats=stats,
+    )
+    pipeline.open_spider(None)
+    for reason, item in items.items():
+        item.update(audio_url=f"https://a.example/{reason}.flac")
+        item.setdefault("content_type", "audio/flac")
+        with pytest.raises(DropItem, match=reason):
+            pipeline.process_item(item, None)
+    good = {"audio_url": "https://a.example/good.flac", "audio_data": sine}
+    assert pipeline.process_item(good, None) is good
+    pipeline.close_spider(None)
+
+    assert stats.values == {
+        **{f"ccaudio/rejected/{reason}": 1 for reason in items},
+        "ccaudio/saved": 1,
+    }
+    for reason, item in items.items():
+        metadata = [
+            json.loads(path.read_text())
+            for path in (quarantine_dir / reason).glob("*.json")
+        ]
+        assert [m["audio_url"] for m in metadata] == [item["audio_url"]]
+        assert metadata[0]["reason"] == reason
+        audio_files = list((quarantine_dir / reason).glob("*.flac"))
+        assert len(audio_files) == (0 if reason == validation.EMPTY else 1)
+    assert len(list((tmp_path / "shar").glob("cuts.*.jsonl.gz"))) == 1
+
+    # Writer errors are not blamed on the audio
+    def fail(cut):
+        raise OSError("No space left on device")
+
+    pipeline.open_spider(None)
+    pipeline.writer.write = fail
+    with pytest.raises(OSError):
+        pipeline.process_item(dict(good), None)
+    pipeline.close_spider(None)
+    assert stats.values[f"ccaudio/rejected/{validation.UNDECODABLE}"] == 1
+    assert len(list((quarantine_dir / validation.UNDECODABLE).glob("*.json"))) == 1
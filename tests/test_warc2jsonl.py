@@ -0,0 +1,78 @@
+import io
+
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from ccaudio.extract_url import warc_scanner
+from ccaudio.extract_url.jsonl_io import read_jsonl
+from ccaudio.extract_url.rss2audio import RssFeedHandler
+from ccaudio.extract_url.url2html import JapaneseHtmlHandler
+from ccaudio.extract_url.warc2jsonl import process_warc
+
+RECORDS = [
+    (
+        "https://a.example/ja.html",
+        "text/html; charset=utf-8",
+        '<html lang="ja"><body>日本語のページ</body></html>'.encode(),
+    ),
+    (
+        "https://a.example/en.html",
+        "text/html",
+        b'<html lang="en"><body>English page</body></html>',
+    ),
+    (
+        "https://a.example/feed.xml",
+        "application/rss+xml",
+        b"""<rss><channel><language>ja</language><item><title>T</title>
+        <enclosure url="https://a.example/1.mp3"/></item></channel></rss>""",
+    ),
+]
+
+
+def write_warc(path) -> None:
+    with open(path, "wb") as f:
+        writer = WARCWriter(f, gzip=True)
+        for url, content_type, body in RECORDS:
+            headers = StatusAndHeaders(
+                "200 OK", [("Content-Type", content_type)], protocol="HTTP/1.0"
+            )
+            writer.write_record(
+                writer.create_warc_record(
+                    url, "response", payload=io.BytesIO(body), http_headers=headers
+                )
+            )
+
+
+def test_one_read_feeds_every_handler(tmp_path, monkeypatch) -> None:
+    warc_path = str(tmp_path / "test.warc.gz")
+    write_warc(warc_path)
+    opened = []
+    iter_warc_records = warc_scanner.iter_warc_records
+
+    def counting_iter(input_path):
+        opened.append(input_path)
+        return iter_warc_records(input_path)
+
+    monkeypatch.setattr(warc_scanner, "iter_warc_records", counting_iter)
+
+    html_path = str(tmp_path / "html.jsonl.gz")
+    rss_path = str(tmp_path / "rss.jsonl")
+    stats = process_warc(
+        warc_path,
+        [(JapaneseHtmlHandler(), html_path), (RssFeedHandler(), rss_path)],
+    )
+
+    assert opened == [warc_path]
+    assert [page["url"] for page in read_jsonl(html_path)] == [RECORDS[0][0]]
+    entries = list(read_jsonl(rss_path))
+    assert [entry["audio_url"] for entry in entries] == ["https://a.example/1.mp3"]
+    assert entries[0]["page_url"] == RECORDS[2][0]
+
+    html_stats, rss_stats = stats["html"], stats["rss"]
+    assert html_stats["records"] == rss_stats["records"] == 3
+    assert html_stats["html_records"] == 2
+    assert html_stats["written"] == 1
+    # text/html is not a known non-feed type, so the payload head is sniffed
+    assert rss_stats["rejected_by_sniff"] == 2
+    assert rss_stats["feeds"] == 1
+    assert rss_stats["written"] == 1